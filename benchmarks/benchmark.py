@@ -0,0 +1,159 @@
+"""
+Speed and accuracy benchmark on deterministic synthetic scenes.
+
+It measures the throughput of the helpers functions, the end-to-end frames per second of the tracker for every
+object count and resolution, and the tracking accuracy (MOTA, id switches) against the ground truth, so a change
+can be checked for both speed and correctness. With --min-mota it exits with an error when the accuracy drops.
+
+    $ python benchmarks/benchmark.py --objects 1 5 20 --resolutions 640x480 1920x1080 --frames 300
+"""
+
+import argparse
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import color_tracker
+from color_tracker.utils import helpers
+
+import synthetic
+import tracking_metrics
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--objects", nargs="+", type=int, default=[1, 5, 20],
+                        help="Number of objects of the scenes. Default = 1 5 20")
+    parser.add_argument("--resolutions", nargs="+", type=str, default=["640x480", "1280x720", "1920x1080"],
+                        help="Resolutions of the scenes as WIDTHxHEIGHT. Default = 640x480 1280x720 1920x1080")
+    parser.add_argument("--frames", type=int, default=200, help="Number of frames of a scene. Default = 200")
+    parser.add_argument("--speed", type=float, default=4.0, help="Average speed of the objects (px/frame)")
+    parser.add_argument("--radius", type=int, default=15, help="Radius of the objects in pixels")
+    parser.add_argument("--occluders", type=int, default=2, help="Number of occluders. Default = 2")
+    parser.add_argument("--noise", type=float, default=5.0, help="Std of the pixel noise. Default = 5")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--detection-backend", type=str, default="contours")
+    parser.add_argument("--segmentation-backend", type=str, default="hsv")
+    parser.add_argument("--association", type=str, default="dense")
+    parser.add_argument("--skip-helpers", action="store_true", help="Do not benchmark the helpers functions")
+    parser.add_argument("--min-mota", type=float, default=None,
+                        help="Exit with an error if the MOTA of any scene is below this value")
+    return parser.parse_args()
+
+
+def parse_resolution(text: str):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def calls_per_second(func, *args, min_time: float = 0.2, repeat: int = 3) -> float:
+    """
+    Best throughput of the function from a few runs which take at least min_time seconds
+    """
+
+    func(*args)
+    best = 0.0
+    for _ in range(repeat):
+        nb_of_calls = 0
+        start_time = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < min_time:
+            func(*args)
+            nb_of_calls += 1
+            elapsed = time.perf_counter() - start_time
+        best = max(best, nb_of_calls / elapsed)
+    return best
+
+
+def benchmark_helpers(resolutions, object_counts, args):
+    print("\nhelpers (calls/sec)")
+    print("{0:<36} {1:>10} {2:>8} {3:>12}".format("function", "resolution", "objects", "calls/sec"))
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    for width, height in resolutions:
+        for nb_of_objects in object_counts:
+            scene = synthetic.SyntheticScene(nb_of_objects, (width, height), args.speed, args.radius,
+                                             args.occluders, noise=args.noise, seed=args.seed)
+            image = scene.render(0).image
+            lower, upper = scene.hsv_lower_value, scene.hsv_upper_value
+            contours = helpers.find_object_contours(image, lower, upper, kernel)
+            polygon = np.array([[0, 0], [width - 1, height // 10], [width - 1, height - 1], [0, height - 1]],
+                               dtype=np.int32)
+            points = scene.positions(0)
+            moved_points = scene.positions(1)
+            bboxes = np.concatenate([points - args.radius, points + args.radius], axis=1)
+            cost_mtx = helpers.calculate_distance_mtx_from_points(points, moved_points)
+
+            benchmarks = [
+                ("segment_color", helpers.segment_color, (image, lower, upper, kernel)),
+                ("find_object_contours", helpers.find_object_contours, (image, lower, upper, kernel)),
+                ("crop_out_polygon_convex", helpers.crop_out_polygon_convex, (image, polygon)),
+                ("resize_img", helpers.resize_img, (image, width // 2, height // 2)),
+                ("filter_contours_by_area", helpers.filter_contours_by_area, (contours, scene.min_contour_area)),
+                ("sort_contours_by_area", helpers.sort_contours_by_area, (contours,)),
+                ("get_contour_centers", helpers.get_contour_centers, (contours,)),
+                ("get_bbox_for_contours", helpers.get_bbox_for_contours, (contours,)),
+                ("calculate_distance_mtx_from_points", helpers.calculate_distance_mtx_from_points,
+                 (points, moved_points)),
+                ("calculate_iou_mtx", helpers.calculate_iou_mtx, (bboxes, bboxes)),
+                ("solve_assignment", helpers.solve_assignment, (cost_mtx,)),
+            ]
+            for name, func, func_args in benchmarks:
+                print("{0:<36} {1:>10} {2:>8} {3:>12.1f}".format(name, "{0}x{1}".format(width, height),
+                                                                 nb_of_objects, calls_per_second(func, *func_args)))
+
+
+def benchmark_tracking(resolution, nb_of_objects: int, args):
+    scene = synthetic.SyntheticScene(nb_of_objects, resolution, args.speed, args.radius, args.occluders,
+                                     noise=args.noise, seed=args.seed)
+    tracker = color_tracker.ColorTracker(max_nb_of_objects=nb_of_objects, max_nb_of_points=20, debug=False,
+                                         detection_backend=args.detection_backend,
+                                         segmentation_backend=args.segmentation_backend,
+                                         association=args.association)
+    tracker.set_tracking_parameters(scene.hsv_lower_value, scene.hsv_upper_value,
+                                    min_contour_area=scene.min_contour_area,
+                                    kernel=cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5)),
+                                    max_track_point_distance=max(3 * args.speed, args.radius) * 2,
+                                    max_skipped_frames=10)
+    evaluator = tracking_metrics.TrackingAccuracyEvaluator(max_distance=args.radius)
+
+    # Only the tracking is timed, the frames are rendered outside of the measurement
+    tracking_time = 0.0
+    for frame in scene.frames(args.frames):
+        start_time = time.perf_counter()
+        result = tracker.update(frame.image, frame.timestamp)
+        tracking_time += time.perf_counter() - start_time
+        evaluator.update(frame.objects, [track for track in result.tracks if track.skipped_frames == 0])
+
+    return args.frames / tracking_time, tracker.stats, evaluator.result()
+
+
+def main():
+    args = get_args()
+    resolutions = [parse_resolution(text) for text in args.resolutions]
+
+    if not args.skip_helpers:
+        benchmark_helpers(resolutions, args.objects, args)
+
+    print("\nend-to-end tracking")
+    print("{0:>10} {1:>8} {2:>9} {3:>10} {4:>10} {5:>7} {6:>7} {7:>7} {8:>7} {9:>7}".format(
+        "resolution", "objects", "fps", "p50 ms", "p95 ms", "MOTA", "MOTP", "misses", "FP", "IDSW"))
+    failed = False
+    for width, height in resolutions:
+        for nb_of_objects in args.objects:
+            fps, stats, accuracy = benchmark_tracking((width, height), nb_of_objects, args)
+            print("{0:>10} {1:>8} {2:>9.1f} {3:>10.2f} {4:>10.2f} {5:>7.3f} {6:>7.2f} {7:>7} {8:>7} {9:>7}".format(
+                "{0}x{1}".format(width, height), nb_of_objects, fps, stats.latency.p50 * 1e3,
+                stats.latency.p95 * 1e3, accuracy.mota, accuracy.motp, accuracy.nb_misses,
+                accuracy.nb_false_positives, accuracy.nb_id_switches))
+            if args.min_mota is not None and accuracy.mota < args.min_mota:
+                failed = True
+
+    if failed:
+        print("\nThe MOTA of at least one scene is below {0}".format(args.min_mota))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
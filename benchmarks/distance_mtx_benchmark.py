@@ -0,0 +1,68 @@
+"""
+Micro-benchmark of the cost matrix construction (helpers.calculate_distance_mtx)
+It compares the vectorized implementation to the original per-cell Python loop for growing N x M
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+
+from color_tracker.utils import helpers
+from color_tracker.utils.tracker_object import TrackedObject
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--sizes", nargs="+", type=int, default=[10, 50, 100, 250, 500],
+                        help="Number of tracked objects and detections. Default = 10 50 100 250 500")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Number of repeats. Default = 5")
+    parser.add_argument("--metric", default="euclidean", choices=helpers.DISTANCE_METRICS)
+    args = parser.parse_args()
+    return args
+
+
+def loop_distance_mtx(tracked_objects, points):
+    # This is the original implementation which is used as the reference
+    cost_mtx = np.zeros((len(tracked_objects), len(points)))
+    for i, tracked_obj in enumerate(tracked_objects):
+        for j, point in enumerate(points):
+            diff = tracked_obj.last_point - point
+            distance = np.sqrt(diff[0] ** 2 + diff[1] ** 2)
+            cost_mtx[i][j] = distance
+    return cost_mtx
+
+
+def create_tracked_objects(n: int, rng: np.random.RandomState):
+    tracked_objects = []
+    for i in range(n):
+        tracked_obj = TrackedObject(i, 10)
+        point = rng.randint(0, 1920, size=2)
+        tracked_obj.add_point(point)
+        tracked_obj.last_bbox = np.concatenate([point - 5, point + 5])
+        tracked_objects.append(tracked_obj)
+    return tracked_objects
+
+
+def main():
+    args = get_args()
+    rng = np.random.RandomState(42)
+
+    print("{0:>6} {1:>6} {2:>14} {3:>14} {4:>9}".format("N", "M", "loop [ms]", "vectorized [ms]", "speedup"))
+    for n in args.sizes:
+        tracked_objects = create_tracked_objects(n, rng)
+        points = rng.randint(0, 1920, size=(n, 2))
+        targets = np.concatenate([points - 5, points + 5], axis=1) if args.metric == "iou" else points
+
+        vectorized_time = min(timeit.repeat(lambda: helpers.calculate_distance_mtx(tracked_objects, targets,
+                                                                                   args.metric),
+                                            number=1, repeat=args.repeat))
+        loop_time = min(timeit.repeat(lambda: loop_distance_mtx(tracked_objects, points), number=1,
+                                      repeat=args.repeat))
+        print("{0:>6} {1:>6} {2:>14.3f} {3:>14.3f} {4:>8.1f}x".format(n, n, loop_time * 1000,
+                                                                      vectorized_time * 1000,
+                                                                      loop_time / vectorized_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark of the segmentation backends: cvtColor + inRange (HSVSegmenter) and the BGR lookup table (LUTSegmenter)
+It also reports how many pixels differ from the cvtColor + inRange path
+"""
+
+import argparse
+import tempfile
+import time
+import timeit
+
+import cv2
+import numpy as np
+
+from color_tracker.utils import segmentation
+
+# The first one is the default of examples/tracking.py, the others are used for the multi color benchmark
+COLOR_CLASSES = {"pink": [([155, 103, 82], [178, 255, 255])],
+                 "red": [([179, 100, 100], [8, 255, 255])],
+                 "green": [([50, 100, 100], [70, 255, 255])],
+                 "blue": [([110, 100, 100], [130, 255, 255])],
+                 "yellow": [([25, 100, 100], [35, 255, 255])]}
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--resolutions", nargs="+", default=["640x480", "1920x1080", "3840x2160"],
+                        help="Frame resolutions as WxH. Default = 640x480 1920x1080 3840x2160")
+    parser.add_argument("-b", "--bits", nargs="+", type=int, default=[8, 6],
+                        help="Bits per channel of the lookup tables. Default = 8 6")
+    parser.add_argument("-c", "--classes", type=int, default=1, choices=range(1, len(COLOR_CLASSES) + 1),
+                        help="Number of color classes. Default = 1")
+    parser.add_argument("-n", "--repeat", type=int, default=10, help="Number of repeats. Default = 10")
+    args = parser.parse_args()
+    return args
+
+
+def create_frame(width: int, height: int, rng: np.random.RandomState) -> np.ndarray:
+    # Smooth random colors, so there are object-like regions for every color range
+    small = rng.randint(0, 256, size=(max(1, height // 32), max(1, width // 32), 3)).astype(np.uint8)
+    return cv2.resize(small, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+def main():
+    args = get_args()
+    rng = np.random.RandomState(42)
+    color_classes = segmentation.create_color_classes(dict(list(COLOR_CLASSES.items())[:args.classes]))
+    hsv_segmenter = segmentation.HSVSegmenter(color_classes)
+
+    lut_segmenters = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for bits in args.bits:
+            start = time.perf_counter()
+            segmentation.LUTSegmenter(color_classes, bits_per_channel=bits, cache_dir=cache_dir)
+            build_time = time.perf_counter() - start
+            start = time.perf_counter()
+            lut_segmenters[bits] = segmentation.LUTSegmenter(color_classes, bits_per_channel=bits,
+                                                             cache_dir=cache_dir)
+            load_time = time.perf_counter() - start
+            print("LUT {0} bits: {1} KB, build {2:.1f} ms, load from cache {3:.1f} ms".format(
+                bits, lut_segmenters[bits].lut.nbytes // 1024, build_time * 1000, load_time * 1000))
+
+    print("{0:>10} {1:>12} {2:>10} {3:>10} {4:>14}".format("resolution", "backend", "time [ms]", "speedup",
+                                                            "different [%]"))
+    for resolution in args.resolutions:
+        width, height = map(int, resolution.split("x"))
+        frame = create_frame(width, height, rng)
+
+        reference_masks = hsv_segmenter.segment(frame)
+        hsv_time = min(timeit.repeat(lambda: hsv_segmenter.segment(frame), number=1, repeat=args.repeat))
+        print("{0:>10} {1:>12} {2:>10.2f} {3:>10} {4:>14}".format(resolution, "hsv", hsv_time * 1000, "", ""))
+
+        for bits, lut_segmenter in lut_segmenters.items():
+            masks = lut_segmenter.segment(frame)
+            different = sum(np.count_nonzero(m != r) for m, r in zip(masks, reference_masks)) / frame[..., 0].size * 100
+            lut_time = min(timeit.repeat(lambda: lut_segmenter.segment(frame), number=1, repeat=args.repeat))
+            print("{0:>10} {1:>12} {2:>10.2f} {3:>9.2f}x {4:>14.3f}".format(resolution, "lut {0} bits".format(bits),
+                                                                            lut_time * 1000, hsv_time / lut_time,
+                                                                            different))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+from typing import Iterator, List, NamedTuple, Tuple
+
+import cv2
+import numpy as np
+
+# Green blobs on a gray background, they are segmented by the HSV range of the scene
+BLOB_COLOR_BGR = (40, 220, 40)
+BLOB_HSV_LOWER_VALUE = (50, 100, 100)
+BLOB_HSV_UPPER_VALUE = (70, 255, 255)
+BACKGROUND_COLOR_BGR = (90, 90, 90)
+OCCLUDER_COLOR_BGR = (160, 160, 160)
+
+
+class GroundTruthObject(NamedTuple):
+    """
+    Position of an object of a synthetic scene in a frame
+    """
+
+    id: int
+    point: Tuple[float, float]
+    bbox: Tuple[int, int, int, int]
+    # Fraction of the area of the object which is not covered by the occluders
+    visibility: float
+
+    @property
+    def is_visible(self) -> bool:
+        return self.visibility >= 0.5
+
+
+class SyntheticFrame(NamedTuple):
+    """
+    Rendered frame of a synthetic scene with the ground truth of the objects
+    """
+
+    index: int
+    timestamp: float
+    image: np.ndarray
+    objects: Tuple[GroundTruthObject, ...]
+
+
+class SyntheticScene(object):
+    """
+    Deterministic scene of colored blobs which move with constant velocity and bounce off the borders of the frame.
+    Static rectangles occlude the blobs and gaussian noise can be added to the frames. The same parameters and seed
+    always give the same frames, so the scene can be used to compare the speed and the accuracy of the tracking
+    between versions
+    """
+
+    def __init__(self, nb_of_objects: int = 5, resolution: Tuple[int, int] = (640, 480), speed: float = 4.0,
+                 radius: int = 15, nb_of_occluders: int = 0, occluder_size: float = 0.15, noise: float = 0.0,
+                 fps: float = 30.0, seed: int = 0):
+        """
+        :param nb_of_objects: number of blobs
+        :param resolution: (width, height) of the frames
+        :param speed: average speed of the blobs in pixels per frame (every blob gets a speed between 0.5x and 1.5x)
+        :param radius: radius of the blobs in pixels
+        :param nb_of_occluders: number of static rectangles which hide the blobs
+        :param occluder_size: size of an occluder relative to the smaller side of the frame
+        :param noise: standard deviation of the gaussian noise of the pixels
+        :param fps: frame rate, it gives the timestamps of the frames
+        :param seed: seed of the random generator
+        """
+
+        self._nb_of_objects = nb_of_objects
+        self._width, self._height = resolution
+        self._speed = speed
+        self._radius = radius
+        self._noise = noise
+        self._fps = fps
+        self._seed = seed
+
+        rng = np.random.default_rng(seed)
+        margin = radius + 1
+        self._start_points = np.stack([rng.uniform(margin, self._width - margin, nb_of_objects),
+                                       rng.uniform(margin, self._height - margin, nb_of_objects)], axis=1)
+        angles = rng.uniform(0, 2 * np.pi, nb_of_objects)
+        speeds = speed * rng.uniform(0.5, 1.5, nb_of_objects)
+        self._velocities = np.stack([np.cos(angles), np.sin(angles)], axis=1) * speeds[:, None]
+
+        side = int(min(self._width, self._height) * occluder_size)
+        self._occluders = []
+        for _ in range(nb_of_occluders):
+            x = int(rng.integers(0, max(self._width - side, 1)))
+            y = int(rng.integers(0, max(self._height - side, 1)))
+            self._occluders.append((x, y, x + side, y + side))
+
+        self._background = np.empty((self._height, self._width, 3), dtype=np.uint8)
+        self._background[:] = BACKGROUND_COLOR_BGR
+        self._occluder_mask = np.zeros((self._height, self._width), dtype=bool)
+        for x1, y1, x2, y2 in self._occluders:
+            self._occluder_mask[y1:y2, x1:x2] = True
+
+    @property
+    def resolution(self) -> Tuple[int, int]:
+        return self._width, self._height
+
+    @property
+    def hsv_lower_value(self) -> Tuple[int, int, int]:
+        return BLOB_HSV_LOWER_VALUE
+
+    @property
+    def hsv_upper_value(self) -> Tuple[int, int, int]:
+        return BLOB_HSV_UPPER_VALUE
+
+    @property
+    def min_contour_area(self) -> float:
+        """
+        Area which separates the blobs from the noise
+        """
+
+        return 0.25 * np.pi * self._radius ** 2
+
+    def positions(self, frame_index: int) -> np.ndarray:
+        """
+        :return: (N, 2) centers of the blobs in the frame. The blobs bounce off the borders of the frame
+        """
+
+        low = np.array([self._radius, self._radius], dtype=np.float64)
+        high = np.array([self._width - 1 - self._radius, self._height - 1 - self._radius], dtype=np.float64)
+        span = np.maximum(high - low, 1e-9)
+        # Reflection on the borders is a triangle wave of the unbounded position
+        unbounded = self._start_points + self._velocities * frame_index - low
+        folded = np.mod(unbounded, 2 * span)
+        return low + np.where(folded > span, 2 * span - folded, folded)
+
+    def _visibility(self, center: np.ndarray) -> Tuple[Tuple[int, int, int, int], float]:
+        r = self._radius
+        x1, y1 = int(np.floor(center[0] - r)), int(np.floor(center[1] - r))
+        x2, y2 = int(np.ceil(center[0] + r)) + 1, int(np.ceil(center[1] + r)) + 1
+        ys, xs = np.mgrid[y1:y2, x1:x2]
+        disk = (xs - center[0]) ** 2 + (ys - center[1]) ** 2 <= r ** 2
+        occluded = self._occluder_mask[np.clip(ys, 0, self._height - 1), np.clip(xs, 0, self._width - 1)]
+        nb_of_pixels = disk.sum()
+        visibility = float((disk & ~occluded).sum() / nb_of_pixels) if nb_of_pixels > 0 else 0.0
+        return (x1, y1, x2, y2), visibility
+
+    def render(self, frame_index: int) -> SyntheticFrame:
+        """
+        Renders a frame of the scene. The result depends only on the frame index and the parameters of the scene
+        """
+
+        image = self._background.copy()
+        objects: List[GroundTruthObject] = []
+        for object_id, center in enumerate(self.positions(frame_index)):
+            cv2.circle(image, (int(round(center[0])), int(round(center[1]))), self._radius, BLOB_COLOR_BGR, -1)
+            bbox, visibility = self._visibility(center)
+            objects.append(GroundTruthObject(object_id, (float(center[0]), float(center[1])), bbox, visibility))
+        for x1, y1, x2, y2 in self._occluders:
+            cv2.rectangle(image, (x1, y1), (x2 - 1, y2 - 1), OCCLUDER_COLOR_BGR, -1)
+
+        if self._noise > 0:
+            rng = np.random.default_rng((self._seed, frame_index))
+            noisy = image.astype(np.float32) + rng.normal(0, self._noise, image.shape).astype(np.float32)
+            image = np.clip(noisy, 0, 255).astype(np.uint8)
+        return SyntheticFrame(frame_index, frame_index / self._fps, image, tuple(objects))
+
+    def frames(self, nb_of_frames: int) -> Iterator[SyntheticFrame]:
+        """
+        :param nb_of_frames: number of frames
+        :return: iterator of the rendered frames
+        """
+
+        for frame_index in range(nb_of_frames):
+            yield self.render(frame_index)
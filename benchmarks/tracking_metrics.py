@@ -0,0 +1,112 @@
+from typing import Dict, NamedTuple, Sequence
+
+import numpy as np
+
+from color_tracker.utils import helpers
+from synthetic import GroundTruthObject
+
+
+class TrackingAccuracy(NamedTuple):
+    """
+    CLEAR MOT metrics of a tracking run
+    """
+
+    nb_frames: int
+    nb_ground_truth: int
+    nb_matches: int
+    nb_misses: int
+    nb_false_positives: int
+    nb_id_switches: int
+    # 1 - (misses + false positives + id switches) / ground truth objects
+    mota: float
+    # Mean distance of the matched track points from the ground truth in pixels
+    motp: float
+    precision: float
+    recall: float
+
+
+class TrackingAccuracyEvaluator(object):
+    """
+    Matches the tracks to the ground truth objects frame by frame (CLEAR MOT). A match of the previous frame is kept
+    while the distance is small enough, the rest is matched with the Hungarian algorithm. An id switch is counted when
+    a ground truth object is matched to another track than the last time it was matched.
+    Only the visible ground truth objects are counted
+    """
+
+    def __init__(self, max_distance: float = 20.0):
+        """
+        :param max_distance: a track point farther than this (in pixels) does not match a ground truth object
+        """
+
+        self._max_distance = max_distance
+        self._last_matches: Dict[int, int] = {}
+        self._last_matched_track: Dict[int, int] = {}
+        self._nb_frames = 0
+        self._nb_ground_truth = 0
+        self._nb_matches = 0
+        self._nb_misses = 0
+        self._nb_false_positives = 0
+        self._nb_id_switches = 0
+        self._total_distance = 0.0
+
+    def update(self, ground_truth: Sequence[GroundTruthObject], tracks: Sequence):
+        """
+        Evaluates a frame
+        :param ground_truth: objects of the frame (e.g. SyntheticFrame.objects)
+        :param tracks: tracks of the frame with id and point (e.g. TrackingResult.tracks), only the tracks which
+        were matched to a detection in this frame (skipped_frames == 0) should be given
+        """
+
+        ground_truth = [obj for obj in ground_truth if obj.is_visible]
+        gt_ids = [obj.id for obj in ground_truth]
+        track_ids = [track.id for track in tracks]
+        distances = helpers.calculate_distance_mtx_from_points([obj.point for obj in ground_truth],
+                                                               [track.point for track in tracks])
+
+        matches = {}
+        # The matches of the previous frame are kept while they are close enough
+        track_indices = {track_id: j for j, track_id in enumerate(track_ids)}
+        for i, gt_id in enumerate(gt_ids):
+            j = track_indices.get(self._last_matches.get(gt_id))
+            if j is not None and distances[i, j] <= self._max_distance:
+                matches[i] = j
+
+        free_rows = [i for i in range(len(gt_ids)) if i not in matches]
+        used_columns = set(matches.values())
+        free_columns = [j for j in range(len(track_ids)) if j not in used_columns]
+        if free_rows and free_columns:
+            cost_mtx = distances[np.ix_(free_rows, free_columns)]
+            # Pairs which are too far can not be matched
+            cost_mtx = np.where(cost_mtx > self._max_distance, 1e6, cost_mtx)
+            for row, column in enumerate(helpers.solve_assignment(cost_mtx)):
+                if column != -1 and cost_mtx[row, column] <= self._max_distance:
+                    matches[free_rows[row]] = free_columns[column]
+
+        for i, j in matches.items():
+            gt_id, track_id = gt_ids[i], track_ids[j]
+            if gt_id in self._last_matched_track and self._last_matched_track[gt_id] != track_id:
+                self._nb_id_switches += 1
+            self._last_matched_track[gt_id] = track_id
+            self._total_distance += distances[i, j]
+        self._last_matches = {gt_ids[i]: track_ids[j] for i, j in matches.items()}
+
+        self._nb_frames += 1
+        self._nb_ground_truth += len(gt_ids)
+        self._nb_matches += len(matches)
+        self._nb_misses += len(gt_ids) - len(matches)
+        self._nb_false_positives += len(track_ids) - len(matches)
+
+    def result(self) -> TrackingAccuracy:
+        nb_ground_truth = max(self._nb_ground_truth, 1)
+        nb_errors = self._nb_misses + self._nb_false_positives + self._nb_id_switches
+        nb_tracks = self._nb_matches + self._nb_false_positives
+        return TrackingAccuracy(nb_frames=self._nb_frames,
+                                nb_ground_truth=self._nb_ground_truth,
+                                nb_matches=self._nb_matches,
+                                nb_misses=self._nb_misses,
+                                nb_false_positives=self._nb_false_positives,
+                                nb_id_switches=self._nb_id_switches,
+                                mota=1.0 - nb_errors / nb_ground_truth,
+                                motp=self._total_distance / self._nb_matches if self._nb_matches > 0 else np.nan,
+                                precision=self._nb_matches / nb_tracks if nb_tracks > 0 else np.nan,
+                                recall=self._nb_matches / nb_ground_truth)
@@ -11,9 +11,11 @@
 *****************************************************
 """
 
+from .tracker.multi_stream import MultiStreamTracker
+from .tracker.recorder import Recorder
 from .tracker.tracker import ColorTracker
 from .utils import HSVColorRangeDetector
-from .utils.camera import WebCamera
+from .utils.camera import SharedFrameRing, WebCamera
 
 __author__ = "Gabor Vecsei"
 __version__ = "0.1.1"
@@ -1 +1,3 @@
 from .tracker import ColorTracker
+from .multi_stream import MultiStreamTracker, StreamStats
+from .recorder import Recorder, RecorderStats
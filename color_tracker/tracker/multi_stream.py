@@ -0,0 +1,312 @@
+import collections
+import concurrent.futures
+import os
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from color_tracker.tracker.tracker import ColorTracker
+from color_tracker.tracker.tracking_result import TrackingResult
+from color_tracker.utils.camera import Camera, Frame, SharedFrameRing
+
+SCHEDULING_POLICIES = ("round_robin", "deadline")
+
+
+class StreamStats(NamedTuple):
+    """
+    Statistics of a stream of the MultiStreamTracker
+    """
+
+    name: str
+    nb_processed: int
+    nb_dropped: int
+    # Processed frames per second over the last frames
+    fps: float
+    # Seconds between the capture and the end of the processing of the last frame
+    lag: float
+    mean_lag: float
+    # Ratio of the captured frames which were never processed
+    drop_rate: float
+    is_running: bool
+    error: Optional[BaseException] = None
+
+
+class _Stream(object):
+    def __init__(self, name: str, source, tracker: ColorTracker, horizontal_flip: bool, max_latency: float,
+                 result_callback: Callable[[str, TrackingResult], None], fps_window: int):
+        self.name = name
+        self.source = source
+        self.tracker = tracker
+        self.horizontal_flip = horizontal_flip
+        self.max_latency = max_latency
+        self.result_callback = result_callback
+
+        # The frame buffer which wakes up the scheduler when a frame arrives (the camera replaces its buffer when
+        # it is restarted)
+        self.frame_buffer = None
+        self.wake_up = None
+
+        # Frame which was read from the source and waits for a worker
+        self.ready_frame = None
+        self.is_busy = False
+        self.is_running = True
+        self.error = None
+
+        self.last_sequence = 0
+        self.nb_processed = 0
+        self.nb_dropped = 0
+        self.lag = 0.0
+        self.total_lag = 0.0
+        self.completion_times = collections.deque(maxlen=fps_window)
+
+    @property
+    def deadline(self) -> float:
+        return self.ready_frame.timestamp + self.max_latency
+
+    @property
+    def can_notify(self) -> bool:
+        # Only the frame buffer of a Camera calls listeners, the frame rings are polled
+        return isinstance(self.source, Camera) and self.source.frame_ring is None
+
+    def listen(self, wake_up: threading.Event):
+        # Registers the wake up event at the current frame buffer of the camera
+        if not self.can_notify or self.source.frame_buffer is self.frame_buffer:
+            return
+        self.unlisten()
+        self.frame_buffer = self.source.frame_buffer
+        self.wake_up = wake_up
+        self.frame_buffer.add_listener(self.wake_up.set)
+
+    def unlisten(self):
+        if self.frame_buffer is not None:
+            self.frame_buffer.remove_listener(self.wake_up.set)
+            self.frame_buffer = None
+
+    def is_feed_closed(self) -> bool:
+        if isinstance(self.source, Camera):
+            frame_ring = self.source.frame_ring
+            return frame_ring.is_closed if frame_ring is not None else self.source.frame_buffer.is_closed
+        return self.source.is_closed
+
+    def poll(self):
+        # Reads the next frame without blocking
+        frame = self.source.read_frame(wait_new=True, timeout=0)
+        if frame is None:
+            if self.is_feed_closed():
+                self.is_running = False
+            return
+        # The frames which were dropped by the buffer of the source are the gaps between the sequence numbers
+        self.nb_dropped += max(frame.sequence - self.last_sequence - 1, 0)
+        self.last_sequence = frame.sequence
+        self.ready_frame = frame
+
+    def stats(self) -> StreamStats:
+        fps = 0.0
+        if len(self.completion_times) > 1:
+            elapsed = self.completion_times[-1] - self.completion_times[0]
+            fps = (len(self.completion_times) - 1) / elapsed if elapsed > 0 else 0.0
+        mean_lag = self.total_lag / self.nb_processed if self.nb_processed > 0 else 0.0
+        nb_frames = self.nb_processed + self.nb_dropped
+        drop_rate = self.nb_dropped / nb_frames if nb_frames > 0 else 0.0
+        return StreamStats(self.name, self.nb_processed, self.nb_dropped, fps, self.lag, mean_lag, drop_rate,
+                           self.is_running, self.error)
+
+
+class MultiStreamTracker(object):
+    """
+    Tracks several streams in one process with a fixed number of worker threads.
+    Every stream has its own tracker (so its own tracking state) and at most one of its frames is processed at a
+    time, so the frames of a stream are processed in order. The scheduler reads the next frame of every idle
+    stream without blocking and gives the waiting frames to the free workers:
+        - "round_robin": the streams get a worker one after the other
+        - "deadline": the frame with the earliest deadline (capture time + max latency of the stream) goes first
+    The frames are dropped by the buffer of the sources (e.g. a camera with the "latest" buffer policy keeps only
+    the newest frame, so a slow stream does not build up lag).
+    The sources are Camera objects (which capture on their own threads) or SharedFrameRing readers. The frame
+    buffer of a Camera wakes up the scheduler when a frame arrives, the frame rings are polled
+    """
+
+    def __init__(self, nb_workers: int = None, scheduling: str = "round_robin", poll_interval: float = 0.002,
+                 fps_window: int = 30):
+        """
+        :param nb_workers: number of worker threads, None means the number of CPUs
+        :param scheduling: the scheduling policy, "round_robin" or "deadline"
+        :param poll_interval: the scheduler checks the frame rings (which can not wake it up) after this many seconds
+        when there is no new frame
+        :param fps_window: the fps of the streams is measured over this many frames
+        """
+
+        if scheduling not in SCHEDULING_POLICIES:
+            raise ValueError("Unknown scheduling policy: {0}, use one of {1}".format(scheduling,
+                                                                                    SCHEDULING_POLICIES))
+        self._nb_workers = nb_workers if nb_workers is not None else (os.cpu_count() or 1)
+        if self._nb_workers < 1:
+            raise ValueError("There should be at least 1 worker")
+        self._scheduling = scheduling
+        self._poll_interval = poll_interval
+        self._fps_window = fps_window
+
+        self._streams = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._wake_up = threading.Event()
+        self._next_stream_index = 0
+        self._nb_busy_workers = 0
+        self._is_running = False
+
+    @property
+    def nb_workers(self) -> int:
+        return self._nb_workers
+
+    @property
+    def stream_names(self):
+        with self._lock:
+            return list(self._streams.keys())
+
+    def add_stream(self, name: str, source, tracker: ColorTracker, horizontal_flip: bool = False,
+                   max_latency: float = 0.0, result_callback: Callable[[str, TrackingResult], None] = None):
+        """
+        Adds a stream, it can be called while the tracker is running
+        :param name: unique name of the stream
+        :param source: Camera or SharedFrameRing which provides the frames
+        :param tracker: tracker of the stream, its tracking parameters should be set already. The tracking
+        callback of the tracker is called after every frame (on a worker thread), stop_tracking() removes the stream
+        :param horizontal_flip: Flip the frames horizontally
+        :param max_latency: latency budget of the stream in seconds, it is used by the "deadline" scheduling
+        :param result_callback: called with the name of the stream and the result after every frame
+        """
+
+        if not isinstance(source, (Camera, SharedFrameRing)):
+            raise ValueError("The source should be a Camera or a SharedFrameRing")
+        with self._lock:
+            if name in self._streams and self._streams[name].is_running:
+                raise ValueError("There is already a stream with the name: {0}".format(name))
+            tracker.start_tracking()
+            stream = _Stream(name, source, tracker, horizontal_flip, max_latency, result_callback, self._fps_window)
+            stream.listen(self._wake_up)
+            self._streams[name] = stream
+        self._wake_up.set()
+
+    def remove_stream(self, name: str):
+        """
+        Stops the stream, the frame which is being processed is finished
+        """
+
+        with self._lock:
+            stream = self._streams.pop(name)
+            stream.is_running = False
+            stream.unlisten()
+        self._wake_up.set()
+
+    def stats(self) -> Dict[str, StreamStats]:
+        """
+        :return: statistics of every stream
+        """
+
+        with self._lock:
+            return {name: stream.stats() for name, stream in self._streams.items()}
+
+    def stop(self):
+        """
+        Stops the run() loop after the frames in progress
+        """
+
+        self._is_running = False
+        self._wake_up.set()
+
+    def _process_frame(self, stream: _Stream, frame: Frame):
+        result = stream.tracker.process_frame(frame, stream.horizontal_flip)
+        if stream.result_callback is not None:
+            stream.result_callback(stream.name, result)
+
+    def _finish_frame(self, stream: _Stream, frame: Frame, future: concurrent.futures.Future):
+        with self._lock:
+            error = future.exception()
+            if error is not None:
+                stream.error = error
+                stream.is_running = False
+            else:
+                now = time.time()
+                stream.nb_processed += 1
+                stream.lag = now - frame.timestamp
+                stream.total_lag += stream.lag
+                stream.completion_times.append(now)
+                if not stream.tracker.is_running:
+                    stream.is_running = False
+            stream.is_busy = False
+            self._nb_busy_workers -= 1
+        self._wake_up.set()
+
+    def _next_ready_stream(self, streams) -> Optional[_Stream]:
+        ready_streams = [stream for stream in streams if stream.ready_frame is not None]
+        if not ready_streams:
+            return None
+        if self._scheduling == "deadline":
+            return min(ready_streams, key=lambda stream: stream.deadline)
+        # The stream after the previously scheduled one in the order of the streams
+        for i in range(len(streams)):
+            stream = streams[(self._next_stream_index + i) % len(streams)]
+            if stream.ready_frame is not None:
+                self._next_stream_index = (streams.index(stream) + 1) % len(streams)
+                return stream
+
+    def _schedule(self, executor: concurrent.futures.Executor) -> Tuple[bool, bool]:
+        # Reads the new frames and dispatches them to the free workers.
+        # Returns whether there is a running stream and whether every stream wakes up the scheduler
+        with self._lock:
+            streams = [stream for stream in self._streams.values() if stream.is_running]
+            idle_streams = [stream for stream in streams if not stream.is_busy and stream.ready_frame is None]
+            for stream in streams:
+                stream.listen(self._wake_up)
+            can_notify = all(stream.can_notify for stream in streams)
+        for stream in idle_streams:
+            stream.poll()
+
+        dispatched = []
+        with self._lock:
+            streams = [stream for stream in streams if stream.is_running]
+            while self._nb_busy_workers < self._nb_workers:
+                # Only the idle streams have a ready frame
+                stream = self._next_ready_stream(streams)
+                if stream is None:
+                    break
+                dispatched.append((stream, stream.ready_frame))
+                stream.ready_frame = None
+                stream.is_busy = True
+                self._nb_busy_workers += 1
+            for stream in self._streams.values():
+                if not stream.is_running:
+                    stream.unlisten()
+            has_work = len(streams) > 0 or self._nb_busy_workers > 0
+
+        # Submitted without the lock, because the callback of an already finished future runs on this thread
+        for stream, frame in dispatched:
+            future = executor.submit(self._process_frame, stream, frame)
+            future.add_done_callback(lambda f, s=stream, fr=frame: self._finish_frame(s, fr, f))
+        return has_work, can_notify
+
+    def run(self):
+        """
+        Tracks the streams until stop() is called or every stream ends (end of the feed, stop_tracking() of its
+        tracker or an error of the stream, which is reported in its stats)
+        """
+
+        self._is_running = True
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._nb_workers,
+                                                         thread_name_prefix="color_tracker_stream")
+        try:
+            while self._is_running:
+                # Cleared before the frames are read, so a frame which arrives after the read wakes us up
+                self._wake_up.clear()
+                has_work, can_notify = self._schedule(executor)
+                if not has_work:
+                    break
+                # A new frame of a camera, a finished worker or a change of the streams wakes up the scheduler,
+                # the frame rings are polled
+                self._wake_up.wait(None if can_notify else self._poll_interval)
+        finally:
+            self._is_running = False
+            executor.shutdown(wait=True)
+            with self._lock:
+                for stream in self._streams.values():
+                    stream.unlisten()
+
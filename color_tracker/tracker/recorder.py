@@ -0,0 +1,300 @@
+import atexit
+import collections
+import csv
+import os
+import threading
+import time
+import weakref
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+import imageio
+import numpy as np
+
+from color_tracker.tracker.tracking_result import TrackingResult
+from color_tracker.utils import debug_rendering, visualize
+
+RECORDER_DROP_POLICIES = ("drop_newest", "drop_oldest", "block")
+TRAJECTORY_COLUMNS = ("frame_index", "timestamp", "id", "label", "x", "y", "x1", "y1", "x2", "y2", "skipped_frames")
+
+# The recorders which are not closed yet, their queues are written when the interpreter exits
+_open_recorders = weakref.WeakSet()
+
+
+def _close_open_recorders():
+    for recorder in list(_open_recorders):
+        recorder.close()
+
+
+atexit.register(_close_open_recorders)
+
+
+class RecorderStats(NamedTuple):
+    """
+    Statistics of a Recorder
+    """
+
+    nb_records: int
+    nb_frames: int
+    nb_written_frames: int
+    # The records are only dropped when the writing failed (see error)
+    nb_dropped_records: int
+    nb_dropped_frames: int
+    # Number of records (and frames) which wait in the queue
+    backlog: int
+    frame_backlog: int
+    max_backlog: int
+    # Mean seconds of writing a record with its frame on the worker thread
+    mean_write_time: float
+    error: Optional[BaseException] = None
+
+
+def _default_video_options(video_path: str, fps: float) -> dict:
+    # The GIF writer of imageio takes the duration of a frame (ms) instead of the fps
+    if os.path.splitext(video_path)[1].lower() == ".gif":
+        return {"duration": 1000.0 / fps}
+    return {"fps": fps}
+
+
+class Recorder(object):
+    """
+    Writes the tracking results (trajectories as CSV) and the annotated frames (video with imageio) on a
+    background thread, so the tracking never waits for the encoding or the disk.
+    record() only copies the frame into a bounded queue. When the writing can not keep up:
+        - "drop_newest": the new frame is not recorded
+        - "drop_oldest": the oldest frame in the queue is dropped
+        - "block": record() waits for the worker (nothing is dropped, but the tracking is slowed down)
+    Only the frames are dropped, the records (which are small) are never dropped, so the trajectories stay
+    complete: when the queue of the records is full, record() waits. The dropped frames are missing from the video.
+    A recorder which is not closed is closed (so its queue is written) when the interpreter exits
+    """
+
+    def __init__(self, video_path: str = None, trajectory_path: str = None, fps: float = 30.0,
+                 queue_size: int = 32, max_backlog: int = 10000, drop_policy: str = "drop_newest",
+                 annotate: bool = True, scale: float = 1.0, max_nb_of_points: int = 20,
+                 colors: Sequence[Tuple[int, int, int]] = None, video_options: dict = None):
+        """
+        :param video_path: path of the video, its format is given by the extension (e.g. .mp4 needs the ffmpeg
+        plugin of imageio: pip install imageio[ffmpeg]), None means no video
+        :param trajectory_path: path of the CSV file of the tracks (one row per track per frame), None means no file
+        :param fps: frame rate of the video
+        :param queue_size: maximum number of frames in the queue
+        :param max_backlog: maximum number of records in the queue, record() waits when it is full
+        :param drop_policy: what happens when the queue is full: "drop_newest", "drop_oldest" or "block"
+        :param annotate: draw the tracks (bbox, id, trajectory) on the frames of the video
+        :param scale: the frames are resized with this before they are queued (e.g. 0.5)
+        :param max_nb_of_points: (annotate) number of the last points of the drawn trajectories
+        :param colors: (annotate) colors of the trajectories, a track gets the color of its id
+        :param video_options: keyword arguments of the imageio writer, None means the frame rate only
+        """
+
+        if video_path is None and trajectory_path is None:
+            raise ValueError("There is nothing to record, set the video_path or the trajectory_path")
+        if drop_policy not in RECORDER_DROP_POLICIES:
+            raise ValueError("Unknown drop policy: {0}, use one of {1}".format(drop_policy, RECORDER_DROP_POLICIES))
+        if scale <= 0:
+            raise ValueError("scale should be larger than 0")
+        self._queue_size = max(1, queue_size)
+        self._max_backlog = max(self._queue_size, max_backlog)
+        self._drop_policy = drop_policy
+        self._annotate = annotate
+        self._scale = scale
+        self._max_nb_of_points = max_nb_of_points
+        self._colors = colors or visualize.random_colors(16)
+        self._histories = {}
+
+        self._video_writer = None
+        self._trajectory_file = None
+        self._trajectory_writer = None
+        if video_path is not None:
+            options = video_options if video_options is not None else _default_video_options(video_path, fps)
+            self._video_writer = imageio.get_writer(video_path, mode="I", **options)
+        if trajectory_path is not None:
+            self._trajectory_file = open(trajectory_path, "w", newline="")
+            self._trajectory_writer = csv.writer(self._trajectory_file)
+            self._trajectory_writer.writerow(TRAJECTORY_COLUMNS)
+
+        self._condition = threading.Condition()
+        # Items are [frame or None, result], the frame is removed when it is dropped
+        self._items = collections.deque()
+        self._nb_queued_frames = 0
+        self._is_closed = False
+        self._error = None
+
+        self._nb_records = 0
+        self._nb_frames = 0
+        self._nb_written_records = 0
+        self._nb_written_frames = 0
+        self._nb_dropped_records = 0
+        self._nb_dropped_frames = 0
+        self._max_queued_records = 0
+        self._total_write_time = 0.0
+
+        self._worker = threading.Thread(target=self._run, name="color_tracker_recorder", daemon=True)
+        self._worker.start()
+        _open_recorders.add(self)
+
+    @property
+    def is_closed(self) -> bool:
+        return self._is_closed
+
+    def stats(self) -> RecorderStats:
+        with self._condition:
+            mean_write_time = self._total_write_time / self._nb_written_records if self._nb_written_records else 0.0
+            return RecorderStats(self._nb_records, self._nb_frames, self._nb_written_frames, self._nb_dropped_records,
+                                 self._nb_dropped_frames, len(self._items), self._nb_queued_frames,
+                                 self._max_queued_records, mean_write_time, self._error)
+
+    def _check_error(self):
+        # An error of the worker is raised on the recording thread
+        if self._error is not None:
+            raise self._error
+        if self._is_closed:
+            raise ValueError("The recorder is closed")
+
+    def _drop_oldest_frame(self):
+        for item in self._items:
+            if item[0] is not None:
+                item[0] = None
+                self._nb_queued_frames -= 1
+                self._nb_dropped_frames += 1
+                return
+
+    def _copy_frame(self, frame: np.ndarray) -> np.ndarray:
+        if self._scale == 1:
+            return frame.copy()
+        size = (max(1, int(round(frame.shape[1] * self._scale))), max(1, int(round(frame.shape[0] * self._scale))))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    def record(self, frame: Optional[np.ndarray], result: TrackingResult):
+        """
+        Queues a frame and its tracking result without waiting for the writing (except with the "block" policy)
+        :param frame: the (BGR) frame, it is copied, None records only the tracks
+        :param result: tracking result of the frame
+        """
+
+        with self._condition:
+            self._check_error()
+            self._nb_records += 1
+            keep_frame = frame is not None and self._video_writer is not None
+            if keep_frame:
+                self._nb_frames += 1
+                # The frame is not copied when it would be dropped anyway
+                if self._drop_policy == "drop_newest" and self._nb_queued_frames >= self._queue_size:
+                    keep_frame = False
+                    self._nb_dropped_frames += 1
+
+        image = self._copy_frame(frame) if keep_frame else None
+
+        with self._condition:
+            self._check_error()
+            if self._drop_policy == "block":
+                while self._error is None and (len(self._items) >= self._max_backlog or
+                                               (image is not None and self._nb_queued_frames >= self._queue_size)):
+                    self._condition.wait()
+            else:
+                if image is not None and self._nb_queued_frames >= self._queue_size:
+                    if self._drop_policy == "drop_oldest":
+                        self._drop_oldest_frame()
+                    else:
+                        image = None
+                        self._nb_dropped_frames += 1
+                # The records are not dropped, only their frames
+                while self._error is None and len(self._items) >= self._max_backlog:
+                    self._condition.wait()
+            self._check_error()
+
+            self._items.append([image, result])
+            if image is not None:
+                self._nb_queued_frames += 1
+            self._max_queued_records = max(self._max_queued_records, len(self._items))
+            self._condition.notify_all()
+
+    def _write_trajectories(self, result: TrackingResult):
+        for track in result.tracks:
+            bbox = track.bbox if track.bbox is not None else ("", "", "", "")
+            self._trajectory_writer.writerow((result.frame_index, result.timestamp, track.id, track.label or "",
+                                              track.point[0], track.point[1], *bbox, track.skipped_frames))
+
+    def _update_histories(self, result: TrackingResult):
+        histories = {}
+        for track in result.tracks:
+            history = self._histories.get(track.id)
+            if history is None:
+                history = collections.deque(maxlen=self._max_nb_of_points)
+            if track.skipped_frames == 0:
+                history.append(track.point)
+            histories[track.id] = history
+        # The histories of the removed tracks are dropped
+        self._histories = histories
+
+    def _draw_tracks(self, image: np.ndarray, result: TrackingResult):
+        for track in result.tracks:
+            points = np.array(self._histories[track.id], dtype=np.int32).reshape(-1, 2)
+            bbox = np.array(track.bbox) if track.bbox is not None else None
+            visualize.draw_debug_frame_for_object(image, debug_rendering.TrackSnapshot(track.id, bbox, points),
+                                                  self._colors[track.id % len(self._colors)], self._scale)
+
+    def _write(self, image: Optional[np.ndarray], result: TrackingResult):
+        if self._trajectory_writer is not None:
+            self._write_trajectories(result)
+        if self._annotate:
+            self._update_histories(result)
+        if image is not None:
+            if self._annotate:
+                self._draw_tracks(image, result)
+            if image.ndim == 3:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+            self._video_writer.append_data(image)
+
+    def _run(self):
+        try:
+            while True:
+                with self._condition:
+                    while not self._items and not self._is_closed:
+                        self._condition.wait()
+                    if not self._items:
+                        break
+                    image, result = self._items.popleft()
+                    if image is not None:
+                        self._nb_queued_frames -= 1
+                    self._condition.notify_all()
+
+                start_time = time.perf_counter()
+                self._write(image, result)
+                with self._condition:
+                    self._total_write_time += time.perf_counter() - start_time
+                    self._nb_written_records += 1
+                    if image is not None:
+                        self._nb_written_frames += 1
+        except BaseException as error:
+            with self._condition:
+                self._error = error
+                self._nb_dropped_records += len(self._items)
+                self._nb_dropped_frames += self._nb_queued_frames
+                self._items.clear()
+                self._nb_queued_frames = 0
+                self._condition.notify_all()
+        finally:
+            if self._video_writer is not None:
+                self._video_writer.close()
+            if self._trajectory_file is not None:
+                self._trajectory_file.close()
+
+    def close(self, timeout: float = None):
+        """
+        Writes the records in the queue and closes the files
+        :param timeout: maximum seconds to wait for the writing, None means no limit
+        """
+
+        _open_recorders.discard(self)
+        with self._condition:
+            self._is_closed = True
+            self._condition.notify_all()
+        self._worker.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -1,43 +1,177 @@
+import asyncio
+import collections
+import concurrent.futures
+import os
+import threading
+import time
+import types
 import warnings
-from typing import Union, List, Callable
+from typing import Union, List, Callable, Tuple, Iterator, AsyncIterator, Optional
 
 import cv2
 import numpy as np
 
-from color_tracker.utils import helpers, visualize
-from color_tracker.utils.camera import Camera
+from color_tracker.tracker import recorder as recorder_module
+from color_tracker.tracker import video_worker
+from color_tracker.tracker.tracking_result import TrackingResult, TrackState, read_only_array
+from color_tracker.utils import association as association_methods
+from color_tracker.utils import (debug_rendering, detection, helpers, motion, preprocessing, region_detection,
+                                 segmentation, strip_detection, visualize)
+from color_tracker.utils import instrumentation as instrumentation_module
+from color_tracker.utils.camera import Camera, Frame, SharedFrameRing
+from color_tracker.utils.track_store import TrackStore
 from color_tracker.utils.tracker_object import TrackedObject
 
+DEFAULT_COLOR_CLASS = "default"
+PIPELINE_DROP_POLICIES = ("block", "drop_newest", "drop_oldest")
+
 
 class ColorTracker(object):
     def __init__(self, max_nb_of_objects: int = None,
-                 max_nb_of_points: int = None, debug: bool = True):
+                 max_nb_of_points: int = None, debug: bool = True, detection_backend: str = "contours",
+                 association: str = "dense", segmentation_backend: str = "hsv", lut_bits_per_channel: int = 8,
+                 lut_cache_dir: str = None, coarse_to_fine: bool = False, search_windows: bool = False,
+                 full_scan_interval: int = 10, window_margin: float = 0.5, motion_gating: bool = False,
+                 motion_threshold: float = 10, motion_grid: Tuple[int, int] = (8, 8), pipeline_workers: int = 0,
+                 pipeline_queue_size: int = None, pipeline_drop_policy: str = "block", segmentation_strips: int = 1,
+                 instrumentation: bool = True, stats_window_size: int = 300, debug_fps: float = None,
+                 debug_scale: float = 1.0, debug_render_thread: bool = False):
         """
         :param max_nb_of_points: Maxmimum number of points for storing. If it is set
         to None than it means there is no limit
         :param debug: When it's true than we can see the visualization of the captured points etc...
+        :param detection_backend: "contours" extracts the contours of every object, "connected_components" gets
+        the area, bbox and center of all objects in a single pass and extracts contours only for the kept objects
+        :param association: "dense" solves the assignment on the full tracks x detections cost matrix, "gated" only
+        on the pairs closer than max_track_point_distance, split into independent clusters
+        :param segmentation_backend: "hsv" converts every frame to HSV and thresholds it, "lut" labels the pixels
+        directly from their BGR values with a precomputed lookup table
+        :param lut_bits_per_channel: ("lut" backend) bits per channel of the lookup table, less than 8 gives a
+        smaller but approximate table
+        :param lut_cache_dir: ("lut" backend) directory where the compiled lookup tables are cached
+        :param coarse_to_fine: find the candidate regions of the objects on a downscaled frame (the scale is chosen
+        from min_contour_area) and segment only those regions at full resolution
+        :param search_windows: search the tracked objects only in windows around their predicted positions
+        (constant velocity) and scan the full frame for new objects only every full_scan_interval frames
+        or when a track was lost
+        :param full_scan_interval: (search windows mode) a full frame scan is done at every n-th frame
+        :param window_margin: (search windows mode) the last bbox of a track is inflated by this fraction of its size
+        :param motion_gating: compare a small color thumbnail of every frame to the last processed one. When
+        nothing changed, the previous detections are reused, otherwise only the changed tiles are segmented again.
+        The tracks still get the (reused) detections, so they age the same way as without gating. The cells of the
+        thumbnail are sized from min_contour_area, so the smallest objects are not averaged away
+        :param motion_threshold: (motion gating) a tile is changed when a channel of a thumbnail pixel changed more
+        than this
+        :param motion_grid: (motion gating) number of (rows, columns) of the tiles
+        :param pipeline_workers: when it is larger than 0, track() segments the frames on this many worker threads
+        while the association of the previous frames runs on the calling thread. The results and the callbacks
+        are still delivered in frame order
+        :param pipeline_queue_size: (pipelined mode) maximum number of frames in flight, None means 2 * workers
+        :param pipeline_drop_policy: (pipelined mode) what happens when the queue is full: "block" waits for the
+        oldest frame, "drop_newest" skips the new frame, "drop_oldest" drops the oldest frame which is not
+        segmented yet (or waits when every frame is already segmented)
+        :param segmentation_strips: when it is larger than 1, the full frame segmentation and detection is split
+        into this many horizontal strips which are processed on a thread pool. The objects which are cut by the
+        seams are merged, so the results are the same as with a single strip
+        :param instrumentation: measure the time of the stages of every frame (see stats). The overhead is a
+        few time.perf_counter() calls per frame, False turns it off completely
+        :param stats_window_size: (instrumentation) the statistics are computed from this many last frames
+        :param debug_fps: (debug) the debug frame is drawn only when it is read (debug_frame), at most this many
+        times per second, None means no limit
+        :param debug_scale: (debug) the debug frame is drawn on the frame resized with this (e.g. 0.5)
+        :param debug_render_thread: (debug) draw the debug frame on a separate thread, debug_frame gives the last
+        finished one. The frames which arrive while a frame is drawn are skipped
         """
 
+        # The options are kept, so the worker processes of track_video() can create the same tracker
+        self._options = {name: value for name, value in locals().items() if name not in ("self", "__class__")}
+
         super().__init__()
         self._debug = debug
+        if detection_backend not in detection.DETECTION_BACKENDS:
+            raise ValueError("Unknown detection backend: {0}".format(detection_backend))
+        self._detection_backend = detection_backend
+        if association not in association_methods.ASSOCIATION_METHODS:
+            raise ValueError("Unknown association method: {0}".format(association))
+        self._association = association
+        if segmentation_backend not in segmentation.SEGMENTATION_BACKENDS:
+            raise ValueError("Unknown segmentation backend: {0}".format(segmentation_backend))
+        self._segmentation_backend = segmentation_backend
+        self._lut_bits_per_channel = lut_bits_per_channel
+        self._lut_cache_dir = lut_cache_dir
+        self._coarse_to_fine = coarse_to_fine
+        self._search_windows = search_windows
+        self._full_scan_interval = max(1, full_scan_interval)
+        self._window_margin = window_margin
+        if motion_gating and (coarse_to_fine or search_windows):
+            raise ValueError("motion_gating can not be combined with coarse_to_fine or search_windows")
+        self._change_detector = motion.ChangeDetector(motion_threshold, motion_grid) if motion_gating else None
+        self._cached_masks = None
+        self._mask_buffers = None
+        self._last_detections = None
+        self._nb_motion_skipped_frames = 0
+        self._nb_motion_partial_frames = 0
+        if pipeline_workers > 0 and (motion_gating or search_windows):
+            # These modes depend on the results of the previous frame
+            raise ValueError("pipeline_workers can not be combined with motion_gating or search_windows")
+        if pipeline_drop_policy not in PIPELINE_DROP_POLICIES:
+            raise ValueError("Unknown pipeline drop policy: {0}".format(pipeline_drop_policy))
+        self._pipeline_workers = pipeline_workers
+        self._pipeline_queue_size = max(1, pipeline_queue_size or 2 * pipeline_workers)
+        self._pipeline_drop_policy = pipeline_drop_policy
+        self._nb_pipeline_dropped_frames = 0
+        self._worker_state = threading.local()
+        self._segmentation_strips = segmentation_strips
+        self._strip_executor = None
+        self._strip_executor_lock = threading.Lock()
+        self._instrumentation = instrumentation_module.Instrumentation(stats_window_size) if instrumentation else None
+        self._last_frame_sequence = None
+        self._last_full_scan_index = None
+        self._full_scan_requested = True
+        self._is_full_scan = True
+        self._nb_processed_pixels = 0
         self._max_nb_of_objects = max_nb_of_objects
         self._max_nb_of_points = max_nb_of_points
-        self._debug_colors = visualize.random_colors(max_nb_of_objects)
+        self._debug_renderer = debug_rendering.DebugRenderer(visualize.random_colors(max_nb_of_objects or 16),
+                                                             debug_fps, debug_scale, debug_render_thread)
         self._selection_points = None
+        self._roi = None
         self._is_running = False
         self._frame = None
-        self._debug_frame = None
         self._frame_preprocessor = None
+        self._flip_stage = preprocessing.FlipStage(1)
 
+        self._tracks = TrackStore(max_nb_of_points, capacity=max_nb_of_objects or 16)
         self._tracked_objects = []
+        self._tracked_objects_version = -1
         self._tracked_object_id_count = 0
 
         self._tracking_callback = None
+        self._recorder = None
+
+        self._color_classes = None
+        self._segmenter = None
+        self._min_contour_area = 0
+        self._kernel = None
+        self._max_track_point_distance = 100
+        self._max_skipped_frames = 24
+
+        self._frame_index = 0
+        self._last_result = None
 
     @property
     def tracked_objects(self) -> List[TrackedObject]:
+        # Views are only recreated when a track was added or removed
+        if self._tracked_objects_version != self._tracks.version:
+            self._tracked_objects = [TrackedObject(int(self._tracks.ids[slot]), store=self._tracks, slot=int(slot))
+                                     for slot in self._tracks.live_slots]
+            self._tracked_objects_version = self._tracks.version
         return self._tracked_objects
 
+    @property
+    def track_store(self) -> TrackStore:
+        return self._tracks
+
     @property
     def frame(self):
         return self._frame
@@ -45,13 +179,83 @@ class ColorTracker(object):
     @property
     def debug_frame(self):
         if self._debug:
-            return self._debug_frame
+            # The overlay is drawn here, so it costs nothing when the debug frame is not read
+            start_time = time.perf_counter()
+            debug_frame = self._debug_renderer.debug_frame(self._frame, self.tracked_objects)
+            # Inside the tracking callback the drawing is already measured as a part of the "callback" stage
+            if self._instrumentation is not None and not self._instrumentation.is_measuring_frame:
+                self._instrumentation.add("debug", time.perf_counter() - start_time)
+            return debug_frame
         else:
             warnings.warn("Debugging is not enabled so there is no debug frame")
         return None
 
-    def set_frame_preprocessor(self, preprocessor_func):
-        self._frame_preprocessor = preprocessor_func
+    @property
+    def last_result(self) -> TrackingResult:
+        return self._last_result
+
+    @property
+    def nb_pipeline_dropped_frames(self) -> int:
+        """
+        Number of frames which were dropped by the drop policy of the pipelined mode
+        """
+
+        return self._nb_pipeline_dropped_frames
+
+    @property
+    def nb_motion_skipped_frames(self) -> int:
+        """
+        Number of frames where nothing changed, so the previous detections were reused (motion gating)
+        """
+
+        return self._nb_motion_skipped_frames
+
+    @property
+    def nb_motion_partial_frames(self) -> int:
+        """
+        Number of frames where only the changed tiles were segmented (motion gating)
+        """
+
+        return self._nb_motion_partial_frames
+
+    @property
+    def stats(self) -> Optional[instrumentation_module.TrackerStats]:
+        """
+        Rolling statistics of the last frames: fps, latency percentiles of the frames and of every stage
+        (see instrumentation.STAGES) and the number of dropped frames.
+        None if the instrumentation is turned off or there was no frame yet
+        """
+
+        if self._instrumentation is None:
+            return None
+        return self._instrumentation.stats()
+
+    def set_stats_exporter(self, exporter: Callable[[instrumentation_module.TrackerStats], None],
+                           interval: float = 1.0):
+        """
+        Set a function which exports the statistics (e.g. to a metrics system). It is called on the tracking thread
+        at most once in every interval
+        :param exporter: function which gets the stats, None removes the exporter
+        :param interval: minimum seconds between two exports
+        """
+
+        if self._instrumentation is None:
+            raise ValueError("The instrumentation is turned off, the tracker was created with instrumentation=False")
+        self._instrumentation.set_exporter(exporter, interval)
+
+    def set_frame_preprocessor(self, preprocessor: Union[Callable[[np.ndarray], np.ndarray],
+                                                         List[preprocessing.PreprocessingStage]]):
+        """
+        Set the preprocessing of the frames before the detection
+        :param preprocessor: image -> image function, PreprocessingPipeline or a list of preprocessing stages
+        (e.g. [UndistortStage(...), CropStage(...)]). The stages write into preallocated buffers,
+        so the preprocessed frame is overwritten by the next frame
+        """
+
+        if isinstance(preprocessor, (list, tuple)):
+            preprocessor = preprocessing.PreprocessingPipeline(preprocessor)
+        self._frame_preprocessor = preprocessor
+        self._reset_motion_cache()
 
     def set_court_points(self, court_points):
         """
@@ -61,10 +265,90 @@ class ColorTracker(object):
         """
 
         self._selection_points = court_points
+        if court_points is not None and len(court_points) > 0:
+            # The polygon mask is created only once, the frames are sliced to its bounding rectangle
+            self._roi = helpers.create_polygon_roi(court_points)
+        else:
+            self._roi = None
+        self._reset_motion_cache()
 
     def set_tracking_callback(self, tracking_callback: Callable[["ColorTracker"], None]):
         self._tracking_callback = tracking_callback
 
+    def set_recorder(self, recorder: recorder_module.Recorder):
+        """
+        Set a recorder which gets the frame and the result after every frame. It only queues them, the video and
+        the trajectories are written on its own thread. The recorder is not closed by the tracker
+        :param recorder: the recorder, None removes it
+        """
+
+        self._recorder = recorder
+
+    @property
+    def color_classes(self) -> List[segmentation.ColorClass]:
+        return self._color_classes
+
+    def set_tracking_parameters(self, hsv_lower_value: Union[np.ndarray, List[int]] = None,
+                                hsv_upper_value: Union[np.ndarray, List[int]] = None,
+                                min_contour_area: Union[float, int] = 0, kernel: np.ndarray = None,
+                                max_track_point_distance: int = 100, max_skipped_frames: int = 24,
+                                color_classes: Union[dict, List[segmentation.ColorClass]] = None):
+        """
+        Set the parameters which are used by update() on every frame
+        :param hsv_lower_value: lowest acceptable hsv values
+        :param hsv_upper_value: highest acceptable hsv values
+        :param min_contour_area: minimum contour area for the detection. Below that the detection does not count
+        :param kernel: structuring element to perform morphological operations on the mask image
+        :param max_track_point_distance: maximum distance between tracking points
+        :param max_skipped_frames: An object can be hidden for this many frames, after that it will be counted as a new
+        :param color_classes: instead of a single HSV range, several named colors can be tracked at once.
+        It is a dict of name -> list of (hsv_lower_value, hsv_upper_value) pairs (or a list of ColorClass).
+        When the lower hue is larger than the upper one, the range wraps around (e.g. red: 170 -> 10).
+        The frame is converted only once for all the classes and max_nb_of_objects applies to each class
+        """
+
+        self._tracking_parameters = dict(hsv_lower_value=hsv_lower_value, hsv_upper_value=hsv_upper_value,
+                                         min_contour_area=min_contour_area, kernel=kernel,
+                                         max_track_point_distance=max_track_point_distance,
+                                         max_skipped_frames=max_skipped_frames, color_classes=color_classes)
+
+        if color_classes is None:
+            if hsv_lower_value is None or hsv_upper_value is None:
+                raise ValueError("Either hsv_lower_value and hsv_upper_value or color_classes should be set")
+            color_classes = {DEFAULT_COLOR_CLASS: [(hsv_lower_value, hsv_upper_value)]}
+
+        self._color_classes = segmentation.create_color_classes(color_classes)
+        self._tracks.label_names = tuple(c.name for c in self._color_classes)
+        self._segmenter = segmentation.create_segmenter(self._segmentation_backend, self._color_classes, kernel,
+                                                        lut_bits_per_channel=self._lut_bits_per_channel,
+                                                        lut_cache_dir=self._lut_cache_dir)
+        self._segmenter.set_stage_timer(self._instrumentation)
+        self._min_contour_area = min_contour_area
+        self._kernel = kernel
+        self._max_track_point_distance = max_track_point_distance
+        self._max_skipped_frames = max_skipped_frames
+        if self._change_detector is not None:
+            self._change_detector.set_cell_size(motion.cell_size_for_area(min_contour_area))
+        self._reset_motion_cache()
+
+    def _reset_motion_cache(self):
+        self._cached_masks = None
+        self._last_detections = None
+        if self._change_detector is not None:
+            self._change_detector.reset()
+
+    @property
+    def is_running(self) -> bool:
+        return self._is_running
+
+    def start_tracking(self):
+        """
+        Marks the tracker as running when the frames are fed with process_frame() (track() and the other tracking
+        loops do it themselves), so stop_tracking() can be detected with is_running
+        """
+
+        self._is_running = True
+
     def stop_tracking(self):
         """
         Stop the color tracking
@@ -72,28 +356,509 @@ class ColorTracker(object):
 
         self._is_running = False
 
-    @staticmethod
-    def _read_from_camera(camera, horizontal_flip: bool) -> np.ndarray:
-        ret, frame = camera.read()
+    def close(self):
+        """
+        Stops the tracking and shuts down the threads of the tracker (they are started again when the tracker is
+        used after this call)
+        """
+
+        self.stop_tracking()
+        with self._strip_executor_lock:
+            strip_executor, self._strip_executor = self._strip_executor, None
+        if strip_executor is not None:
+            strip_executor.shutdown(wait=True)
+        self._debug_renderer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _read_from_camera(self, camera, horizontal_flip: bool, reuse_buffer: bool = True):
+        timer = self._instrumentation
+        start_time = timer.begin_frame() if timer is not None else 0.0
+        timestamp = None
+        if isinstance(camera, (Camera, SharedFrameRing)):
+            # Blocks until a new frame arrives, so the same frame is never processed twice
+            captured_frame = camera.read_frame(wait_new=True)
+            ret = captured_frame is not None
+            if ret:
+                frame, timestamp = captured_frame.image, captured_frame.timestamp
+                self._count_dropped_frames(captured_frame.sequence)
+        else:
+            ret, frame = camera.read()
+        if timer is not None:
+            start_time = timer.lap("read", start_time)
 
         if ret:
             if horizontal_flip:
-                frame = cv2.flip(frame, 1)
+                # The frames of the camera are not modified, the flipped frame goes to a reused buffer
+                frame = self._flip_stage.process(frame) if reuse_buffer else cv2.flip(frame, 1)
+                if timer is not None:
+                    timer.lap("preprocess", start_time)
+            elif not reuse_buffer and self._is_frame_ring_source(camera):
+                # The slot of a frame ring is given back (so it can be overwritten) at the next read, but the
+                # frames in flight are still used
+                frame = frame.copy()
         else:
             raise ValueError("There is no camera feed")
 
-        return frame
+        return frame, timestamp
+
+    @staticmethod
+    def _is_frame_ring_source(camera) -> bool:
+        return isinstance(camera, SharedFrameRing) or (isinstance(camera, Camera) and camera.frame_ring is not None)
+
+    def _count_dropped_frames(self, sequence: int):
+        # The frames which were dropped by the buffer of the camera are the gaps between the sequence numbers
+        if self._instrumentation is not None and self._last_frame_sequence is not None:
+            self._instrumentation.add_dropped(max(sequence - self._last_frame_sequence - 1, 0))
+        self._last_frame_sequence = sequence
 
-    def _init_new_tracked_object(self, obj_center):
-        tracked_obj = TrackedObject(self._tracked_object_id_count, self._max_nb_of_points)
-        tracked_obj.add_point(obj_center)
+    def _init_new_tracked_object(self, obj_center, bbox=None, contour=None, timestamp: float = np.nan,
+                                 label: int = 0):
+        self._tracks.add(self._tracked_object_id_count, obj_center, timestamp, bbox, contour, label)
         self._tracked_object_id_count += 1
-        self._tracked_objects.append(tracked_obj)
 
-    def track(self, camera: Union[Camera, cv2.VideoCapture], hsv_lower_value: Union[np.ndarray, List[int]],
-              hsv_upper_value: Union[np.ndarray, List[int]], min_contour_area: Union[float, int] = 0,
+    def _slice_roi(self, frame: np.ndarray):
+        if self._roi is None:
+            return frame, None, 0, 0
+        # Only the bounding rectangle of the polygon is processed (slicing does not copy the frame)
+        (x1, y1, x2, y2), roi_mask = helpers.clip_polygon_roi(frame.shape, self._roi)
+        return frame[y1:y2, x1:x2], roi_mask, x1, y1
+
+    def _segment_frame(self, segmenter, frame: np.ndarray):
+        # Every color class is segmented from the same color conversion
+        if self._coarse_to_fine:
+            # Every thread has its own mask buffers (like its own segmenter)
+            buffers = getattr(self._worker_state, "coarse_to_fine_buffers", None)
+            if buffers is None:
+                buffers = self._worker_state.coarse_to_fine_buffers = region_detection.CoarseToFineBuffers()
+            return region_detection.segment_coarse_to_fine(segmenter, frame, self._min_contour_area, self._kernel,
+                                                           buffers=buffers)
+        return segmenter.segment(frame), frame.shape[0] * frame.shape[1]
+
+    def _detect_on_masks(self, masks: List[np.ndarray], roi_mask: np.ndarray, x1: int, y1: int,
+                         timer: instrumentation_module.Instrumentation = None) -> List[detection.Detections]:
+        start_time = time.perf_counter() if timer is not None else 0.0
+        detections_per_class = []
+        for mask in masks:
+            if roi_mask is not None:
+                cv2.bitwise_and(mask, roi_mask, dst=mask)
+                if timer is not None:
+                    start_time = timer.lap("crop", start_time)
+            detections = detection.detect_objects(mask, backend=self._detection_backend,
+                                                  min_area=self._min_contour_area,
+                                                  max_nb_of_objects=self._max_nb_of_objects)
+            detections_per_class.append(detections.translate(x1, y1))
+            if timer is not None:
+                start_time = timer.lap("contours", start_time)
+        return detections_per_class
+
+    def _detect(self, frame: np.ndarray) -> List[detection.Detections]:
+        # Only this thread records the stages, the worker threads have their own segmenters without a timer
+        timer = self._instrumentation
+        start_time = time.perf_counter() if timer is not None else 0.0
+        frame, roi_mask, x1, y1 = self._slice_roi(frame)
+        if timer is not None:
+            timer.lap("crop", start_time)
+
+        self._is_full_scan = not self._search_windows or self._needs_full_scan()
+        if not self._is_full_scan:
+            masks = self._get_mask_buffers(frame.shape)
+            for mask in masks:
+                mask.fill(0)
+            windows = self._get_search_windows(frame.shape, x1, y1)
+            self._nb_processed_pixels = region_detection.segment_regions(self._segmenter, frame, windows, masks)
+            detections_per_class = self._detect_on_masks(masks, roi_mask, x1, y1, timer)
+        elif self._change_detector is not None:
+            changed_tiles = self._change_detector.detect(frame)
+            if not changed_tiles.any() and self._last_detections is not None:
+                # Static scene, the association still runs on the previous detections
+                self._nb_motion_skipped_frames += 1
+                self._nb_processed_pixels = 0
+                return self._last_detections
+            masks = self._segment_changed_tiles(frame, changed_tiles)
+            detections_per_class = self._detect_on_masks(masks, roi_mask, x1, y1, timer)
+        else:
+            detections_per_class, self._nb_processed_pixels = self._detect_full_frame(self._segmenter, frame,
+                                                                                      roi_mask, x1, y1, timer)
+
+        if self._is_full_scan:
+            self._last_full_scan_index = self._frame_index
+            self._full_scan_requested = False
+
+        self._last_detections = detections_per_class
+        return detections_per_class
+
+    def detect(self, frame: np.ndarray) -> Tuple[List[detection.Detections], int]:
+        """
+        Runs only the preprocessing and the detection on a frame, the tracks are not updated
+        :param frame: BGR image
+        :return: detections of every color class and the number of processed pixels
+        """
+
+        if self._segmenter is None:
+            raise ValueError("Tracking parameters are not set, you should call set_tracking_parameters() first")
+        detections_per_class = self._detect(self._preprocess(frame))
+        return detections_per_class, self._nb_processed_pixels
+
+    def _detect_in_worker(self, frame: np.ndarray):
+        # Runs on the worker threads of the pipelined mode, it does not touch the state of the tracker.
+        # Every thread has its own segmenter, because the segmenters reuse their buffers
+        start_time = time.perf_counter()
+        frame, roi_mask, x1, y1 = self._slice_roi(frame)
+        detections_per_class, nb_of_pixels = self._detect_full_frame(self._get_thread_segmenter(), frame, roi_mask,
+                                                                     x1, y1)
+        return detections_per_class, nb_of_pixels, time.perf_counter() - start_time
+
+    def _get_thread_segmenter(self):
+        source, segmenter = getattr(self._worker_state, "segmenters", (None, None))
+        if source is not self._segmenter:
+            segmenter = self._segmenter.copy()
+            self._worker_state.segmenters = (self._segmenter, segmenter)
+        return segmenter
+
+    def _get_strip_executor(self) -> concurrent.futures.Executor:
+        # update() can be called from several threads (e.g. by a MultiStreamTracker), they share one pool
+        with self._strip_executor_lock:
+            if self._strip_executor is None:
+                self._strip_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self._segmentation_strips, thread_name_prefix="color_tracker_strips")
+            return self._strip_executor
+
+    def _detect_full_frame(self, segmenter, frame: np.ndarray, roi_mask: np.ndarray, x1: int, y1: int,
+                           timer: instrumentation_module.Instrumentation = None):
+        if self._segmentation_strips > 1 and not self._coarse_to_fine:
+            start_time = time.perf_counter() if timer is not None else 0.0
+            kernel_size = 0 if self._kernel is None else max(self._kernel.shape[:2])
+            detections_per_class = strip_detection.detect_objects_in_strips(
+                self._get_thread_segmenter, frame, self._get_strip_executor(), self._segmentation_strips,
+                len(self._color_classes), kernel_size, roi_mask, self._detection_backend, self._min_contour_area,
+                max_nb_of_objects=self._max_nb_of_objects)
+            if timer is not None:
+                timer.lap("detection", start_time)
+            return [d.translate(x1, y1) for d in detections_per_class], frame.shape[0] * frame.shape[1]
+
+        masks, nb_of_pixels = self._segment_frame(segmenter, frame)
+        return self._detect_on_masks(masks, roi_mask, x1, y1, timer), nb_of_pixels
+
+    def _get_mask_buffers(self, shape) -> List[np.ndarray]:
+        # Full frame masks of the tracker which are kept between the frames, the segmenter overwrites its own
+        # masks at every call (also when a region is segmented)
+        h, w = shape[:2]
+        buffers = self._mask_buffers
+        if buffers is None or len(buffers) != len(self._color_classes) or buffers[0].shape != (h, w):
+            buffers = self._mask_buffers = [np.empty((h, w), dtype=np.uint8) for _ in self._color_classes]
+        return buffers
+
+    def _segment_changed_tiles(self, frame: np.ndarray, changed_tiles: np.ndarray) -> List[np.ndarray]:
+        h, w = frame.shape[:2]
+        masks = self._cached_masks
+        kernel_size = 0 if self._kernel is None else max(self._kernel.shape[:2])
+        regions = self._change_detector.tile_regions(frame.shape, changed_tiles)
+        # The regions are padded with the kernel size, so they can cover more pixels than the frame
+        is_full_frame = (masks is None or masks[0].shape != (h, w) or
+                         region_detection.padded_area(regions, kernel_size, w, h) >= h * w)
+        if is_full_frame:
+            masks = self._get_mask_buffers(frame.shape)
+            for mask, segmented_mask in zip(masks, self._segmenter.segment(frame)):
+                np.copyto(mask, segmented_mask)
+            self._nb_processed_pixels = h * w
+        else:
+            # The masks of the unchanged tiles are kept from the previous frames
+            self._nb_processed_pixels = region_detection.segment_regions(self._segmenter, frame, regions, masks,
+                                                                         padding=kernel_size)
+            self._nb_motion_partial_frames += 1
+        self._change_detector.update_reference(changed_tiles)
+        self._cached_masks = masks
+        return masks
+
+    def _needs_full_scan(self) -> bool:
+        return (self._full_scan_requested or len(self._tracks) == 0 or self._last_full_scan_index is None
+                or self._frame_index - self._last_full_scan_index >= self._full_scan_interval)
+
+    def _get_search_windows(self, frame_shape, offset_x: int, offset_y: int) -> List[region_detection.Region]:
+        # Windows around the predicted positions of the tracks in the coordinates of the (sliced) frame
+        live_slots = self._tracks.live_slots
+        live_slots = live_slots[self._tracks.has_bbox[live_slots]]
+        steps = self._tracks.skipped_frames[live_slots][:, None] + 1
+        displacements = self._tracks.velocities(live_slots) * steps
+        bboxes = self._tracks.bboxes[live_slots] + np.tile(displacements, 2)
+        sizes = bboxes[:, 2:] - bboxes[:, :2]
+        kernel_size = 0 if self._kernel is None else max(self._kernel.shape[:2])
+        margins = np.ceil(sizes * self._window_margin).astype(np.int32) + kernel_size + 1
+
+        h, w = frame_shape[:2]
+        windows = [region_detection.clip_region((x1 - mx - offset_x, y1 - my - offset_y,
+                                                 x2 + mx - offset_x, y2 + my - offset_y), w, h)
+                   for (x1, y1, x2, y2), (mx, my) in zip(bboxes.tolist(), margins.tolist())]
+        return region_detection.merge_overlapping_regions(windows)
+
+    def _associate(self, detections_per_class: List[detection.Detections], timestamp: float = np.nan):
+        # The associations are independent for every color class
+        for label, detections in enumerate(detections_per_class):
+            self._associate_class(label, detections, timestamp)
+
+        # Remove tracked object if the object skipped to many frames, so it was not detected
+        self._tracks.prune(self._max_skipped_frames)
+
+    def _associate_class(self, label: int, detections: detection.Detections, timestamp: float):
+        object_centers = detections.centers
+        live_slots = self._tracks.live_slots
+        live_slots = live_slots[self._tracks.labels[live_slots] == label]
+        track_points = self._tracks.last_points(live_slots)
+
+        timer = self._instrumentation
+        start_time = time.perf_counter() if timer is not None else 0.0
+        if self._association == "gated":
+            # Only the pairs closer than the max distance are considered, so there is nothing to refine
+            assignment = np.asarray(association_methods.solve_gated_assignment(track_points, object_centers,
+                                                                               self._max_track_point_distance),
+                                    dtype=np.intp)
+        else:
+            # Constructing cost matrix (matrix with the distances from points to other points)
+            cost_mtx = helpers.calculate_distance_mtx_from_points(track_points, object_centers)
+            if timer is not None:
+                start_time = timer.lap("cost_matrix", start_time)
+
+            # Solve assignment problem
+            assignment = np.full(len(live_slots), -1, dtype=np.intp)
+            if cost_mtx.size > 0:
+                assignment[:] = helpers.solve_assignment(cost_mtx)
+
+            # Refine assignment list
+            matched = assignment != -1
+            too_far = cost_mtx[matched, assignment[matched]] > self._max_track_point_distance
+            assignment[np.flatnonzero(matched)[too_far]] = -1
+
+        matched = assignment != -1
+        if timer is not None:
+            timer.lap("assignment", start_time)
+
+        # Objects without an assigned detection skipped this frame
+        self._tracks.mark_skipped(live_slots[~matched])
+        if not np.all(matched):
+            # The lost objects are searched on the full frame
+            self._full_scan_requested = True
+
+        # Refresh tracked objects (reset "skipped frames" counter and add new object center to the history)
+        matched_slots = live_slots[matched]
+        matched_detections = assignment[matched]
+        self._tracks.update(matched_slots, object_centers[matched_detections], detections.bboxes[matched_detections],
+                            timestamp)
+        for slot, j in zip(matched_slots, matched_detections):
+            # Only the patch of the object is kept, not the label image of the whole frame
+            self._tracks.contours[slot] = detections.detached_contour(j)
+
+        # Check for new objects and initialize them (the tracks which will be removed are not counted)
+        nb_of_tracks = np.count_nonzero(self._tracks.skipped_frames[live_slots] <= self._max_skipped_frames)
+        is_unassigned = np.ones(len(detections), dtype=bool)
+        is_unassigned[matched_detections] = False
+        for i in np.flatnonzero(is_unassigned):
+            if self._max_nb_of_objects is not None and nb_of_tracks >= self._max_nb_of_objects:
+                break
+            self._init_new_tracked_object(object_centers[i], detections.bboxes[i], detections.detached_contour(i),
+                                          timestamp, label)
+            nb_of_tracks += 1
+
+    def _create_result(self, timestamp: float, detections_per_class: List[detection.Detections],
+                       timings: dict) -> TrackingResult:
+        label_names = self._tracks.label_names
+        bboxes = np.concatenate([d.bboxes for d in detections_per_class]) if detections_per_class else []
+        object_centers = np.concatenate([d.centers for d in detections_per_class]) if detections_per_class else []
+        detection_labels = tuple(label_names[label] for label, d in enumerate(detections_per_class)
+                                 for _ in range(len(d)))
+
+        live_slots = self._tracks.live_slots
+        labels = self._tracks.labels[live_slots].tolist()
+        ids = self._tracks.ids[live_slots].tolist()
+        points = self._tracks.last_points(live_slots).tolist()
+        bboxes_of_tracks = self._tracks.bboxes[live_slots].tolist()
+        has_bbox = self._tracks.has_bbox[live_slots].tolist()
+        skipped_frames = self._tracks.skipped_frames[live_slots].tolist()
+
+        tracks = tuple(TrackState(id=ids[i],
+                                  point=tuple(points[i]),
+                                  bbox=tuple(bboxes_of_tracks[i]) if has_bbox[i] else None,
+                                  skipped_frames=skipped_frames[i],
+                                  label=label_names[labels[i]]) for i in range(len(live_slots)))
+
+        return TrackingResult(frame_index=self._frame_index,
+                              timestamp=timestamp,
+                              tracks=tracks,
+                              bboxes=read_only_array(bboxes, np.int32, (-1, 4)),
+                              centers=read_only_array(object_centers, np.int32, (-1, 2)),
+                              timings=types.MappingProxyType(timings),
+                              labels=detection_labels,
+                              processed_pixels=self._nb_processed_pixels,
+                              full_scan=self._is_full_scan)
+
+    def _preprocess(self, frame: np.ndarray, copy_buffers: bool = False) -> np.ndarray:
+        if self._frame_preprocessor is None:
+            return frame
+        frame = self._frame_preprocessor(frame)
+        if copy_buffers and isinstance(self._frame_preprocessor, (preprocessing.PreprocessingPipeline,
+                                                                   preprocessing.PreprocessingStage)):
+            # The stages overwrite their output with the next frame
+            frame = frame.copy()
+        return frame
+
+    def _finish_frame(self, frame: np.ndarray, timestamp: float, detections: List[detection.Detections],
+                      timings: dict) -> TrackingResult:
+        self._frame = frame
+        association_start_time = time.perf_counter()
+        self._associate(detections, timestamp)
+        association_time = time.perf_counter()
+        timings["association"] = association_time - association_start_time
+
+        if self._debug and frame is not None:
+            if self._debug_renderer.is_background:
+                self._debug_renderer.submit(frame, self.tracked_objects)
+                timings["debug"] = time.perf_counter() - association_time
+                if self._instrumentation is not None:
+                    self._instrumentation.add("debug", timings["debug"])
+            else:
+                self._debug_renderer.invalidate()
+
+        timings["total"] = sum(timings.values())
+
+        self._last_result = self._create_result(timestamp, detections, timings)
+        if self._recorder is not None:
+            record_start_time = time.perf_counter()
+            self._recorder.record(frame, self._last_result)
+            if self._instrumentation is not None:
+                self._instrumentation.lap("record", record_start_time)
+        self._frame_index += 1
+        return self._last_result
+
+    def _update(self, frame: np.ndarray, timestamp: float = None) -> TrackingResult:
+        if self._segmenter is None:
+            raise ValueError("Tracking parameters are not set, you should call set_tracking_parameters() first")
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        start_time = time.perf_counter()
+        timer = self._instrumentation
+        if timer is not None:
+            timer.begin_frame(start_time)
+        frame = self._preprocess(frame)
+        if timer is not None and self._frame_preprocessor is not None:
+            timer.lap("preprocess", start_time)
+        detections = self._detect(frame)
+        timings = {"detection": time.perf_counter() - start_time}
+        return self._finish_frame(frame, timestamp, detections, timings)
+
+    def update(self, frame: np.ndarray, timestamp: float = None) -> TrackingResult:
+        """
+        Runs the detection and the association on a single frame which is supplied by the caller.
+        The frame is not copied, so it should not be modified while this call is running
+        :param frame: BGR image
+        :param timestamp: capture time of the frame. If it is None than the current time is used
+        :return: immutable tracking result for this frame
+        """
+
+        result = self._update(frame, timestamp)
+        if self._instrumentation is not None:
+            self._instrumentation.end_frame()
+        return result
+
+    def process_frame(self, frame: Frame, horizontal_flip: bool = False) -> TrackingResult:
+        """
+        Processes a frame of a Camera or a SharedFrameRing the same way as track() does: the frames which were
+        dropped by the source are counted and the tracking callback is called after the frame
+        :param frame: captured frame with its sequence number and timestamp, it is not modified
+        :param horizontal_flip: Flip the frame horizontally (into a reused buffer)
+        :return: immutable tracking result for this frame
+        """
+
+        image = self._flip_stage.process(frame.image) if horizontal_flip else frame.image
+        self._count_dropped_frames(frame.sequence)
+        result = self._update(image, frame.timestamp)
+        self._end_tracked_frame()
+        return result
+
+    def _end_tracked_frame(self):
+        # Calls the tracking callback, the measurement of the frame ends after it
+        timer = self._instrumentation
+        if self._tracking_callback is not None:
+            start_time = time.perf_counter()
+            self._tracking_callback(self)
+            if timer is not None:
+                timer.lap("callback", start_time)
+        if timer is not None:
+            timer.end_frame()
+
+    def _deliver_pipelined_frame(self, pending_frame):
+        frame, timestamp, future = pending_frame
+        detections, self._nb_processed_pixels, detection_time = future.result()
+        if self._instrumentation is not None:
+            self._instrumentation.add("detection", detection_time)
+        self._finish_frame(frame, timestamp, detections, {"detection": detection_time})
+        self._end_tracked_frame()
+
+    def _drop_oldest_pending_frame(self, pending: collections.deque) -> bool:
+        # Only the frames which are not segmented yet can be dropped
+        for i, (_, _, future) in enumerate(pending):
+            if future.cancel():
+                del pending[i]
+                self._nb_pipeline_dropped_frames += 1
+                if self._instrumentation is not None:
+                    self._instrumentation.add_dropped(1)
+                return True
+        return False
+
+    def _track_pipelined(self, camera, horizontal_flip: bool):
+        # The frames are segmented on the worker threads, the association and the callbacks run on this
+        # thread in frame order. pending holds (frame, timestamp, future) of the frames in flight
+        pending = collections.deque()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._pipeline_workers,
+                                                         thread_name_prefix="color_tracker")
+        try:
+            while self._is_running:
+                try:
+                    frame, timestamp = self._read_from_camera(camera, horizontal_flip, reuse_buffer=False)
+                except ValueError:
+                    # The frames in flight are delivered before the end of the feed is reported
+                    while pending and self._is_running:
+                        self._deliver_pipelined_frame(pending.popleft())
+                    raise
+                frame = self._preprocess(frame, copy_buffers=True)
+                if timestamp is None:
+                    timestamp = time.time()
+
+                while pending and pending[0][2].done() and self._is_running:
+                    self._deliver_pipelined_frame(pending.popleft())
+                if not self._is_running:
+                    break
+
+                if len(pending) >= self._pipeline_queue_size:
+                    if self._pipeline_drop_policy == "drop_newest":
+                        self._nb_pipeline_dropped_frames += 1
+                        if self._instrumentation is not None:
+                            self._instrumentation.add_dropped(1)
+                        continue
+                    if self._pipeline_drop_policy == "drop_oldest":
+                        self._drop_oldest_pending_frame(pending)
+                    # Back-pressure: waiting for the oldest frame
+                    while len(pending) >= self._pipeline_queue_size and self._is_running:
+                        self._deliver_pipelined_frame(pending.popleft())
+                    if not self._is_running:
+                        break
+
+                pending.append((frame, timestamp, executor.submit(self._detect_in_worker, frame)))
+        finally:
+            # The frames in flight are not delivered after the tracking was stopped
+            for _, _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def track(self, camera: Union[Camera, cv2.VideoCapture], hsv_lower_value: Union[np.ndarray, List[int]] = None,
+              hsv_upper_value: Union[np.ndarray, List[int]] = None, min_contour_area: Union[float, int] = 0,
               kernel: np.ndarray = None, horizontal_flip: bool = True, max_track_point_distance: int = 100,
-              max_skipped_frames: int = 24):
+              max_skipped_frames: int = 24, color_classes: Union[dict, List[segmentation.ColorClass]] = None):
         """
         With this we can start the tracking with the given parameters
         :param camera: Camera object which parent is a Camera object (like WebCamera)
@@ -104,79 +869,230 @@ class ColorTracker(object):
         :param hsv_upper_value: highest acceptable hsv values
         :param min_contour_area: minimum contour area for the detection. Below that the detection does not count
         :param kernel: structuring element to perform morphological operations on the mask image
+        :param color_classes: several named colors to track instead of a single HSV range
+        (see set_tracking_parameters)
         """
 
+        self.set_tracking_parameters(hsv_lower_value=hsv_lower_value,
+                                     hsv_upper_value=hsv_upper_value,
+                                     min_contour_area=min_contour_area,
+                                     kernel=kernel,
+                                     max_track_point_distance=max_track_point_distance,
+                                     max_skipped_frames=max_skipped_frames,
+                                     color_classes=color_classes)
+
         self._is_running = True
 
+        if self._pipeline_workers > 0:
+            self._track_pipelined(camera, horizontal_flip)
+            return
+
         while True:
-            self._frame = self._read_from_camera(camera, horizontal_flip)
+            frame, timestamp = self._read_from_camera(camera, horizontal_flip)
+            self._update(frame, timestamp)
+            self._end_tracked_frame()
 
-            if self._frame_preprocessor is not None:
-                self._frame = self._frame_preprocessor(self._frame)
+            if not self._is_running:
+                break
 
-            if (self._selection_points is not None) and (len(self._selection_points) > 0):
-                self._frame = helpers.crop_out_polygon_convex(self._frame, self._selection_points)
+    def _update_in_executor(self, frame: np.ndarray, timestamp: float, horizontal_flip: bool) -> TrackingResult:
+        if horizontal_flip:
+            frame = self._flip_stage.process(frame)
+        result = self._update(frame, timestamp)
+        self._end_tracked_frame()
+        return result
 
-            contours = helpers.find_object_contours(image=self._frame,
-                                                    hsv_lower_value=hsv_lower_value,
-                                                    hsv_upper_value=hsv_upper_value,
-                                                    kernel=kernel)
+    @staticmethod
+    async def _run_to_completion(future: asyncio.Future):
+        # The work on the executor can not be interrupted, so a cancellation waits for it to finish
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await asyncio.wait([future])
+            raise
 
-            contours = helpers.filter_contours_by_area(contours, min_contour_area)
-            contours = helpers.sort_contours_by_area(contours)
-            if self._max_nb_of_objects is not None and self._max_nb_of_objects > 0:
-                contours = contours[:self._max_nb_of_objects]
-            bboxes = helpers.get_bbox_for_contours(contours)
-            object_centers = helpers.get_contour_centers(contours)
+    async def _produce_async_results(self, camera, horizontal_flip: bool, executor: concurrent.futures.Executor,
+                                     results: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        try:
+            while self._is_running:
+                if isinstance(camera, Camera):
+                    # Waiting for the frame does not occupy a thread of the executor
+                    captured_frame = await camera.aread_frame(wait_new=True)
+                    if captured_frame is None:
+                        break
+                    frame, timestamp = captured_frame.image, captured_frame.timestamp
+                    self._count_dropped_frames(captured_frame.sequence)
+                else:
+                    ret, frame = await self._run_to_completion(loop.run_in_executor(executor, camera.read))
+                    if not ret:
+                        break
+                    timestamp = None
+                result = await self._run_to_completion(
+                    loop.run_in_executor(executor, self._update_in_executor, frame, timestamp, horizontal_flip))
+                # Back-pressure: the next frame is read when the consumer made room for the result
+                await results.put(result)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await results.put(e)
+            return
+        await results.put(None)
 
-            # Init the list of tracked objects if it's empty
-            if len(self._tracked_objects) == 0:
-                for obj_center in object_centers:
-                    self._init_new_tracked_object(obj_center)
+    async def atrack(self, camera: Union[Camera, cv2.VideoCapture],
+                     hsv_lower_value: Union[np.ndarray, List[int]] = None,
+                     hsv_upper_value: Union[np.ndarray, List[int]] = None, min_contour_area: Union[float, int] = 0,
+                     kernel: np.ndarray = None, horizontal_flip: bool = True, max_track_point_distance: int = 100,
+                     max_skipped_frames: int = 24, color_classes: Union[dict, List[segmentation.ColorClass]] = None,
+                     queue_size: int = 1,
+                     executor: concurrent.futures.Executor = None) -> AsyncIterator[TrackingResult]:
+        """
+        Asynchronous version of track(), the results are iterated with "async for". The waiting for the frames of a
+        Camera happens on the event loop, the reading of other sources and the tracking run on the executor, so the
+        event loop is never blocked. The tracking callback is called on the executor after every frame.
+        The iteration ends at the end of the feed or after stop_tracking(). Leaving the "async for" loop early
+        (break, return or an exception) does not close the generator, Python closes it only when it is garbage
+        collected, so the tracking would go on until then. Use contextlib.aclosing(tracker.atrack(...)) or call
+        aclose() of the iterator to stop it. aclose() (or cancelling the consuming task) waits for the frame which
+        is being processed, so the tracking callback is not called after it returns
+        :param queue_size: number of results which can wait for the consumer. When the queue is full no new frame
+        is read, so the buffer policy of the camera decides which frames are dropped
+        :param executor: executor of the tracking, None means the default executor of the event loop
+        (see track() for the other parameters)
+        :return: asynchronous iterator of the tracking results
+        """
 
-            # Constructing cost matrix (matrix with the distances from points to other points)
-            cost_mtx = helpers.calculate_distance_mtx(self._tracked_objects, object_centers)
+        self.set_tracking_parameters(hsv_lower_value=hsv_lower_value,
+                                     hsv_upper_value=hsv_upper_value,
+                                     min_contour_area=min_contour_area,
+                                     kernel=kernel,
+                                     max_track_point_distance=max_track_point_distance,
+                                     max_skipped_frames=max_skipped_frames,
+                                     color_classes=color_classes)
 
-            # Solve assignment problem
-            assignment = helpers.solve_assignment(cost_mtx)
+        self._is_running = True
+        results = asyncio.Queue(maxsize=max(1, queue_size))
+        producer = asyncio.get_running_loop().create_task(
+            self._produce_async_results(camera, horizontal_flip, executor, results))
+        try:
+            while True:
+                result = await results.get()
+                if result is None:
+                    break
+                if isinstance(result, Exception):
+                    raise result
+                yield result
+        finally:
+            self._is_running = False
+            producer.cancel()
+            try:
+                await producer
+            except asyncio.CancelledError:
+                pass
 
-            # Refine assignment list and objects's skipped frames
-            for i in range(len(assignment)):
-                if assignment[i] != -1:
-                    if cost_mtx[i][assignment[i]] > max_track_point_distance:
-                        assignment[i] = -1
-                else:
-                    self._tracked_objects[i].skipped_frames += 1
-
-            # Remove tracked object if the object skipped to many frames, so it was not detected
-            helpers.remove_object_if_too_many_frames_skipped(self._tracked_objects, assignment, max_skipped_frames)
-
-            # Check for new objects and initialize them
-            un_assigned_detections = [i for i in range(len(object_centers)) if i not in assignment]
-            if len(un_assigned_detections) != 0:
-                if len(self._tracked_objects) < self._max_nb_of_objects:
-                    for i in un_assigned_detections:
-                        self._init_new_tracked_object(object_centers[i])
-
-            # Refresh tracked objects (reset "skipped frames" counter and add new object center to the queue)
-            for i in range(len(assignment)):
-                if assignment[i] != -1:
-                    self._tracked_objects[i].skipped_frames = 0
-                    self._tracked_objects[i].add_point(object_centers[assignment[i]])
-
-                    if len(contours) > i:
-                        self._tracked_objects[i].last_object_contour = contours[i]
-                        self._tracked_objects[i].last_bbox = bboxes[i]
-
-            if self._debug:
-                self._debug_frame = self._frame.copy()
-                for i, tracked_obj in enumerate(self._tracked_objects):
-                    self._debug_frame = visualize.draw_debug_frame_for_object(self._debug_frame,
-                                                                              tracked_obj,
-                                                                              self._debug_colors[i])
-
-            if self._tracking_callback is not None:
-                self._tracking_callback(self)
+    def track_video(self, video_path: str, hsv_lower_value: Union[np.ndarray, List[int]] = None,
+                    hsv_upper_value: Union[np.ndarray, List[int]] = None, min_contour_area: Union[float, int] = 0,
+                    kernel: np.ndarray = None, horizontal_flip: bool = False, max_track_point_distance: int = 100,
+                    max_skipped_frames: int = 24, color_classes: Union[dict, List[segmentation.ColorClass]] = None,
+                    nb_workers: int = None, chunk_size: int = 64) -> Iterator[TrackingResult]:
+        """
+        Tracks the objects on every frame of a video file. The frames are read in order, none of them is dropped.
+        The detection is independent for every frame, so with several workers the chunks of the video are
+        decoded and segmented in worker processes and only the detections are sent back. The association runs
+        on the calling process in frame order, so the results are the same as with serial processing.
+        The tracking callback is called after every frame, but tracker.frame and the debug frame are only
+        available with serial processing. With workers the tracked objects have no contours and the frame
+        preprocessor should be picklable
+        :param video_path: path of the video file
+        :param horizontal_flip: Flip the frames horizontally
+        :param nb_workers: number of worker processes, None means the number of CPUs. With 1 worker (or with
+        motion_gating/search_windows which depend on the previous frame) the frames are processed serially
+        :param chunk_size: number of consecutive frames processed by a worker at once
+        (see track() for the other parameters)
+        :return: iterator of the tracking results in frame order
+        """
 
-            if not self._is_running:
-                break
+        self.set_tracking_parameters(hsv_lower_value=hsv_lower_value,
+                                     hsv_upper_value=hsv_upper_value,
+                                     min_contour_area=min_contour_area,
+                                     kernel=kernel,
+                                     max_track_point_distance=max_track_point_distance,
+                                     max_skipped_frames=max_skipped_frames,
+                                     color_classes=color_classes)
+
+        capture = cv2.VideoCapture(video_path)
+        if not capture.isOpened():
+            raise ValueError("Can not open the video: {0}".format(video_path))
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        # Timestamps are the positions of the frames in the video
+        frame_period = 1.0 / fps if fps > 0 else np.nan
+
+        nb_workers = nb_workers or os.cpu_count() or 1
+        if nb_workers <= 1 or self._change_detector is not None or self._search_windows:
+            return self._track_video_serial(capture, horizontal_flip, frame_period)
+        capture.release()
+        return self._track_video_parallel(video_path, horizontal_flip, frame_period, nb_workers, chunk_size)
+
+    def _track_video_serial(self, capture: cv2.VideoCapture, horizontal_flip: bool,
+                            frame_period: float) -> Iterator[TrackingResult]:
+        self._is_running = True
+        frame_index = 0
+        try:
+            while self._is_running:
+                try:
+                    frame, _ = self._read_from_camera(capture, horizontal_flip)
+                except ValueError:
+                    # End of the video
+                    break
+                yield self._update(frame, frame_index * frame_period)
+                frame_index += 1
+                self._end_tracked_frame()
+        finally:
+            capture.release()
+
+    def _track_video_parallel(self, video_path: str, horizontal_flip: bool, frame_period: float, nb_workers: int,
+                              chunk_size: int) -> Iterator[TrackingResult]:
+        self._is_running = True
+        # The frames of the video are not shown, so there is nothing to draw on
+        self._frame = None
+        self._debug_renderer.clear()
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=nb_workers, initializer=video_worker.init_worker,
+            initargs=(self._options, self._tracking_parameters, self._selection_points, self._frame_preprocessor,
+                      horizontal_flip))
+        # Chunks in flight, so the memory of the detections stays bounded
+        pending = collections.deque()
+        next_chunk_start = 0
+        frame_index = 0
+        end_of_video = False
+        try:
+            while self._is_running:
+                while not end_of_video and len(pending) < 2 * nb_workers:
+                    pending.append(executor.submit(video_worker.detect_video_chunk, video_path, next_chunk_start,
+                                                   next_chunk_start + chunk_size))
+                    next_chunk_start += chunk_size
+                if not pending:
+                    break
+
+                chunk_results = pending.popleft().result()
+                if len(chunk_results) < chunk_size:
+                    # The following chunks are empty, they are not waited for
+                    end_of_video = True
+                    for future in pending:
+                        future.cancel()
+                    pending.clear()
+
+                for light_detections, self._nb_processed_pixels, detection_time in chunk_results:
+                    detections = video_worker.from_light_detections(light_detections)
+                    if self._instrumentation is not None:
+                        self._instrumentation.add("detection", detection_time)
+                    yield self._finish_frame(None, frame_index * frame_period, detections,
+                                             {"detection": detection_time})
+                    frame_index += 1
+                    self._end_tracked_frame()
+                    if not self._is_running:
+                        break
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
@@ -0,0 +1,37 @@
+from typing import NamedTuple, Tuple, Optional, Mapping
+
+import numpy as np
+
+
+class TrackState(NamedTuple):
+    """
+    Snapshot of a tracked object at a given frame
+    """
+
+    id: int
+    point: Tuple[int, int]
+    bbox: Optional[Tuple[int, int, int, int]]
+    skipped_frames: int
+    label: str = None
+
+
+class TrackingResult(NamedTuple):
+    """
+    Immutable result of the tracking of a single frame
+    """
+
+    frame_index: int
+    timestamp: float
+    tracks: Tuple[TrackState, ...]
+    bboxes: np.ndarray
+    centers: np.ndarray
+    timings: Mapping[str, float]
+    labels: Tuple[str, ...] = ()
+    processed_pixels: int = 0
+    full_scan: bool = True
+
+
+def read_only_array(array, dtype, shape) -> np.ndarray:
+    array = np.asarray(array, dtype=dtype).reshape(shape).view()
+    array.flags.writeable = False
+    return array
@@ -0,0 +1,88 @@
+"""
+Functions which run in the worker processes of ColorTracker.track_video().
+Every worker process has its own tracker which is used only for the (stateless) detection
+"""
+
+import time
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+from color_tracker.utils import detection
+
+# (centers, bboxes, areas) of every color class
+LightDetections = List[Tuple[np.ndarray, np.ndarray, np.ndarray]]
+
+_tracker = None
+_horizontal_flip = False
+
+
+def init_worker(tracker_options: dict, tracking_parameters: dict, court_points, frame_preprocessor,
+                horizontal_flip: bool):
+    global _tracker, _horizontal_flip
+    # Imported here, because the tracker module imports this module
+    from color_tracker.tracker.tracker import ColorTracker
+
+    # OpenCV threads would compete with the other worker processes
+    cv2.setNumThreads(1)
+    _tracker = ColorTracker(**dict(tracker_options, debug=False, pipeline_workers=0))
+    _tracker.set_tracking_parameters(**tracking_parameters)
+    _tracker.set_court_points(court_points)
+    if frame_preprocessor is not None:
+        _tracker.set_frame_preprocessor(frame_preprocessor)
+    _horizontal_flip = horizontal_flip
+
+
+def to_light_detections(detections_per_class: List[detection.Detections]) -> LightDetections:
+    # Only the arrays are sent back, the contours and the label images stay in the worker
+    return [(d.centers, d.bboxes, d.areas) for d in detections_per_class]
+
+
+def from_light_detections(light_detections: LightDetections) -> List[detection.Detections]:
+    return [detection.Detections(centers, bboxes, areas) for centers, bboxes, areas in light_detections]
+
+
+def _open_at(video_path: str, start: int) -> cv2.VideoCapture:
+    # Opens the video at the start frame. Some backends can not seek or land on another (key)frame, then the
+    # video is opened again and the frames are grabbed up to the start
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError("Can not open the video: {0}".format(video_path))
+    if start == 0:
+        return capture
+    if capture.set(cv2.CAP_PROP_POS_FRAMES, start) and int(capture.get(cv2.CAP_PROP_POS_FRAMES)) == start:
+        return capture
+    capture.release()
+    capture = cv2.VideoCapture(video_path)
+    for _ in range(start):
+        if not capture.grab():
+            break
+    return capture
+
+
+def detect_video_chunk(video_path: str, start: int, end: int) -> List[Tuple[LightDetections, int, float]]:
+    """
+    Reads the [start, end) frames of the video and detects the objects on them
+    :param video_path: path of the video
+    :param start: index of the first frame of the chunk
+    :param end: index after the last frame of the chunk
+    :return: (detections, number of processed pixels, detection time) for every frame of the chunk which exists
+    """
+
+    capture = _open_at(video_path, start)
+    try:
+        results = []
+        for _ in range(start, end):
+            ret, frame = capture.read()
+            if not ret:
+                break
+            start_time = time.perf_counter()
+            if _horizontal_flip:
+                frame = cv2.flip(frame, 1)
+            detections_per_class, nb_of_pixels = _tracker.detect(frame)
+            results.append((to_light_detections(detections_per_class), nb_of_pixels,
+                            time.perf_counter() - start_time))
+        return results
+    finally:
+        capture.release()
@@ -0,0 +1,109 @@
+from typing import List
+
+import numpy as np
+from scipy import optimize, sparse
+from scipy.sparse import csgraph
+from scipy.spatial import cKDTree
+
+ASSOCIATION_METHODS = ("dense", "gated")
+
+
+def find_gated_pairs(track_points: np.ndarray, detection_points: np.ndarray, max_distance: float):
+    """
+    Finds every (track, detection) pair which is closer than the max distance with a KD-tree
+    :param track_points: (N, 2) array of the last points of the tracks
+    :param detection_points: (M, 2) array of the detected object centers
+    :param max_distance: pairs with larger distance are never matched
+    :return: track indices, detection indices and distances of the candidate pairs
+    """
+
+    if len(track_points) == 0 or len(detection_points) == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.float64)
+
+    track_tree = cKDTree(track_points)
+    detection_tree = cKDTree(detection_points)
+    pairs = track_tree.sparse_distance_matrix(detection_tree, max_distance, output_type="ndarray")
+    return pairs["i"].astype(np.intp), pairs["j"].astype(np.intp), pairs["v"].astype(np.float64)
+
+
+def _solve_dense_cluster(rows: np.ndarray, cols: np.ndarray, costs: np.ndarray, not_matched_cost: float):
+    track_ids, local_rows = np.unique(rows, return_inverse=True)
+    detection_ids, local_cols = np.unique(cols, return_inverse=True)
+    cost_mtx = np.full((len(track_ids), len(detection_ids)), not_matched_cost)
+    cost_mtx[local_rows, local_cols] = costs
+    row_index, column_index = optimize.linear_sum_assignment(cost_mtx)
+    matched = cost_mtx[row_index, column_index] < not_matched_cost
+    return track_ids[row_index[matched]], detection_ids[column_index[matched]]
+
+
+def _solve_sparse_cluster(rows: np.ndarray, cols: np.ndarray, costs: np.ndarray, not_matched_cost: float):
+    track_ids, local_rows = np.unique(rows, return_inverse=True)
+    detection_ids, local_cols = np.unique(cols, return_inverse=True)
+    nb_tracks, nb_detections = len(track_ids), len(detection_ids)
+
+    # Every track gets its own dummy detection, so a full matching always exists.
+    # Real costs are shifted by 1 because zero weights would be treated as missing edges
+    dummy_rows = np.arange(nb_tracks)
+    data = np.concatenate([costs + 1.0, np.full(nb_tracks, not_matched_cost)])
+    biadjacency = sparse.csr_matrix((data, (np.concatenate([local_rows, dummy_rows]),
+                                            np.concatenate([local_cols, nb_detections + dummy_rows]))),
+                                    shape=(nb_tracks, nb_detections + nb_tracks))
+    row_index, column_index = csgraph.min_weight_full_bipartite_matching(biadjacency)
+    matched = column_index < nb_detections
+    return track_ids[row_index[matched]], detection_ids[column_index[matched]]
+
+
+def solve_gated_assignment(track_points: np.ndarray, detection_points: np.ndarray, max_distance: float,
+                           max_dense_cluster_size: int = 64) -> List[int]:
+    """
+    Solves the assignment problem only on the pairs which are closer than the max distance.
+    The candidate pairs are split into independent clusters (connected components of the bipartite graph)
+    and every cluster is solved separately. Small clusters are solved with the dense Hungarian method,
+    large ones with a sparse bipartite matcher.
+    The result is the same as the dense assignment followed by the distance check whenever the dense
+    solution does not use pairs beyond the max distance
+    :param track_points: (N, 2) array of the last points of the tracks
+    :param detection_points: (M, 2) array of the detected object centers
+    :param max_distance: pairs with larger distance are never matched
+    :param max_dense_cluster_size: clusters with more tracks or detections are solved with the sparse matcher
+    :return: index of the assigned detection for every track, -1 means there is no assignment
+    """
+
+    track_points = np.asarray(track_points, dtype=np.float64).reshape(-1, 2)
+    detection_points = np.asarray(detection_points, dtype=np.float64).reshape(-1, 2)
+    nb_tracks, nb_detections = len(track_points), len(detection_points)
+    assignment = np.full(nb_tracks, -1, dtype=np.intp)
+
+    rows, cols, costs = find_gated_pairs(track_points, detection_points, max_distance)
+    if len(rows) == 0:
+        return assignment.tolist()
+
+    # Nodes of the bipartite graph: tracks are [0, N), detections are [N, N + M)
+    graph = sparse.coo_matrix((np.ones(len(rows)), (rows, cols + nb_tracks)),
+                              shape=(nb_tracks + nb_detections, nb_tracks + nb_detections))
+    _, node_labels = csgraph.connected_components(graph, directed=False)
+    edge_labels = node_labels[rows]
+
+    # Clusters with a single candidate pair need no solver
+    edge_order = np.argsort(edge_labels, kind="stable")
+    _, cluster_starts, cluster_sizes = np.unique(edge_labels[edge_order], return_index=True,
+                                                  return_counts=True)
+    single_edges = edge_order[cluster_starts[cluster_sizes == 1]]
+    assignment[rows[single_edges]] = cols[single_edges]
+
+    for start, size in zip(cluster_starts[cluster_sizes > 1], cluster_sizes[cluster_sizes > 1]):
+        edges = edge_order[start:start + size]
+        cluster_rows, cluster_cols, cluster_costs = rows[edges], cols[edges], costs[edges]
+        nb_cluster_tracks = len(np.unique(cluster_rows))
+        nb_cluster_detections = len(np.unique(cluster_cols))
+        # Unmatched pairs cost more than any set of real matches, so the number of matches is maximized first
+        not_matched_cost = (max_distance + 2.0) * (min(nb_cluster_tracks, nb_cluster_detections) + 1)
+        if max(nb_cluster_tracks, nb_cluster_detections) > max_dense_cluster_size:
+            matched_rows, matched_cols = _solve_sparse_cluster(cluster_rows, cluster_cols, cluster_costs,
+                                                               not_matched_cost)
+        else:
+            matched_rows, matched_cols = _solve_dense_cluster(cluster_rows, cluster_cols, cluster_costs,
+                                                              not_matched_cost)
+        assignment[matched_rows] = matched_cols
+
+    return assignment.tolist()
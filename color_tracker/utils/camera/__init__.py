@@ -1,2 +1,4 @@
 from .base_camera import Camera
+from .frame_buffer import FrameBuffer, Frame
+from .shared_frame_ring import SharedFrameRing, SharedFrame
 from .web_camera import WebCamera
@@ -1,6 +1,18 @@
+import asyncio
+import functools
 import threading
+import time
+import warnings
 
 import cv2
+import numpy as np
+
+from color_tracker.utils import helpers
+from color_tracker.utils.camera.frame_buffer import FrameBuffer, Frame
+from color_tracker.utils.camera.shared_frame_ring import SharedFrameRing
+
+# Seconds between the checks of the capture thread while a reader waits for a new frame
+_CAPTURE_CHECK_INTERVAL = 0.005
 
 
 class Camera(object):
@@ -8,7 +20,13 @@ class Camera(object):
     Base Camera object
     """
 
-    def __init__(self):
+    def __init__(self, buffer_policy: str = "latest", buffer_size: int = 1):
+        """
+        :param buffer_policy: policy of the frame buffer between the camera thread and the reader:
+        "latest", "fifo" or "drop_oldest"
+        :param buffer_size: maximum number of the buffered frames for the "fifo" and "drop_oldest" policies
+        """
+
         self._cam = None
         self._frame = None
         self._frame_width = None
@@ -18,8 +36,20 @@ class Camera(object):
         self._auto_undistortion = False
         self._camera_matrix = None
         self._distortion_coefficients = None
+        self._crop_to_valid_roi = False
+        self._undistortion_maps = None
+
+        self._buffer_policy = buffer_policy
+        self._buffer_size = buffer_size
+        self._frame_buffer = FrameBuffer(buffer_policy, buffer_size)
+        self._frame_ring = None
 
         self._is_running = False
+        self._capture_thread = None
+        # A subclass which implements _update_camera() the old way only sets self._frame and does not publish it
+        self._capture_publishes = False
+        self._last_published_frame = None
+        self._warned_unpublished = False
 
     def _init_camera(self):
         """
@@ -35,9 +65,14 @@ class Camera(object):
         Camera runs on a separate thread so we can reach a higher FPS
         """
 
+        self._frame_buffer = FrameBuffer(self._buffer_policy, self._buffer_size)
+        self._capture_publishes = False
         self._init_camera()
+        if self._ret and self._frame is not None:
+            self._publish_frame(self._frame, time.time())
         self._is_running = True
-        threading.Thread(target=self._update_camera, args=()).start()
+        self._capture_thread = threading.Thread(target=self._update_camera, args=())
+        self._capture_thread.start()
 
     def _read_from_camera(self):
         """
@@ -55,10 +90,45 @@ class Camera(object):
 
         while True:
             if self._is_running:
-                self._ret, self._frame = self._read_from_camera()
+                ret, frame = self._read_from_camera()
+                timestamp = time.time()
+                self._ret, self._frame = ret, frame
+                if ret:
+                    self._publish_frame(frame, timestamp)
+                else:
+                    # There is no more feed, so the waiting readers are released
+                    self._close_feed()
+                    break
             else:
                 break
 
+    def set_frame_ring(self, frame_ring: SharedFrameRing):
+        """
+        Publish the captured frames into a shared memory frame ring instead of the frame buffer of this process,
+        so other processes can read them without copying. read_frame() reads from the ring
+        :param frame_ring: frame ring with the shape of the frames of this camera, None means the frame buffer
+        """
+
+        self._frame_ring = frame_ring
+
+    @property
+    def frame_ring(self) -> SharedFrameRing:
+        return self._frame_ring
+
+    def _publish_frame(self, frame, timestamp: float):
+        if not self._capture_publishes and threading.current_thread() is self._capture_thread:
+            self._capture_publishes = True
+        self._last_published_frame = frame
+        if self._frame_ring is not None:
+            self._frame_ring.write(frame, timestamp)
+        else:
+            self._frame_buffer.put(frame, timestamp)
+
+    def _close_feed(self):
+        self._frame_buffer.close()
+        if self._frame_ring is not None:
+            self._frame_ring.close()
+
     def get_frame_width_and_height(self):
         """
         Returns the width and height of the grabbed images
@@ -67,17 +137,140 @@ class Camera(object):
 
         return self._frame_width, self._frame_height
 
-    def read(self):
+    def read_frame(self, wait_new: bool = False, timeout: float = None) -> Frame:
+        """
+        Reads a frame with its sequence number and capture timestamp
+        :param wait_new: if it is True than it blocks until a frame arrives which was not read before,
+        otherwise it returns the last frame immediately
+        :param timeout: maximum waiting time in seconds, None means no limit
+        :return: the frame or None if there is no frame
+        """
+
+        if not self._is_running:
+            warnings.warn("Camera is not started, you should start it with start_camera()")
+            return None
+        if self._frame_ring is not None:
+            return self._frame_ring.read_frame(wait_new=wait_new, timeout=timeout)
+        if not wait_new or self._capture_publishes:
+            return self._frame_buffer.get(wait_new=wait_new, timeout=timeout)
+        return self._wait_for_new_frame(timeout)
+
+    def _wait_for_new_frame(self, timeout: float = None) -> Frame:
+        # Until the capture thread publishes a frame, the waiting is done in short steps, so a subclass which only
+        # sets self._frame (its frames are published here) or a capture thread which died is noticed
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        unpublished_frame = None
+        while True:
+            remaining = None if deadline is None else max(deadline - time.perf_counter(), 0.0)
+            if self._capture_publishes:
+                return self._frame_buffer.get(wait_new=True, timeout=remaining)
+            step = _CAPTURE_CHECK_INTERVAL if remaining is None else min(remaining, _CAPTURE_CHECK_INTERVAL)
+            frame = self._frame_buffer.get(wait_new=True, timeout=step)
+            if frame is not None or self._frame_buffer.is_closed or (remaining is not None and remaining <= step):
+                return frame
+
+            current_frame = self._frame if self._ret else None
+            if current_frame is not None and current_frame is not self._last_published_frame:
+                # It is published only when it was not published for a whole step, so a capture thread which
+                # publishes right after setting self._frame does not get duplicated frames
+                if current_frame is unpublished_frame:
+                    self._publish_unpublished_frame(current_frame)
+                unpublished_frame = current_frame
+            elif self._capture_thread is not None and not self._capture_thread.is_alive():
+                # The capture thread ended without closing the feed (e.g. it raised an exception)
+                self._close_feed()
+
+    def _publish_unpublished_frame(self, frame):
+        if not self._warned_unpublished:
+            warnings.warn("{0}._update_camera() does not publish the frames, they are polled. It should call "
+                          "_publish_frame() for every frame".format(type(self).__name__))
+            self._warned_unpublished = True
+        self._publish_frame(frame, time.time())
+
+    def read(self, wait_new: bool = False, timeout: float = None):
         """
         With this you can grab the last frame from the camera
+        :param wait_new: if it is True than it blocks until a frame arrives which was not read before
+        :param timeout: maximum waiting time in seconds, None means no limit
         :return (boolean, np.array): return value and frame
         """
-        if self._is_running:
-            return self._ret, self._frame
-        else:
-            import warnings
-            warnings.warn("Camera is not started, you should start it with start_camera()")
+
+        frame = self.read_frame(wait_new=wait_new, timeout=timeout)
+        if frame is None:
             return False, None
+        return True, frame.image
+
+    async def aread_frame(self, wait_new: bool = False, timeout: float = None) -> Frame:
+        """
+        Awaitable version of read_frame(). Waiting for a new frame does not block the event loop or a thread
+        (with a frame ring the waiting runs on the default executor of the loop)
+        """
+
+        if not wait_new:
+            return self.read_frame(wait_new=False)
+        loop = asyncio.get_running_loop()
+        if self._frame_ring is not None:
+            return await loop.run_in_executor(None, functools.partial(self.read_frame, True, timeout))
+
+        frame_buffer = self._frame_buffer
+        frame_arrived = asyncio.Event()
+
+        def listener():
+            try:
+                loop.call_soon_threadsafe(frame_arrived.set)
+            except RuntimeError:
+                # The event loop is closed
+                pass
+
+        frame_buffer.add_listener(listener)
+        try:
+            deadline = None if timeout is None else loop.time() + timeout
+            while True:
+                # The event is cleared before the read, so a frame which arrives after the read wakes us up
+                frame_arrived.clear()
+                frame = self.read_frame(wait_new=True, timeout=0)
+                if frame is not None or frame_buffer.is_closed or not self._is_running:
+                    return frame
+                remaining = None if deadline is None else deadline - loop.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                try:
+                    await asyncio.wait_for(frame_arrived.wait(), remaining)
+                except asyncio.TimeoutError:
+                    return None
+        finally:
+            frame_buffer.remove_listener(listener)
+
+    async def aread(self, wait_new: bool = False, timeout: float = None):
+        """
+        Awaitable version of read()
+        :return (boolean, np.array): return value and frame
+        """
+
+        frame = await self.aread_frame(wait_new=wait_new, timeout=timeout)
+        if frame is None:
+            return False, None
+        return True, frame.image
+
+    @property
+    def frame_buffer(self) -> FrameBuffer:
+        return self._frame_buffer
+
+    @property
+    def nb_dropped_frames(self) -> int:
+        """
+        Number of frames which were captured but never read
+        """
+
+        return self._frame_buffer.nb_dropped
+
+    @property
+    def lag(self) -> int:
+        """
+        Number of frames captured after the last read one
+        """
+
+        return self._frame_buffer.lag
 
     def release(self):
         """
@@ -85,6 +278,18 @@ class Camera(object):
         """
 
         self._is_running = False
+        self._close_feed()
+
+    def _join_capture_thread(self, timeout: float = None) -> bool:
+        """
+        The device can be released only after the capture thread finished its last read
+        :return: True if the capture thread finished
+        """
+
+        if self._capture_thread is not None and self._capture_thread is not threading.current_thread():
+            self._capture_thread.join(timeout)
+            return not self._capture_thread.is_alive()
+        return True
 
     def is_running(self):
         return self._is_running
@@ -92,26 +297,41 @@ class Camera(object):
     def set_calibration_matrices(self, camera_matrix, distortion_coefficients):
         self._camera_matrix = camera_matrix
         self._distortion_coefficients = distortion_coefficients
+        # The cached remap tables belong to the old calibration
+        self._undistortion_maps = None
+
+    def activate_auto_undistortion(self, crop_to_valid_roi: bool = False):
+        """
+        Undistort every captured frame
+        :param crop_to_valid_roi: crop the undistorted frames to the region which contains only valid pixels,
+        so the following stages process fewer pixels
+        """
 
-    def activate_auto_undistortion(self):
         self._auto_undistortion = True
+        self._crop_to_valid_roi = crop_to_valid_roi
 
     def deactivate_auto_undistortion(self):
         self._auto_undistortion = False
 
-    def _undistort_image(self, image):
+    def _get_undistortion_maps(self, width: int, height: int):
+        key = (width, height, self._crop_to_valid_roi)
+        undistortion_maps = self._undistortion_maps
+        if undistortion_maps is not None and undistortion_maps[0] == key:
+            return undistortion_maps[1], undistortion_maps[2]
+
+        map_1, map_2 = helpers.create_undistortion_maps(self._camera_matrix, self._distortion_coefficients, width,
+                                                        height, self._crop_to_valid_roi)
+        self._undistortion_maps = (key, map_1, map_2)
+        return map_1, map_2
+
+    def _undistort_image(self, image, dst=None):
         if self._camera_matrix is None or self._distortion_coefficients is None:
-            import warnings
             warnings.warn("Undistortion has no effect because <camera_matrix>/<distortion_coefficients> is None!")
             return image
 
         h, w = image.shape[:2]
-        new_camera_matrix, roi = cv2.getOptimalNewCameraMatrix(self._camera_matrix,
-                                                               self._distortion_coefficients, (w, h),
-                                                               1,
-                                                               (w, h))
-        undistorted = cv2.undistort(image, self._camera_matrix, self._distortion_coefficients, None,
-                                    new_camera_matrix)
+        map_1, map_2 = self._get_undistortion_maps(w, h)
+        undistorted = cv2.remap(image, map_1, map_2, cv2.INTER_LINEAR, dst=dst)
         return undistorted
 
     def __enter__(self):
@@ -0,0 +1,163 @@
+import collections
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+
+BUFFER_POLICIES = ("latest", "fifo", "drop_oldest")
+
+
+class Frame(NamedTuple):
+    """
+    A captured frame with its sequence number and capture time
+    """
+
+    sequence: int
+    timestamp: float
+    image: np.ndarray
+
+
+class FrameBuffer(object):
+    """
+    Thread safe buffer between the camera thread (producer) and the reader (consumer).
+    Every frame gets a monotonically increasing sequence number (starting from 1)
+
+    Policies:
+        - "latest": only the newest frame is kept, an unread frame is dropped when a new one arrives
+        - "fifo": frames are kept in order up to max_size, new frames are dropped when it is full
+        - "drop_oldest": frames are kept in order up to max_size, the oldest one is dropped when it is full
+    """
+
+    def __init__(self, policy: str = "latest", max_size: int = 1):
+        if policy not in BUFFER_POLICIES:
+            raise ValueError("Unknown buffer policy: {0}, use one of {1}".format(policy, BUFFER_POLICIES))
+        self._policy = policy
+        self._max_size = 1 if policy == "latest" else max(1, max_size)
+
+        self._condition = threading.Condition()
+        self._frames = collections.deque()
+        self._last_frame = None
+        self._sequence = 0
+        self._last_read_sequence = 0
+        self._nb_read = 0
+        self._nb_dropped = 0
+        self._closed = False
+        self._listeners = []
+
+    @property
+    def policy(self) -> str:
+        return self._policy
+
+    @property
+    def sequence(self) -> int:
+        """
+        Sequence number of the last captured frame
+        """
+
+        return self._sequence
+
+    @property
+    def nb_dropped(self) -> int:
+        """
+        Number of frames which were captured but never read
+        """
+
+        return self._nb_dropped
+
+    @property
+    def nb_read(self) -> int:
+        return self._nb_read
+
+    @property
+    def lag(self) -> int:
+        """
+        Number of frames captured after the last read one
+        """
+
+        return self._sequence - self._last_read_sequence
+
+    @property
+    def is_closed(self) -> bool:
+        return self._closed
+
+    def put(self, image: np.ndarray, timestamp: float = None) -> Optional[Frame]:
+        """
+        Adds a new frame to the buffer and wakes up the waiting readers
+        :param image: captured image
+        :param timestamp: capture time, if it is None than the current time is used
+        :return: the stored frame or None if it was dropped
+        """
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self._condition:
+            self._sequence += 1
+            frame = Frame(self._sequence, timestamp, image)
+
+            if len(self._frames) >= self._max_size:
+                if self._policy == "fifo":
+                    self._nb_dropped += 1
+                    return None
+                self._frames.popleft()
+                self._nb_dropped += 1
+
+            self._frames.append(frame)
+            self._last_frame = frame
+            self._condition.notify_all()
+        self._notify_listeners()
+        return frame
+
+    def get(self, wait_new: bool = True, timeout: float = None) -> Optional[Frame]:
+        """
+        Reads the next frame from the buffer
+        :param wait_new: if it is True than it blocks until a frame arrives which was not read before,
+        otherwise the last captured frame is returned even if it was read already
+        :param timeout: maximum waiting time in seconds, None means no limit
+        :return: the frame or None if there is no frame (timeout or closed buffer)
+        """
+
+        with self._condition:
+            if wait_new:
+                self._condition.wait_for(lambda: len(self._frames) > 0 or self._closed, timeout)
+
+            if len(self._frames) > 0:
+                frame = self._frames.popleft()
+                self._last_read_sequence = frame.sequence
+                self._nb_read += 1
+                return frame
+
+            if wait_new or self._closed:
+                return None
+            return self._last_frame
+
+    def close(self):
+        """
+        Closes the buffer and wakes up every waiting reader
+        """
+
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._notify_listeners()
+
+    def add_listener(self, listener: Callable[[], None]):
+        """
+        Adds a function which is called (on the thread of the camera) when a frame arrives or the buffer is closed.
+        It lets readers wait for the frames without blocking a thread (e.g. in an asyncio event loop)
+        """
+
+        with self._condition:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[], None]):
+        with self._condition:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _notify_listeners(self):
+        with self._condition:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
@@ -0,0 +1,414 @@
+import multiprocessing
+import os
+import sys
+import time
+import weakref
+from multiprocessing import shared_memory
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from color_tracker.utils.camera.frame_buffer import Frame
+
+# Header fields
+_LATEST_SEQUENCE, _LATEST_SLOT, _CLOSED, _NB_DROPPED = range(4)
+_HEADER_SIZE = 8
+# Slot table fields, _SLOT_WRITING is the pid of the writer while the slot is being written
+_SLOT_SEQUENCE, _SLOT_WRITING, _SLOT_TIMESTAMP = range(3)
+_SLOT_FIELDS = 3
+# Reader table fields, they are followed by the number of times the reader owns every slot
+_READER_PID, _READER_HEARTBEAT = range(2)
+_READER_FIELDS = 2
+
+# Windows process access right and exit code of the running processes
+_PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+_STILL_ACTIVE = 259
+_ERROR_ACCESS_DENIED = 5
+
+
+class SharedFrame(NamedTuple):
+    """
+    A frame which is owned by the reader until it is released. The image is a view of the shared memory
+    """
+
+    sequence: int
+    timestamp: float
+    image: np.ndarray
+    slot: int
+
+
+def _close_shared_memory(shm: shared_memory.SharedMemory, owner_pid: int = None):
+    # Only the creator process unlinks (a forked child has a copy of the finalizer)
+    if owner_pid == os.getpid():
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+    try:
+        shm.close()
+    except BufferError:
+        # There are still views of the frames, the mapping is closed when they are garbage collected
+        pass
+
+
+def _is_windows_process_alive(pid: int) -> bool:
+    # os.kill() would send a signal (CTRL_C_EVENT for 0) on Windows, so the process is queried instead
+    import ctypes
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    handle = kernel32.OpenProcess(_PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        return ctypes.get_last_error() == _ERROR_ACCESS_DENIED
+    try:
+        exit_code = ctypes.c_ulong()
+        if not kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)):
+            return True
+        return exit_code.value == _STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def _is_process_alive(pid: int) -> bool:
+    if sys.platform == "win32":
+        return _is_windows_process_alive(pid)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    try:
+        # A crashed child process is a zombie until its parent waits for it (only visible where there is /proc,
+        # elsewhere the reader_timeout of the ring covers it)
+        with open("/proc/{0}/stat".format(pid)) as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except (OSError, IndexError):
+        return True
+
+
+class SharedFrameRing(object):
+    """
+    Ring of frame slots in shared memory between a capture process (single writer) and the tracker processes
+    (readers). The readers get NumPy views of the slots, so the frames are never copied or pickled.
+
+    A reader owns the slots it acquired until it releases them and the writer never overwrites an owned slot.
+    Every frame gets a monotonically increasing sequence number (starting from 1). When every slot is owned or
+    being written, the new frame is dropped. The slots of the reader processes which exited are taken back, and
+    with a reader_timeout also the slots of the readers which did not read or release a frame for that long (e.g. a
+    hung process). A slot which was left in writing state by a writer process which exited is reused.
+
+    The ring is shared with child processes by passing it to them at creation time (e.g. as an argument of
+    multiprocessing.Process or as an initarg of a process pool). The ring should be created with the same
+    multiprocessing context as the reader processes (e.g. multiprocessing.get_context("spawn"), the default on
+    macOS and Windows), because its lock can not be shared with processes of another start method.
+    The creator unlinks the shared memory when it is released, garbage collected or when the process exits.
+    If the creator is killed, the resource tracker of multiprocessing unlinks the memory
+    """
+
+    def __init__(self, shape: Tuple[int, ...], dtype=np.uint8, nb_slots: int = 4, max_readers: int = 8,
+                 context=None, reader_timeout: float = None):
+        """
+        :param shape: shape of the frames (e.g. (1080, 1920, 3))
+        :param dtype: type of the frames
+        :param nb_slots: number of frame slots, it should be larger than the number of frames which are owned by
+        the readers at the same time
+        :param max_readers: maximum number of reader processes
+        :param context: multiprocessing context of the reader processes, None means the default start method
+        :param reader_timeout: the slots of a reader which did not read or release a frame for this many seconds
+        are taken back, it should be longer than a reader keeps a frame. None means only the readers which exited
+        are detected
+        """
+
+        if nb_slots < 2:
+            raise ValueError("The ring needs at least 2 slots")
+        self._shape = tuple(shape)
+        self._dtype = np.dtype(dtype)
+        self._nb_slots = nb_slots
+        self._max_readers = max_readers
+        self._reader_timeout = reader_timeout
+        self._condition = (context or multiprocessing).Condition()
+
+        size = self._table_size() * 8 + nb_slots * self._frame_size()
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._finalizer = weakref.finalize(self, _close_shared_memory, self._shm, os.getpid())
+        self._create_views()
+        self._header[:] = 0
+        self._slots[:] = 0
+        self._readers[:] = 0
+        self._header[_LATEST_SLOT] = -1
+        self._init_process_state()
+
+    def _frame_size(self) -> int:
+        return int(np.prod(self._shape)) * self._dtype.itemsize
+
+    def _table_size(self) -> int:
+        # Number of 64 bit fields before the frames
+        return _HEADER_SIZE + self._nb_slots * _SLOT_FIELDS + self._max_readers * (_READER_FIELDS + self._nb_slots)
+
+    def _create_views(self):
+        tables = np.ndarray((self._table_size(),), dtype=np.int64, buffer=self._shm.buf)
+        self._header = tables[:_HEADER_SIZE]
+        slot_table_end = _HEADER_SIZE + self._nb_slots * _SLOT_FIELDS
+        self._slots = tables[_HEADER_SIZE:slot_table_end].reshape(self._nb_slots, _SLOT_FIELDS)
+        self._timestamps = self._slots[:, _SLOT_TIMESTAMP].view(np.float64)
+        # Every reader has a row: pid, time of its last read or release and the number of times it owns every slot
+        self._readers = tables[slot_table_end:].reshape(self._max_readers, _READER_FIELDS + self._nb_slots)
+        self._heartbeats = self._readers[:, _READER_HEARTBEAT].view(np.float64)
+        self._images = np.ndarray((self._nb_slots,) + self._shape, dtype=self._dtype, buffer=self._shm.buf,
+                                  offset=self._table_size() * 8)
+
+    def _init_process_state(self):
+        self._pid = os.getpid()
+        self._reader_index = None
+        self._write_slot = None
+        self._last_read_sequence = 0
+        self._held_frame = None
+
+    def __getstate__(self):
+        return {"shape": self._shape, "dtype": self._dtype.str, "nb_slots": self._nb_slots,
+                "max_readers": self._max_readers, "reader_timeout": self._reader_timeout,
+                "condition": self._condition, "name": self._shm.name}
+
+    def __setstate__(self, state):
+        self._shape = state["shape"]
+        self._dtype = np.dtype(state["dtype"])
+        self._nb_slots = state["nb_slots"]
+        self._max_readers = state["max_readers"]
+        self._reader_timeout = state["reader_timeout"]
+        self._condition = state["condition"]
+        if sys.version_info >= (3, 13):
+            self._shm = shared_memory.SharedMemory(name=state["name"], track=False)
+        else:
+            self._shm = shared_memory.SharedMemory(name=state["name"])
+        self._finalizer = weakref.finalize(self, _close_shared_memory, self._shm)
+        self._create_views()
+        self._init_process_state()
+
+    def _check_process(self):
+        # After a fork the copy of the ring belongs to a new process
+        if self._pid != os.getpid():
+            self._init_process_state()
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self._shape
+
+    @property
+    def nb_slots(self) -> int:
+        return self._nb_slots
+
+    @property
+    def latest_sequence(self) -> int:
+        return int(self._header[_LATEST_SEQUENCE])
+
+    @property
+    def nb_dropped(self) -> int:
+        """
+        Number of frames which were dropped because every slot was owned by the readers
+        """
+
+        return int(self._header[_NB_DROPPED])
+
+    @property
+    def is_closed(self) -> bool:
+        return bool(self._header[_CLOSED])
+
+    # Writer side
+
+    def _reclaim_dead_readers(self) -> bool:
+        reclaimed = False
+        now = time.time()
+        for i, row in enumerate(self._readers):
+            pid = int(row[_READER_PID])
+            if pid == 0 or pid == os.getpid():
+                continue
+            is_stale = self._reader_timeout is not None and now - self._heartbeats[i] > self._reader_timeout
+            if is_stale or not _is_process_alive(pid):
+                row[:] = 0
+                reclaimed = True
+        return reclaimed
+
+    def _reclaim_dead_writes(self) -> bool:
+        # The slots which are left in writing state by a writer process which exited
+        reclaimed = False
+        for slot in range(self._nb_slots):
+            pid = int(self._slots[slot, _SLOT_WRITING])
+            if pid != 0 and pid != os.getpid() and not _is_process_alive(pid):
+                self._slots[slot, _SLOT_WRITING] = 0
+                reclaimed = True
+        return reclaimed
+
+    def _find_free_slot(self) -> Optional[int]:
+        owned = self._readers[:, _READER_FIELDS:].sum(axis=0)
+        latest_slot = int(self._header[_LATEST_SLOT])
+        free_slots = [i for i in range(self._nb_slots)
+                      if owned[i] == 0 and not self._slots[i, _SLOT_WRITING] and i != latest_slot]
+        if not free_slots:
+            return None
+        # The oldest frame is overwritten
+        return min(free_slots, key=lambda i: self._slots[i, _SLOT_SEQUENCE])
+
+    def begin_write(self) -> Optional[np.ndarray]:
+        """
+        Reserves a slot for the next frame, so the frame can be decoded directly into the shared memory
+        :return: view of the reserved slot or None if every slot is owned by the readers
+        """
+
+        self._check_process()
+        if self._write_slot is not None:
+            return self._images[self._write_slot]
+        with self._condition:
+            slot = self._find_free_slot()
+            if slot is None and (self._reclaim_dead_readers() | self._reclaim_dead_writes()):
+                slot = self._find_free_slot()
+            if slot is None:
+                return None
+            self._slots[slot, _SLOT_WRITING] = os.getpid()
+        self._write_slot = slot
+        return self._images[slot]
+
+    def write(self, image: np.ndarray, timestamp: float = None) -> Optional[int]:
+        """
+        Publishes a frame. When the image is the view which was returned by begin_write(), it is not copied
+        :param image: the frame
+        :param timestamp: capture time of the frame, None means the current time
+        :return: sequence number of the frame or None if it was dropped
+        """
+
+        slot_image = self.begin_write()
+        if slot_image is None:
+            with self._condition:
+                self._header[_NB_DROPPED] += 1
+            return None
+        if not np.shares_memory(image, slot_image):
+            slot_image[...] = image
+
+        with self._condition:
+            sequence = int(self._header[_LATEST_SEQUENCE]) + 1
+            self._slots[self._write_slot, _SLOT_SEQUENCE] = sequence
+            self._slots[self._write_slot, _SLOT_WRITING] = 0
+            self._timestamps[self._write_slot] = time.time() if timestamp is None else timestamp
+            self._header[_LATEST_SLOT] = self._write_slot
+            self._header[_LATEST_SEQUENCE] = sequence
+            self._condition.notify_all()
+        self._write_slot = None
+        return sequence
+
+    def close(self):
+        """
+        Marks the end of the feed, the waiting readers are released
+        """
+
+        with self._condition:
+            self._header[_CLOSED] = 1
+            self._condition.notify_all()
+
+    # Reader side
+
+    def _get_reader_row(self) -> np.ndarray:
+        # Called with the lock held, it also refreshes the heartbeat of the reader
+        self._check_process()
+        if self._reader_index is not None and self._readers[self._reader_index, _READER_PID] != os.getpid():
+            # The row was taken back after the reader_timeout, the reader gets a new one
+            self._reader_index = None
+        if self._reader_index is None:
+            free_rows = np.flatnonzero(self._readers[:, _READER_PID] == 0)
+            if len(free_rows) == 0 and self._reclaim_dead_readers():
+                free_rows = np.flatnonzero(self._readers[:, _READER_PID] == 0)
+            if len(free_rows) == 0:
+                raise ValueError("There are more than {0} readers of the frame ring".format(self._max_readers))
+            self._reader_index = int(free_rows[0])
+            self._readers[self._reader_index] = 0
+            self._readers[self._reader_index, _READER_PID] = os.getpid()
+        self._heartbeats[self._reader_index] = time.time()
+        return self._readers[self._reader_index]
+
+    def acquire(self, wait_new: bool = True, timeout: float = None) -> Optional[SharedFrame]:
+        """
+        Acquires the latest frame, the reader owns it until it calls release()
+        :param wait_new: if it is True than it blocks until a frame arrives which was not read by this reader
+        :param timeout: maximum waiting time in seconds, None means no limit
+        :return: the frame or None if there is no frame (timeout or closed ring)
+        """
+
+        self._check_process()
+        with self._condition:
+            def has_frame():
+                latest = self._header[_LATEST_SEQUENCE]
+                return self._header[_CLOSED] or (latest > self._last_read_sequence if wait_new else latest > 0)
+
+            if not self._condition.wait_for(has_frame, timeout=timeout) or \
+                    self._header[_LATEST_SEQUENCE] <= (self._last_read_sequence if wait_new else 0):
+                return None
+            slot = int(self._header[_LATEST_SLOT])
+            self._get_reader_row()[_READER_FIELDS + slot] += 1
+            sequence = int(self._slots[slot, _SLOT_SEQUENCE])
+            timestamp = float(self._timestamps[slot])
+        self._last_read_sequence = sequence
+        return SharedFrame(sequence, timestamp, self._images[slot], slot)
+
+    def release(self, frame: SharedFrame):
+        """
+        Gives back the ownership of the frame, its image should not be used after this call
+        """
+
+        with self._condition:
+            row = self._get_reader_row()
+            if row[_READER_FIELDS + frame.slot] > 0:
+                row[_READER_FIELDS + frame.slot] -= 1
+
+    def read_frame(self, wait_new: bool = True, timeout: float = None) -> Optional[Frame]:
+        """
+        Reads the latest frame like Camera.read_frame(). The frame is owned until the next read_frame() call,
+        so a reader which processes one frame at a time does not need to release it
+        """
+
+        if self._held_frame is not None:
+            self.release(self._held_frame)
+            self._held_frame = None
+        shared_frame = self.acquire(wait_new=wait_new, timeout=timeout)
+        if shared_frame is None:
+            return None
+        self._held_frame = shared_frame
+        return Frame(shared_frame.sequence, shared_frame.timestamp, shared_frame.image)
+
+    def read(self, wait_new: bool = True, timeout: float = None):
+        """
+        :return (boolean, np.array): return value and frame (see read_frame())
+        """
+
+        frame = self.read_frame(wait_new=wait_new, timeout=timeout)
+        if frame is None:
+            return False, None
+        return True, frame.image
+
+    def release_reader(self):
+        """
+        Releases every frame of this reader process
+        """
+
+        self._check_process()
+        with self._condition:
+            if self._reader_index is not None:
+                self._readers[self._reader_index] = 0
+                self._reader_index = None
+        self._held_frame = None
+
+    def release_memory(self):
+        """
+        Closes the shared memory in this process, the creator also unlinks it.
+        The views of the frames should not be used after this call
+        """
+
+        self._header = self._slots = self._timestamps = self._readers = self._heartbeats = self._images = None
+        self._held_frame = None
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release_memory()
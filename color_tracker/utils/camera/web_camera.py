@@ -1,3 +1,7 @@
+import threading
+import time
+import warnings
+
 import cv2
 
 from color_tracker.utils.camera.base_camera import Camera
@@ -8,19 +12,49 @@ class WebCamera(Camera):
     Simple Webcamera
     """
 
-    def __init__(self, video_src=0, start: bool = False):
+    def __init__(self, video_src=0, start: bool = False, buffer_policy: str = "latest", buffer_size: int = 1,
+                 decode_on_demand: bool = False, target_fps: float = None, frame_stride: int = 1):
         """
         :param video_src (int): camera source code. It can be an integer or the name of the video file.
+        :param buffer_policy: policy of the frame buffer: "latest", "fifo" or "drop_oldest"
+        :param buffer_size: maximum number of the buffered frames for the "fifo" and "drop_oldest" policies
+        :param decode_on_demand: when it is True the camera thread only grabs the frames (which is cheap) and a frame
+        is decoded (and undistorted) only when a reader asks for one. In this mode the buffer policy is always "latest"
+        :param target_fps: (decode on demand mode) maximum rate of the decoded frames, None means no limit
+        :param frame_stride: (decode on demand mode) only every n-th grabbed frame can be decoded
         """
 
-        super().__init__()
+        if decode_on_demand:
+            buffer_policy = "latest"
+        super().__init__(buffer_policy=buffer_policy, buffer_size=buffer_size)
         self._video_src = video_src
 
+        self._decode_on_demand = decode_on_demand
+        self._target_fps = target_fps
+        self._frame_stride = max(1, frame_stride)
+        self._decode_requested = threading.Event()
+        self._nb_grabbed = 0
+        self._nb_decoded = 0
+        # The device is released by the capture thread when it did not stop within the timeout of release()
+        self._device_lock = threading.Lock()
+        self._is_capture_finished = True
+        self._release_device_on_exit = False
+
         if start:
             self.start_camera()
 
+    @property
+    def nb_grabbed_frames(self) -> int:
+        return self._nb_grabbed
+
+    @property
+    def nb_decoded_frames(self) -> int:
+        return self._nb_decoded
+
     def _init_camera(self):
         super()._init_camera()
+        self._is_capture_finished = False
+        self._release_device_on_exit = False
         self._cam = cv2.VideoCapture(self._video_src)
         self._ret, self._frame = self._cam.read()
         if not self._ret:
@@ -28,16 +62,86 @@ class WebCamera(Camera):
         self._frame_height, self._frame_width, c = self._frame.shape
         return self._ret
 
+    def _decode(self, decode_func):
+        # With a frame ring the frame is decoded (or undistorted) directly into a slot of the shared memory
+        slot_image = None if self._frame_ring is None else self._frame_ring.begin_write()
+        if self._auto_undistortion:
+            ret, frame = decode_func()
+            if ret:
+                frame = self._undistort_image(frame, dst=slot_image)
+        elif slot_image is not None:
+            ret, frame = decode_func(slot_image)
+        else:
+            ret, frame = decode_func()
+        return ret, frame
+
     def _read_from_camera(self):
         super()._read_from_camera()
-        self._ret, self._frame = self._cam.read()
+        self._ret, self._frame = self._decode(self._cam.read)
         if self._ret:
-            if self._auto_undistortion:
-                self._frame = self._undistort_image(self._frame)
             return True, self._frame
         else:
             return False, None
 
-    def release(self):
+    def _update_camera(self):
+        try:
+            if self._decode_on_demand:
+                self._grab_and_decode_on_demand()
+            else:
+                super()._update_camera()
+        finally:
+            with self._device_lock:
+                self._is_capture_finished = True
+                if self._release_device_on_exit:
+                    self._cam.release()
+
+    def _grab_and_decode_on_demand(self):
+        min_decode_interval = 0 if self._target_fps is None else 1.0 / self._target_fps
+        last_decode_time = 0
+
+        while self._is_running:
+            if not self._cam.grab():
+                self._ret = False
+                self._close_feed()
+                break
+            timestamp = time.time()
+            self._nb_grabbed += 1
+
+            if self._nb_grabbed % self._frame_stride != 0:
+                continue
+            if timestamp - last_decode_time < min_decode_interval:
+                continue
+            if not self._decode_requested.is_set():
+                continue
+
+            # A reader is waiting, so the frame is decoded right after it was grabbed
+            self._decode_requested.clear()
+            ret, frame = self._decode(self._cam.retrieve)
+            if not ret:
+                continue
+            self._ret, self._frame = True, frame
+            self._nb_decoded += 1
+            last_decode_time = timestamp
+            self._publish_frame(frame, timestamp)
+
+    def read_frame(self, wait_new: bool = False, timeout: float = None):
+        if self._decode_on_demand and self._is_running:
+            self._decode_requested.set()
+        return super().read_frame(wait_new=wait_new, timeout=timeout)
+
+    def release(self, timeout: float = 5.0):
+        """
+        Stops the camera and releases the device
+        :param timeout: maximum seconds to wait for the capture thread (e.g. when a read of the device hangs).
+        If it does not stop in time, the capture thread releases the device when it stops. None means no limit
+        """
+
         super().release()
+        self._join_capture_thread(timeout)
+        with self._device_lock:
+            if not self._is_capture_finished:
+                warnings.warn("The capture thread did not stop in {0} seconds, the camera is released when "
+                              "it stops".format(timeout))
+                self._release_device_on_exit = True
+                return
         self._cam.release()
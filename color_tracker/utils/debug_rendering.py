@@ -0,0 +1,151 @@
+import concurrent.futures
+import threading
+import time
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from color_tracker.utils import visualize
+
+
+class TrackSnapshot(NamedTuple):
+    # The data of a tracked object which is drawn (the names are the same as of TrackedObject)
+    id: int
+    last_bbox: Optional[np.ndarray]
+    point_history: np.ndarray
+
+
+def _resize_into(frame: np.ndarray, scale: float, buffer: Optional[np.ndarray]) -> np.ndarray:
+    if scale == 1:
+        if buffer is None or buffer.shape != frame.shape or buffer.dtype != frame.dtype:
+            buffer = np.empty_like(frame)
+        np.copyto(buffer, frame)
+        return buffer
+    size = (max(1, int(round(frame.shape[1] * scale))), max(1, int(round(frame.shape[0] * scale))))
+    if buffer is None or buffer.shape[:2] != (size[1], size[0]) or buffer.dtype != frame.dtype:
+        buffer = None
+    return cv2.resize(frame, size, dst=buffer, interpolation=cv2.INTER_AREA)
+
+
+class DebugRenderer(object):
+    """
+    Draws the debug frame (the tracked objects on the frame) only when it is requested.
+    The tracker marks every new frame with invalidate() and the overlay is drawn when debug_frame() is called, so
+    it costs nothing when the debug frame is never read. With max_fps the overlay is redrawn at most this many
+    times per second and the last drawn frame is returned in between.
+    In background mode the tracker submits the frames and the overlay is drawn on a separate thread: a frame is
+    only taken when the previous one is finished (and it is due), the rest is skipped, so the tracking never waits
+    for the drawing. debug_frame() then returns the last finished frame
+    """
+
+    def __init__(self, colors: Sequence[Tuple[int, int, int]], max_fps: float = None, scale: float = 1.0,
+                 background: bool = False):
+        """
+        :param colors: colors of the trajectories, the i-th tracked object gets the i-th color
+        :param max_fps: maximum number of drawn frames per second, None means no limit
+        :param scale: the debug frame is resized with this (e.g. 0.5 draws on a half resolution frame)
+        :param background: draw on a separate thread
+        """
+
+        if max_fps is not None and max_fps <= 0:
+            raise ValueError("max_fps should be larger than 0")
+        if scale <= 0:
+            raise ValueError("scale should be larger than 0")
+        self._colors = colors
+        self._min_interval = 1.0 / max_fps if max_fps is not None else 0.0
+        self._scale = scale
+        self._background = background
+
+        self._is_dirty = False
+        self._last_render_time = None
+        self._buffer = None
+        self._debug_frame = None
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = None
+
+    @property
+    def is_background(self) -> bool:
+        return self._background
+
+    def _is_due(self) -> bool:
+        return self._last_render_time is None or time.perf_counter() - self._last_render_time >= self._min_interval
+
+    def _snapshot(self, tracked_objects) -> List[TrackSnapshot]:
+        return [TrackSnapshot(obj.id, obj.last_bbox, obj.point_history) for obj in tracked_objects]
+
+    def _draw(self, image: np.ndarray, tracks) -> np.ndarray:
+        for i, track in enumerate(tracks):
+            color = self._colors[i % len(self._colors)]
+            visualize.draw_debug_frame_for_object(image, track, color, self._scale)
+        return image
+
+    def invalidate(self):
+        """
+        Marks that there is a new frame, so the debug frame should be drawn again
+        """
+
+        self._is_dirty = True
+
+    def debug_frame(self, frame: Optional[np.ndarray], tracked_objects) -> Optional[np.ndarray]:
+        """
+        :param frame: the current frame of the tracker
+        :param tracked_objects: the current tracked objects
+        :return: the debug frame. It is overwritten by the next drawing, so it should be copied to keep it
+        """
+
+        if self._background:
+            with self._lock:
+                return self._debug_frame
+        if self._is_dirty and frame is not None and self._is_due():
+            self._last_render_time = time.perf_counter()
+            self._buffer = _resize_into(frame, self._scale, self._buffer)
+            self._debug_frame = self._draw(self._buffer, tracked_objects)
+            self._is_dirty = False
+        return self._debug_frame
+
+    def submit(self, frame: Optional[np.ndarray], tracked_objects):
+        """
+        (background mode) Draws the frame on the background thread if the previous frame is finished and it is due,
+        otherwise the frame is skipped
+        """
+
+        if self._pending is not None and self._pending.done():
+            # An error of the drawing is raised on the tracking thread
+            self._pending.result()
+        if frame is None or (self._pending is not None and not self._pending.done()) or not self._is_due():
+            return
+        self._last_render_time = time.perf_counter()
+        # The frame and the tracks are copied, because the tracker goes on with the next frame
+        image = _resize_into(frame, self._scale, None)
+        tracks = self._snapshot(tracked_objects)
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1,
+                                                                   thread_name_prefix="color_tracker_debug")
+        self._pending = self._executor.submit(self._render_background, image, tracks)
+
+    def _render_background(self, image: np.ndarray, tracks: List[TrackSnapshot]):
+        self._draw(image, tracks)
+        with self._lock:
+            self._debug_frame = image
+
+    def clear(self):
+        """
+        Removes the debug frame (e.g. when there is no frame to draw on)
+        """
+
+        self._is_dirty = False
+        with self._lock:
+            self._debug_frame = None
+
+    def close(self):
+        """
+        Waits for the background drawing and stops its thread
+        """
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._pending = None
@@ -0,0 +1,193 @@
+from typing import NamedTuple, Tuple, Union
+
+import cv2
+import numpy as np
+
+DETECTION_BACKENDS = ("contours", "connected_components")
+
+
+class Detections(object):
+    """
+    Detected objects of a single frame stored as arrays (one row per object).
+    Objects are ordered by area in descending order.
+    Contours are extracted only when they are requested (when the detections come from a label image)
+    """
+
+    __slots__ = ("centers", "bboxes", "areas", "_contours", "_labels", "_label_ids", "_offset")
+
+    def __init__(self, centers: np.ndarray, bboxes: np.ndarray, areas: np.ndarray, contours: list = None,
+                 labels: np.ndarray = None, label_ids: np.ndarray = None, offset: Tuple[int, int] = (0, 0)):
+        """
+        :param centers: (N, 2) array of the object centers
+        :param bboxes: (N, 4) array of [x1, y1, x2, y2] bounding boxes
+        :param areas: (N,) array of the object areas
+        :param contours: contours of the objects, if they are already known
+        :param labels: label image from which the contours can be extracted
+        :param label_ids: label of every object in the label image (or an array of labels when an object
+        has several labels, e.g. it was merged from several strips)
+        :param offset: (x, y) offset of the label image in the frame
+        """
+
+        self.centers = centers
+        self.bboxes = bboxes
+        self.areas = areas
+        self._contours = list(contours) if contours is not None else [None] * len(centers)
+        self._labels = labels
+        self._label_ids = label_ids
+        self._offset = offset
+
+    def __len__(self):
+        return len(self.centers)
+
+    @staticmethod
+    def empty() -> "Detections":
+        return Detections(np.zeros((0, 2), dtype=np.int32), np.zeros((0, 4), dtype=np.int32),
+                          np.zeros((0,), dtype=np.float64))
+
+    def contour(self, index: int) -> np.ndarray:
+        """
+        Returns the contour of the object, it is extracted from the label image at the first call
+        :param index: index of the object
+        :return: contour in frame coordinates
+        """
+
+        if self._contours[index] is None and self._labels is not None:
+            self._contours[index] = _extract_contour(self._labels, self._label_ids[index], self.bboxes[index],
+                                                     self._offset)
+        return self._contours[index]
+
+    def detached_contour(self, index: int):
+        """
+        Contour of the object which does not keep the detections (and their label image) alive
+        :param index: index of the object
+        :return: the contour if it is already known, otherwise a ContourPatch (the label image cropped to the bbox
+        of the object) from which it can be extracted later
+        """
+
+        if self._contours[index] is not None or self._labels is None:
+            return self._contours[index]
+        x1, y1, x2, y2 = self.bboxes[index]
+        ox, oy = self._offset
+        return ContourPatch(self._labels[y1 - oy:y2 - oy, x1 - ox:x2 - ox].copy(), self._label_ids[index],
+                            (int(x1), int(y1)))
+
+    @property
+    def contours(self) -> list:
+        return [self.contour(i) for i in range(len(self))]
+
+    def translate(self, dx: int, dy: int) -> "Detections":
+        """
+        Moves the detections, e.g. from the coordinates of a region of interest to the frame coordinates
+        :param dx: shift along the x axis
+        :param dy: shift along the y axis
+        :return: the translated detections
+        """
+
+        if dx == 0 and dy == 0:
+            return self
+        shift = np.array([dx, dy], dtype=np.int32)
+        contours = [None if c is None else c + shift for c in self._contours]
+        return Detections(self.centers + shift, self.bboxes + np.tile(shift, 2), self.areas, contours,
+                          self._labels, self._label_ids, (self._offset[0] + dx, self._offset[1] + dy))
+
+
+class ContourPatch(NamedTuple):
+    """
+    Label image of an object cropped to its bbox, its contour is extracted only when it is requested
+    """
+
+    labels: np.ndarray
+    label_id: Union[int, np.ndarray]
+    # (x, y) of the top left corner of the patch in the frame
+    origin: Tuple[int, int]
+
+    def contour(self) -> np.ndarray:
+        return _extract_patch_contour(self.labels, self.label_id, self.origin)
+
+
+def _extract_patch_contour(object_labels: np.ndarray, label_id, origin: Tuple[int, int]) -> np.ndarray:
+    if np.ndim(label_id) == 0:
+        object_mask = (object_labels == label_id).astype(np.uint8)
+    else:
+        object_mask = np.isin(object_labels, label_id).astype(np.uint8)
+    contours = cv2.findContours(object_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=origin)[-2]
+    return max(contours, key=len)
+
+
+def _extract_contour(labels: np.ndarray, label_id: int, bbox: np.ndarray, offset: Tuple[int, int]) -> np.ndarray:
+    x1, y1, x2, y2 = bbox
+    ox, oy = offset
+    return _extract_patch_contour(labels[y1 - oy:y2 - oy, x1 - ox:x2 - ox], label_id, (int(x1), int(y1)))
+
+
+def _select_by_area(areas: np.ndarray, min_area: float, max_area: float, max_nb_of_objects: int) -> np.ndarray:
+    keep = np.flatnonzero((areas > min_area) & (areas < max_area))
+    order = keep[np.argsort(-areas[keep], kind="stable")]
+    if max_nb_of_objects is not None and max_nb_of_objects > 0:
+        order = order[:max_nb_of_objects]
+    return order
+
+
+def detect_connected_components(mask: np.ndarray, min_area: float = 0, max_area: float = np.inf,
+                                max_nb_of_objects: int = None) -> Detections:
+    """
+    Detects the objects on a binary mask with a single connected components pass.
+    The area is the number of pixels of the object and the center is the centroid of its pixels
+    :param mask: binary object mask
+    :param min_area: objects with smaller or equal area are dropped
+    :param max_area: objects with larger or equal area are dropped
+    :param max_nb_of_objects: keep only this many objects with the largest area. None means no limit
+    :return: detections
+    """
+
+    nb_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8, ltype=cv2.CV_32S)
+    # Label 0 is the background
+    areas = stats[1:, cv2.CC_STAT_AREA].astype(np.float64)
+    order = _select_by_area(areas, min_area, max_area, max_nb_of_objects)
+    label_ids = order + 1
+
+    x = stats[label_ids, cv2.CC_STAT_LEFT]
+    y = stats[label_ids, cv2.CC_STAT_TOP]
+    bboxes = np.stack([x, y, x + stats[label_ids, cv2.CC_STAT_WIDTH], y + stats[label_ids, cv2.CC_STAT_HEIGHT]],
+                      axis=1).astype(np.int32)
+    centers = centroids[label_ids].astype(np.int32)
+    return Detections(centers, bboxes, areas[order], labels=labels, label_ids=label_ids)
+
+
+def detect_contours(mask: np.ndarray, min_area: float = 0, max_area: float = np.inf,
+                    max_nb_of_objects: int = None) -> Detections:
+    """
+    Detects the objects on a binary mask with contour extraction.
+    The area is the area of the contour polygon and the center is calculated from the contour moments
+    :param mask: binary object mask
+    :param min_area: objects with smaller or equal area are dropped
+    :param max_area: objects with larger or equal area are dropped
+    :param max_nb_of_objects: keep only this many objects with the largest area. None means no limit
+    :return: detections
+    """
+
+    contours = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+    if len(contours) == 0:
+        return Detections.empty()
+
+    moments = [cv2.moments(c) for c in contours]
+    areas = np.abs(np.array([m["m00"] for m in moments], dtype=np.float64))
+    order = _select_by_area(areas, min_area, max_area, max_nb_of_objects)
+
+    centers = np.zeros((len(order), 2), dtype=np.int32)
+    bboxes = np.zeros((len(order), 4), dtype=np.int32)
+    for i, j in enumerate(order):
+        m = moments[j]
+        centers[i] = (int(m["m10"] / m["m00"]), int(m["m01"] / m["m00"]))
+        x, y, w, h = cv2.boundingRect(contours[j])
+        bboxes[i] = (x, y, x + w, y + h)
+    return Detections(centers, bboxes, areas[order], contours=[contours[j] for j in order])
+
+
+def detect_objects(mask: np.ndarray, backend: str = "contours", min_area: float = 0, max_area: float = np.inf,
+                   max_nb_of_objects: int = None) -> Detections:
+    if backend == "contours":
+        return detect_contours(mask, min_area, max_area, max_nb_of_objects)
+    if backend == "connected_components":
+        return detect_connected_components(mask, min_area, max_area, max_nb_of_objects)
+    raise ValueError("Unknown detection backend: {0}, use one of {1}".format(backend, DETECTION_BACKENDS))
@@ -3,6 +3,7 @@ from typing import List, Tuple, Union
 import cv2
 import numpy as np
 from scipy import optimize
+from scipy.spatial import distance
 
 from color_tracker.utils.tracker_object import TrackedObject
 
@@ -24,6 +25,37 @@ def crop_out_polygon_convex(image: np.ndarray, point_array: np.ndarray) -> np.nd
     return masked_image
 
 
+def create_polygon_roi(point_array: np.ndarray) -> Tuple[Tuple[int, int, int, int], np.ndarray]:
+    """
+    Creates the region of interest of a convex polygon given from a list of points.
+    It should be created only once and than it can be applied with apply_polygon_roi on every frame
+    :param point_array: list of points that defines a convex polygon
+    :return: bounding rectangle of the polygon as (x1, y1, x2, y2) and the 1 channel mask of that rectangle
+    """
+
+    point_array = np.asarray(point_array, dtype=np.int32).reshape(-1, 2)
+    hull = cv2.convexHull(point_array).reshape(-1, 2)
+    x, y, w, h = cv2.boundingRect(hull)
+    mask = np.zeros((h, w), dtype=np.uint8)
+    cv2.fillConvexPoly(mask, hull - np.array([x, y], dtype=np.int32), 255)
+    return (x, y, x + w, y + h), mask
+
+
+def clip_polygon_roi(image_shape: Tuple[int, ...], roi: Tuple[Tuple[int, int, int, int], np.ndarray]):
+    """
+    Clips the region of interest to the image
+    :param image_shape: shape of the image
+    :param roi: region of interest created with create_polygon_roi
+    :return: the clipped (x1, y1, x2, y2) rectangle and the mask of it
+    """
+
+    (x1, y1, x2, y2), mask = roi
+    h, w = image_shape[:2]
+    cx1, cy1, cx2, cy2 = max(x1, 0), max(y1, 0), min(x2, w), min(y2, h)
+    cx2, cy2 = max(cx1, cx2), max(cy1, cy2)
+    return (cx1, cy1, cx2, cy2), mask[cy1 - y1:cy2 - y1, cx1 - x1:cx2 - x1]
+
+
 def resize_img(image: np.ndarray, min_width: int, min_height: int) -> np.ndarray:
     """
     Resize the image with keeping the aspect ratio.
@@ -50,15 +82,40 @@ def resize_img(image: np.ndarray, min_width: int, min_height: int) -> np.ndarray
     return cv2.resize(image, (new_w, new_h))
 
 
+def create_undistortion_maps(camera_matrix: np.ndarray, distortion_coefficients: np.ndarray, width: int,
+                             height: int, crop_to_valid_roi: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Creates the remap tables of the undistortion for a given resolution
+    :param camera_matrix: camera matrix from the calibration
+    :param distortion_coefficients: distortion coefficients from the calibration
+    :param width: width of the distorted images
+    :param height: height of the distorted images
+    :param crop_to_valid_roi: the maps cover only the region which contains only valid pixels
+    :return: fixed point maps for cv2.remap
+    """
+
+    new_camera_matrix, roi = cv2.getOptimalNewCameraMatrix(camera_matrix, distortion_coefficients, (width, height), 1,
+                                                           (width, height))
+    # Fixed point maps are smaller and faster to apply than the floating point ones
+    map_1, map_2 = cv2.initUndistortRectifyMap(camera_matrix, distortion_coefficients, None, new_camera_matrix,
+                                               (width, height), cv2.CV_16SC2)
+    x, y, w, h = roi
+    if crop_to_valid_roi and w > 0 and h > 0:
+        # Only the pixels of the valid region are computed
+        map_1 = np.ascontiguousarray(map_1[y:y + h, x:x + w])
+        map_2 = np.ascontiguousarray(map_2[y:y + h, x:x + w])
+    return map_1, map_2
+
+
 def sort_contours_by_area(contours: np.ndarray, descending: bool = True) -> np.ndarray:
     if len(contours) > 0:
         contours = sorted(contours, key=cv2.contourArea, reverse=descending)
     return contours
 
 
-def filter_contours_by_area(contours: np.ndarray, min_area: float = 0, max_area: float = np.inf) -> np.ndarray:
+def filter_contours_by_area(contours: np.ndarray, min_area: float = 0, max_area: float = np.inf) -> list:
     if len(contours) == 0:
-        return np.array([])
+        return []
 
     def _keep_contour(c):
         area = cv2.contourArea(c)
@@ -68,7 +125,7 @@ def filter_contours_by_area(contours: np.ndarray, min_area: float = 0, max_area:
             return False
         return True
 
-    return np.array(list(filter(_keep_contour, contours)))
+    return list(filter(_keep_contour, contours))
 
 
 def get_contour_centers(contours: np.ndarray) -> np.ndarray:
@@ -90,12 +147,27 @@ def get_contour_centers(contours: np.ndarray) -> np.ndarray:
     return centers
 
 
-def find_object_contours(image: np.ndarray, hsv_lower_value: Union[Tuple[int], List[int]],
-                         hsv_upper_value: Union[Tuple[int], List[int]], kernel: np.ndarray):
+def segment_color(image: np.ndarray, hsv_lower_value: Union[Tuple[int], List[int]],
+                  hsv_upper_value: Union[Tuple[int], List[int]], kernel: np.ndarray = None) -> np.ndarray:
+    """
+    Creates the binary object mask of the pixels which are in the given HSV range
+    :param image: Opencv BGR image
+    :param hsv_lower_value: lowest acceptable hsv values
+    :param hsv_upper_value: highest acceptable hsv values
+    :param kernel: structuring element for the morphological closing of the mask
+    :return: mask with 255 for the object pixels and 0 elsewhere
+    """
+
     hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
     mask = cv2.inRange(hsv, tuple(hsv_lower_value), tuple(hsv_upper_value))
     if kernel is not None:
         mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=1)
+    return mask
+
+
+def find_object_contours(image: np.ndarray, hsv_lower_value: Union[Tuple[int], List[int]],
+                         hsv_upper_value: Union[Tuple[int], List[int]], kernel: np.ndarray):
+    mask = segment_color(image, hsv_lower_value, hsv_upper_value, kernel)
     return cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
 
 
@@ -107,15 +179,100 @@ def get_bbox_for_contours(contours: np.ndarray) -> np.ndarray:
     return np.array(bboxes)
 
 
-def calculate_distance_mtx(tracked_objects: List[TrackedObject], points: np.ndarray) -> np.ndarray:
-    # (nb_tracked_objects, nb_current_detected_points)
-    cost_mtx = np.zeros((len(tracked_objects), len(points)))
+DISTANCE_METRICS = ("euclidean", "squared", "iou")
+
+
+def get_last_points(tracked_objects: List[TrackedObject]) -> np.ndarray:
+    """
+    Collects the last points of the tracked objects
+    :param tracked_objects: tracked objects
+    :return: contiguous (N, 2) array of the last points
+    """
+
+    last_points = np.empty((len(tracked_objects), 2), dtype=np.float64)
+    for i, tracked_obj in enumerate(tracked_objects):
+        last_points[i] = tracked_obj.last_point
+    return last_points
+
+
+def get_last_bboxes(tracked_objects: List[TrackedObject]) -> np.ndarray:
+    """
+    Collects the last bounding boxes of the tracked objects. Objects without a bounding box get an empty one
+    :param tracked_objects: tracked objects
+    :return: contiguous (N, 4) array of the last bounding boxes
+    """
+
+    last_bboxes = np.zeros((len(tracked_objects), 4), dtype=np.float64)
     for i, tracked_obj in enumerate(tracked_objects):
-        for j, point in enumerate(points):
-            diff = tracked_obj.last_point - point
-            distance = np.sqrt(diff[0] ** 2 + diff[1] ** 2)
-            cost_mtx[i][j] = distance
-    return cost_mtx
+        if tracked_obj.last_bbox is not None:
+            last_bboxes[i] = tracked_obj.last_bbox
+    return last_bboxes
+
+
+def calculate_iou_mtx(bboxes_a: np.ndarray, bboxes_b: np.ndarray) -> np.ndarray:
+    """
+    Calculates the intersection over union for every pair of bounding boxes
+    :param bboxes_a: (N, 4) array of [x1, y1, x2, y2] boxes
+    :param bboxes_b: (M, 4) array of [x1, y1, x2, y2] boxes
+    :return: (N, M) IoU matrix
+    """
+
+    bboxes_a = np.asarray(bboxes_a, dtype=np.float64).reshape(-1, 4)
+    bboxes_b = np.asarray(bboxes_b, dtype=np.float64).reshape(-1, 4)
+
+    inter_w = np.minimum(bboxes_a[:, None, 2], bboxes_b[None, :, 2]) - np.maximum(bboxes_a[:, None, 0],
+                                                                                 bboxes_b[None, :, 0])
+    inter_h = np.minimum(bboxes_a[:, None, 3], bboxes_b[None, :, 3]) - np.maximum(bboxes_a[:, None, 1],
+                                                                                 bboxes_b[None, :, 1])
+    intersection = np.clip(inter_w, 0, None) * np.clip(inter_h, 0, None)
+
+    area_a = (bboxes_a[:, 2] - bboxes_a[:, 0]) * (bboxes_a[:, 3] - bboxes_a[:, 1])
+    area_b = (bboxes_b[:, 2] - bboxes_b[:, 0]) * (bboxes_b[:, 3] - bboxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+
+    iou = np.zeros_like(intersection)
+    np.divide(intersection, union, out=iou, where=union > 0)
+    return iou
+
+
+def calculate_distance_mtx_from_points(points_a: np.ndarray, points_b: np.ndarray,
+                                       metric: str = "euclidean") -> np.ndarray:
+    """
+    Calculates the cost matrix between two sets of points (or bounding boxes for the "iou" metric)
+    :param points_a: (N, 2) array of points, or (N, 4) array of boxes for "iou"
+    :param points_b: (M, 2) array of points, or (M, 4) array of boxes for "iou"
+    :param metric: "euclidean", "squared" (squared euclidean) or "iou" (1 - IoU of the boxes)
+    :return: (N, M) cost matrix
+    """
+
+    if metric == "iou":
+        return 1.0 - calculate_iou_mtx(points_a, points_b)
+
+    points_a = np.asarray(points_a, dtype=np.float64).reshape(-1, 2)
+    points_b = np.asarray(points_b, dtype=np.float64).reshape(-1, 2)
+    if len(points_a) == 0 or len(points_b) == 0:
+        return np.zeros((len(points_a), len(points_b)))
+
+    if metric == "euclidean":
+        return distance.cdist(points_a, points_b, "euclidean")
+    if metric == "squared":
+        return distance.cdist(points_a, points_b, "sqeuclidean")
+    raise ValueError("Unknown distance metric: {0}, use one of {1}".format(metric, DISTANCE_METRICS))
+
+
+def calculate_distance_mtx(tracked_objects: List[TrackedObject], points: np.ndarray,
+                           metric: str = "euclidean") -> np.ndarray:
+    """
+    Calculates the cost matrix between the tracked objects and the detections
+    :param tracked_objects: tracked objects
+    :param points: detected object centers, or detected bounding boxes for the "iou" metric
+    :param metric: "euclidean", "squared" or "iou"
+    :return: (nb_tracked_objects, nb_current_detected_points) cost matrix
+    """
+
+    if metric == "iou":
+        return calculate_distance_mtx_from_points(get_last_bboxes(tracked_objects), points, metric)
+    return calculate_distance_mtx_from_points(get_last_points(tracked_objects), points, metric)
 
 
 def solve_assignment(cost_mtx: np.ndarray) -> List[int]:
@@ -129,7 +286,8 @@ def solve_assignment(cost_mtx: np.ndarray) -> List[int]:
 
 def remove_object_if_too_many_frames_skipped(tracked_objects: List[TrackedObject], assignment: List[int],
                                              max_skipped_frames: int):
-    for i, tracked_obj in enumerate(tracked_objects):
-        if tracked_obj.skipped_frames > max_skipped_frames:
+    # Iterating backwards, so deleting an item does not shift the ones which are not checked yet
+    for i in reversed(range(len(tracked_objects))):
+        if tracked_objects[i].skipped_frames > max_skipped_frames:
             del tracked_objects[i]
             del assignment[i]
@@ -0,0 +1,174 @@
+import time
+from typing import Callable, Dict, Mapping, NamedTuple, Optional
+
+import numpy as np
+
+# "detection" is the whole segmentation and contour extraction when it runs in parallel (pipelined mode, strips,
+# video workers), otherwise it is split into "crop", "threshold", "morphology" and "contours"
+STAGES = ("read", "preprocess", "crop", "threshold", "morphology", "contours", "detection", "cost_matrix",
+          "assignment", "debug", "record", "callback")
+_STAGE_INDICES = {stage: i for i, stage in enumerate(STAGES)}
+
+
+class LatencyStats(NamedTuple):
+    """
+    Statistics of the times (in seconds) of the last frames
+    """
+
+    last: float
+    mean: float
+    p50: float
+    p95: float
+    p99: float
+
+
+class TrackerStats(NamedTuple):
+    """
+    Rolling statistics of the last frames of a tracker
+    """
+
+    nb_frames: int
+    # Number of frames which were captured but not tracked (camera buffer and pipeline drops)
+    nb_dropped: int
+    fps: float
+    # Time of the whole frame, from the reading to the end of the callback
+    latency: LatencyStats
+    stages: Mapping[str, LatencyStats]
+
+
+def _latency_stats(times: np.ndarray) -> LatencyStats:
+    p50, p95, p99 = np.percentile(times, (50, 95, 99))
+    return LatencyStats(float(times[-1]), float(times.mean()), float(p50), float(p95), float(p99))
+
+
+class Instrumentation(object):
+    """
+    Records the time of the stages of every frame into fixed size ring buffers.
+    The stage times are added with lap(), which costs a single time.perf_counter() call, the statistics are
+    computed only when they are requested (stats() or the exporter)
+    """
+
+    def __init__(self, window_size: int = 300):
+        """
+        :param window_size: the statistics are computed from this many last frames
+        """
+
+        self._window_size = max(2, window_size)
+        self._stage_times = np.zeros((self._window_size, len(STAGES)), dtype=np.float64)
+        self._latencies = np.zeros(self._window_size, dtype=np.float64)
+        self._end_times = np.zeros(self._window_size, dtype=np.float64)
+        self._measured_stages = np.zeros(len(STAGES), dtype=bool)
+        self._nb_frames = 0
+        self._nb_dropped = 0
+
+        self._current = np.zeros(len(STAGES), dtype=np.float64)
+        self._frame_start_time = None
+
+        self._exporter = None
+        self._export_interval = 1.0
+        self._last_export_time = 0.0
+
+    @property
+    def nb_frames(self) -> int:
+        return self._nb_frames
+
+    @property
+    def nb_dropped(self) -> int:
+        return self._nb_dropped
+
+    def set_exporter(self, exporter: Optional[Callable[[TrackerStats], None]], interval: float = 1.0):
+        """
+        :param exporter: called with the statistics at most once in every interval (on the tracking thread),
+        None removes the exporter
+        :param interval: minimum seconds between two exports
+        """
+
+        self._exporter = exporter
+        self._export_interval = interval
+
+    @property
+    def is_measuring_frame(self) -> bool:
+        """
+        True between begin_frame() and end_frame()
+        """
+
+        return self._frame_start_time is not None
+
+    def begin_frame(self, start_time: float = None) -> float:
+        """
+        Starts the measurement of a new frame if it is not started yet
+        :return: start time of the frame
+        """
+
+        if self._frame_start_time is None:
+            self._frame_start_time = time.perf_counter() if start_time is None else start_time
+        return self._frame_start_time
+
+    def add(self, stage: str, seconds: float):
+        """
+        Adds time to a stage of the current frame (a stage can be measured several times in a frame)
+        """
+
+        self._current[_STAGE_INDICES[stage]] += seconds
+
+    def lap(self, stage: str, start_time: float) -> float:
+        """
+        Adds the time since start_time to the stage
+        :return: the current time, which is the start time of the next stage
+        """
+
+        now = time.perf_counter()
+        self._current[_STAGE_INDICES[stage]] += now - start_time
+        return now
+
+    def add_dropped(self, nb_of_frames: int):
+        self._nb_dropped += nb_of_frames
+
+    def end_frame(self):
+        """
+        Stores the stage times of the current frame and calls the exporter when it is due
+        """
+
+        now = time.perf_counter()
+        if self._frame_start_time is None:
+            self._frame_start_time = now - self._current.sum()
+        row = self._nb_frames % self._window_size
+        self._stage_times[row] = self._current
+        self._measured_stages |= self._current > 0
+        self._latencies[row] = now - self._frame_start_time
+        self._end_times[row] = now
+        self._nb_frames += 1
+        self._current[:] = 0
+        self._frame_start_time = None
+
+        if self._exporter is not None and now - self._last_export_time >= self._export_interval:
+            self._last_export_time = now
+            self._exporter(self.stats())
+
+    def _window_rows(self) -> np.ndarray:
+        # Row indices of the frames of the window from the oldest to the newest
+        nb_of_rows = min(self._nb_frames, self._window_size)
+        return (np.arange(self._nb_frames - nb_of_rows, self._nb_frames)) % self._window_size
+
+    def stats(self) -> Optional[TrackerStats]:
+        """
+        :return: statistics of the frames in the window or None if there was no frame yet
+        """
+
+        if self._nb_frames == 0:
+            return None
+        rows = self._window_rows()
+        end_times = self._end_times[rows]
+        elapsed = end_times[-1] - end_times[0]
+        fps = (len(rows) - 1) / elapsed if elapsed > 0 else 0.0
+        stage_times = self._stage_times[rows]
+        stages: Dict[str, LatencyStats] = {stage: _latency_stats(stage_times[:, i]) for i, stage in enumerate(STAGES)
+                                           if self._measured_stages[i]}
+        return TrackerStats(self._nb_frames, self._nb_dropped, fps, _latency_stats(self._latencies[rows]), stages)
+
+    def reset(self):
+        self._measured_stages[:] = False
+        self._nb_frames = 0
+        self._nb_dropped = 0
+        self._current[:] = 0
+        self._frame_start_time = None
@@ -0,0 +1,153 @@
+import math
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+from color_tracker.utils.region_detection import Region
+
+
+# The thumbnail is always downscaled at least this much, otherwise the comparison costs about as much as the
+# segmentation of the frame
+MIN_CELL_SIZE = 4
+
+
+def cell_size_for_area(min_area: float) -> int:
+    """
+    Size of the thumbnail cells for the smallest objects. The side of a cell is a quarter of the side of the
+    smallest object, so a moving object changes a large part of the cells at its border and the change is
+    not averaged away by the background (the detection does not depend on the size of the tiles).
+    It is rounded down to a power of two (the thumbnail is made by halving the frame) and it is at least
+    MIN_CELL_SIZE (e.g. when there is no minimum area)
+    :param min_area: minimum area of the objects in pixels
+    :return: side of a cell in pixels
+    """
+
+    cell_size = max(1, int(math.sqrt(max(min_area or 0, 0)) / 4))
+    return max(MIN_CELL_SIZE, 2 ** int(math.log2(cell_size)))
+
+
+class ChangeDetector(object):
+    """
+    Cheap change detector: the frame is downscaled to a color thumbnail (a pixel is the average of a cell of
+    cell_size x cell_size pixels) and it is compared to the reference thumbnail. A tile is changed when any
+    channel of any of its cells changed more than the threshold. The reference of a tile is only refreshed when
+    the tile is processed, so slow changes accumulate until they are detected
+    """
+
+    def __init__(self, threshold: float = 10, grid: Tuple[int, int] = (8, 8), cell_size: int = 4):
+        """
+        :param threshold: a tile is changed when a channel of a thumbnail pixel changed more than this (0-255)
+        :param grid: number of (rows, columns) of the tiles
+        :param cell_size: side of a thumbnail cell in image pixels (see cell_size_for_area)
+        """
+
+        self._threshold = threshold
+        self._grid = grid
+        self._cell_size = max(1, int(cell_size))
+        self._reference = None
+        self._thumbnail = None
+        self._image_shape = None
+        self._tile_rows = None
+        self._tile_cols = None
+
+    @property
+    def grid(self) -> Tuple[int, int]:
+        return self._grid
+
+    @property
+    def cell_size(self) -> int:
+        return self._cell_size
+
+    def set_cell_size(self, cell_size: int):
+        self._cell_size = max(1, int(cell_size))
+        self.reset()
+
+    def reset(self):
+        self._reference = None
+        self._thumbnail = None
+        self._image_shape = None
+
+    def _create_thumbnail(self, image: np.ndarray) -> np.ndarray:
+        h, w = image.shape[:2]
+        size = (max(1, -(-w // self._cell_size)), max(1, -(-h // self._cell_size)))
+        if size == (w, h):
+            return image.copy()
+        # INTER_AREA is several times faster for halving than for other factors, so the image is halved while
+        # the rest of the cell size is even
+        factor = self._cell_size
+        while factor % 2 == 0:
+            h, w = image.shape[:2]
+            image = cv2.resize(image, (max(1, -(-w // 2)), max(1, -(-h // 2))), interpolation=cv2.INTER_AREA)
+            factor //= 2
+        if image.shape[1::-1] != size:
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        return image
+
+    def _init_tile_cells(self, image_shape: Tuple[int, ...]):
+        # (start, end) thumbnail rows and columns of the tiles. A cell on the border of two tiles belongs to the
+        # first one, the neighbours of a changed tile are processed anyway
+        rows, cols = self._grid
+        h, w = image_shape[:2]
+        thumbnail_h, thumbnail_w = self._thumbnail.shape[:2]
+        row_bounds = [min(-(-i * h // rows // self._cell_size), thumbnail_h) for i in range(rows + 1)]
+        col_bounds = [min(-(-j * w // cols // self._cell_size), thumbnail_w) for j in range(cols + 1)]
+        row_bounds[-1], col_bounds[-1] = thumbnail_h, thumbnail_w
+        self._tile_rows = list(zip(row_bounds[:-1], row_bounds[1:]))
+        self._tile_cols = list(zip(col_bounds[:-1], col_bounds[1:]))
+
+    def detect(self, image: np.ndarray) -> np.ndarray:
+        """
+        :param image: BGR image
+        :return: (rows, columns) boolean array of the changed tiles. Every tile is changed at the first call
+        or when the size of the image changes. The neighbours of the changed tiles are also marked, because an
+        object which moves into a tile can change its average only a little
+        """
+
+        self._thumbnail = self._create_thumbnail(image)
+        if self._reference is None or self._image_shape != image.shape:
+            self._reference = self._thumbnail.copy()
+            self._image_shape = image.shape
+            self._init_tile_cells(image.shape)
+            return np.ones(self._grid, dtype=bool)
+
+        difference = cv2.absdiff(self._thumbnail, self._reference)
+        # The channels are interleaved in a row, so the maximum of a tile covers every channel
+        nb_of_channels = difference.shape[2] if difference.ndim == 3 else 1
+        difference = difference.reshape(difference.shape[0], -1)
+        changed_tiles = np.zeros(self._grid, dtype=np.uint8)
+        for i, (r1, r2) in enumerate(self._tile_rows):
+            for j, (c1, c2) in enumerate(self._tile_cols):
+                # Tiles which are smaller than a cell have no cell of their own, they are covered by the dilation
+                if r2 > r1 and c2 > c1:
+                    tile = difference[r1:r2, c1 * nb_of_channels:c2 * nb_of_channels]
+                    changed_tiles[i, j] = cv2.minMaxLoc(tile)[1] > self._threshold
+        return cv2.dilate(changed_tiles, np.ones((3, 3), dtype=np.uint8)) > 0
+
+    def update_reference(self, tiles: np.ndarray):
+        """
+        Refreshes the reference of the processed tiles with the last thumbnail
+        :param tiles: (rows, columns) boolean array of the processed tiles
+        """
+
+        for i, j in zip(*np.nonzero(tiles)):
+            (r1, r2), (c1, c2) = self._tile_rows[i], self._tile_cols[j]
+            self._reference[r1:r2, c1:c2] = self._thumbnail[r1:r2, c1:c2]
+
+    def tile_regions(self, image_shape: Tuple[int, ...], tiles: np.ndarray) -> List[Region]:
+        """
+        :param image_shape: shape of the image
+        :param tiles: (rows, columns) boolean array of the tiles
+        :return: disjoint (x1, y1, x2, y2) rectangles of the selected tiles in image coordinates,
+        the neighbouring tiles of a row are merged into a single rectangle
+        """
+
+        h, w = image_shape[:2]
+        rows, cols = self._grid
+        regions = []
+        for i in range(rows):
+            # Start and end columns of the runs of selected tiles in this row
+            edges = np.diff(np.concatenate(([0], tiles[i].astype(np.int8), [0])))
+            for start, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+                regions.append((start * w // cols, i * h // rows, end * w // cols, (i + 1) * h // rows))
+        return regions
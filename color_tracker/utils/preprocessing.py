@@ -0,0 +1,177 @@
+from typing import Callable, List, Tuple, Union
+
+import cv2
+import numpy as np
+
+from color_tracker.utils import helpers
+
+
+class PreprocessingStage(object):
+    """
+    Base class of the preprocessing stages. A stage writes its output into a buffer which is allocated once
+    per resolution, so in the steady state no new images are allocated.
+    The returned image is overwritten by the next call, it should be copied if it is needed later
+    """
+
+    def __init__(self):
+        self._buffer = None
+
+    def _get_buffer(self, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        if self._buffer is None or self._buffer.shape != tuple(shape) or self._buffer.dtype != dtype:
+            self._buffer = np.empty(shape, dtype=dtype)
+        return self._buffer
+
+    def process(self, image: np.ndarray) -> np.ndarray:
+        raise NotImplementedError()
+
+    def __call__(self, image: np.ndarray) -> np.ndarray:
+        return self.process(image)
+
+
+class FunctionStage(PreprocessingStage):
+    """
+    Wraps a plain image -> image function, its output is not buffered
+    """
+
+    def __init__(self, func: Callable[[np.ndarray], np.ndarray]):
+        super().__init__()
+        self._func = func
+
+    def process(self, image: np.ndarray) -> np.ndarray:
+        return self._func(image)
+
+
+class FlipStage(PreprocessingStage):
+    def __init__(self, flip_code: int = 1):
+        """
+        :param flip_code: 0 flips around the x axis, 1 around the y axis (horizontal flip), -1 around both
+        """
+
+        super().__init__()
+        self._flip_code = flip_code
+
+    def process(self, image: np.ndarray) -> np.ndarray:
+        return cv2.flip(image, self._flip_code, dst=self._get_buffer(image.shape, image.dtype))
+
+
+class UndistortStage(PreprocessingStage):
+    def __init__(self, camera_matrix: np.ndarray, distortion_coefficients: np.ndarray,
+                 crop_to_valid_roi: bool = False):
+        """
+        :param camera_matrix: camera matrix from the calibration
+        :param distortion_coefficients: distortion coefficients from the calibration
+        :param crop_to_valid_roi: crop the undistorted frames to the region which contains only valid pixels
+        """
+
+        super().__init__()
+        self._camera_matrix = camera_matrix
+        self._distortion_coefficients = distortion_coefficients
+        self._crop_to_valid_roi = crop_to_valid_roi
+        self._maps = None
+
+    def process(self, image: np.ndarray) -> np.ndarray:
+        h, w = image.shape[:2]
+        if self._maps is None or self._maps[0] != (w, h):
+            self._maps = ((w, h),) + helpers.create_undistortion_maps(self._camera_matrix,
+                                                                      self._distortion_coefficients, w, h,
+                                                                      self._crop_to_valid_roi)
+        _, map_1, map_2 = self._maps
+        dst = self._get_buffer(map_1.shape[:2] + image.shape[2:], image.dtype)
+        return cv2.remap(image, map_1, map_2, cv2.INTER_LINEAR, dst=dst)
+
+
+class CropStage(PreprocessingStage):
+    def __init__(self, x1: int, y1: int, x2: int, y2: int):
+        """
+        Crops a rectangle from the image. The crop is a view of the input, so it does not copy the pixels
+        """
+
+        super().__init__()
+        self._rectangle = (x1, y1, x2, y2)
+
+    def process(self, image: np.ndarray) -> np.ndarray:
+        h, w = image.shape[:2]
+        x1, y1, x2, y2 = self._rectangle
+        x1, y1 = min(max(x1, 0), w), min(max(y1, 0), h)
+        x2, y2 = min(max(x2, x1), w), min(max(y2, y1), h)
+        return image[y1:y2, x1:x2]
+
+
+class ColorConvertStage(PreprocessingStage):
+    def __init__(self, code: int):
+        """
+        :param code: OpenCV color conversion code (e.g. cv2.COLOR_RGB2BGR)
+        """
+
+        super().__init__()
+        self._code = code
+        self._input_shape = None
+
+    def process(self, image: np.ndarray) -> np.ndarray:
+        if self._buffer is None or self._input_shape != image.shape:
+            # The output shape is known only after the first conversion of this resolution
+            self._buffer = cv2.cvtColor(image, self._code)
+            self._input_shape = image.shape
+            return self._buffer
+        return cv2.cvtColor(image, self._code, dst=self._buffer)
+
+
+class ThresholdStage(PreprocessingStage):
+    def __init__(self, lower_value: Union[List[int], np.ndarray], upper_value: Union[List[int], np.ndarray]):
+        """
+        Creates the mask of the pixels which are in the [lower_value, upper_value] range
+        """
+
+        super().__init__()
+        self._lower_value = np.asarray(lower_value)
+        self._upper_value = np.asarray(upper_value)
+
+    def process(self, image: np.ndarray) -> np.ndarray:
+        return cv2.inRange(image, self._lower_value, self._upper_value,
+                           dst=self._get_buffer(image.shape[:2], np.uint8))
+
+
+class MorphologyStage(PreprocessingStage):
+    def __init__(self, kernel: np.ndarray, operation: int = cv2.MORPH_CLOSE, iterations: int = 1):
+        """
+        :param kernel: structuring element
+        :param operation: OpenCV morphological operation (e.g. cv2.MORPH_OPEN)
+        :param iterations: number of times the operation is applied
+        """
+
+        super().__init__()
+        self._kernel = kernel
+        self._operation = operation
+        self._iterations = iterations
+
+    def process(self, image: np.ndarray) -> np.ndarray:
+        return cv2.morphologyEx(image, self._operation, self._kernel, dst=self._get_buffer(image.shape, image.dtype),
+                                iterations=self._iterations)
+
+
+class PreprocessingPipeline(object):
+    """
+    Runs the stages one after the other. It is callable, so it can be used as a frame preprocessor
+    """
+
+    def __init__(self, stages: List[Union[PreprocessingStage, Callable[[np.ndarray], np.ndarray]]] = None):
+        self._stages = []
+        for stage in stages or []:
+            self.append(stage)
+
+    @property
+    def stages(self) -> List[PreprocessingStage]:
+        return list(self._stages)
+
+    def append(self, stage: Union[PreprocessingStage, Callable[[np.ndarray], np.ndarray]]):
+        if not isinstance(stage, PreprocessingStage):
+            stage = FunctionStage(stage)
+        self._stages.append(stage)
+
+    def process(self, image: np.ndarray) -> np.ndarray:
+        for stage in self._stages:
+            image = stage.process(image)
+        return image
+
+    def __call__(self, image: np.ndarray) -> np.ndarray:
+        return self.process(image)
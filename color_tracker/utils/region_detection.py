@@ -0,0 +1,187 @@
+import math
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+from color_tracker.utils import detection
+
+Region = Tuple[int, int, int, int]
+
+
+def clip_region(region: Region, width: int, height: int) -> Region:
+    x1, y1, x2, y2 = region
+    x1, y1 = min(max(int(x1), 0), width), min(max(int(y1), 0), height)
+    x2, y2 = min(max(int(x2), x1), width), min(max(int(y2), y1), height)
+    return x1, y1, x2, y2
+
+
+def region_area(region: Region) -> int:
+    x1, y1, x2, y2 = region
+    return (x2 - x1) * (y2 - y1)
+
+
+def padded_area(regions: List[Region], padding: int, width: int, height: int) -> int:
+    """
+    :return: number of pixels which segment_regions processes for the regions with the padding
+    """
+
+    return sum(region_area(clip_region((x1 - padding, y1 - padding, x2 + padding, y2 + padding), width, height))
+               for x1, y1, x2, y2 in regions if x2 > x1 and y2 > y1)
+
+
+def merge_overlapping_regions(regions: List[Region]) -> List[Region]:
+    """
+    Merges the overlapping rectangles, so no pixel is processed twice
+    :param regions: list of (x1, y1, x2, y2) rectangles
+    :return: list of disjoint rectangles which cover the input rectangles
+    """
+
+    regions = [r for r in regions if region_area(r) > 0]
+    merged = True
+    while merged and len(regions) > 1:
+        merged = False
+        result = []
+        for region in regions:
+            for i, other in enumerate(result):
+                if region[0] < other[2] and other[0] < region[2] and region[1] < other[3] and other[1] < region[3]:
+                    result[i] = (min(region[0], other[0]), min(region[1], other[1]),
+                                 max(region[2], other[2]), max(region[3], other[3]))
+                    merged = True
+                    break
+            else:
+                result.append(region)
+        regions = result
+    return regions
+
+
+def segment_regions(segmenter, image: np.ndarray, regions: List[Region], masks: List[np.ndarray],
+                    padding: int = 0) -> int:
+    """
+    Segments only the given regions of the image and writes the results into the full size masks
+    :param segmenter: segmenter of the color classes (e.g. HSVSegmenter)
+    :param image: BGR image
+    :param regions: disjoint (x1, y1, x2, y2) rectangles
+    :param masks: full size mask for every color class
+    :param padding: the regions are segmented with this much padding but only the regions are written into
+    the masks. With the size of the morphology kernel the written pixels are the same as in a full frame segmentation
+    :return: number of the processed pixels
+    """
+
+    h, w = image.shape[:2]
+    nb_of_pixels = 0
+    for x1, y1, x2, y2 in regions:
+        if x2 <= x1 or y2 <= y1:
+            continue
+        px1, py1, px2, py2 = clip_region((x1 - padding, y1 - padding, x2 + padding, y2 + padding), w, h)
+        region_masks = segmenter.segment(image[py1:py2, px1:px2])
+        for mask, region_mask in zip(masks, region_masks):
+            mask[y1:y2, x1:x2] = region_mask[y1 - py1:y2 - py1, x1 - px1:x2 - px1]
+        nb_of_pixels += (px2 - px1) * (py2 - py1)
+    return nb_of_pixels
+
+
+def choose_detection_scale(min_area: float, target_min_area: float = 64, min_scale: float = 0.125) -> float:
+    """
+    Chooses the scale of the coarse detection frame, so the smallest object still has about
+    target_min_area pixels on it. Power of two scales are used
+    :param min_area: minimum area of the objects at full resolution
+    :param target_min_area: minimum area of the objects on the coarse frame
+    :param min_scale: the coarse frame is never smaller than this
+    :return: scale in (0, 1], 1 means there is no coarse detection
+    """
+
+    if min_area is None or min_area <= target_min_area:
+        return 1.0
+    scale = math.sqrt(target_min_area / float(min_area))
+    scale = 2.0 ** math.floor(math.log2(scale))
+    return max(scale, min_scale)
+
+
+def find_candidate_regions(segmenter, image: np.ndarray, scale: float, min_area: float, padding: int) -> List[Region]:
+    """
+    Finds the regions of the objects on a downscaled copy of the image
+    :param segmenter: segmenter of the color classes
+    :param image: BGR image
+    :param scale: scale of the downscaled image
+    :param min_area: minimum area of the objects at full resolution
+    :param padding: padding of the regions in full resolution pixels
+    :return: disjoint regions in full resolution coordinates
+    """
+
+    h, w = image.shape[:2]
+    small_image = cv2.resize(image, (max(1, int(round(w * scale))), max(1, int(round(h * scale)))),
+                             interpolation=cv2.INTER_AREA)
+    regions = []
+    for mask in segmenter.segment(small_image):
+        # The area can shrink a bit on the downscaled image, so the threshold is lenient
+        detections = detection.detect_connected_components(mask, min_area=min_area * scale * scale * 0.5)
+        for x1, y1, x2, y2 in detections.bboxes / scale:
+            regions.append(clip_region((math.floor(x1) - padding, math.floor(y1) - padding,
+                                        math.ceil(x2) + padding, math.ceil(y2) + padding), w, h))
+    return merge_overlapping_regions(regions)
+
+
+class CoarseToFineBuffers(object):
+    """
+    Full size masks which are reused by segment_coarse_to_fine() from frame to frame. Only the regions which were
+    written at the previous frame are cleared, not the whole masks
+    """
+
+    def __init__(self):
+        self.masks = None
+        self.regions = []
+
+    def get(self, shape: Tuple[int, ...], nb_of_masks: int) -> List[np.ndarray]:
+        """
+        :param shape: shape of the image
+        :param nb_of_masks: number of the color classes
+        :return: zero masks, they are overwritten by the next call
+        """
+
+        h, w = shape[:2]
+        if self.masks is None or len(self.masks) != nb_of_masks or self.masks[0].shape != (h, w):
+            self.masks = [np.zeros((h, w), dtype=np.uint8) for _ in range(nb_of_masks)]
+        else:
+            for x1, y1, x2, y2 in self.regions:
+                for mask in self.masks:
+                    mask[y1:y2, x1:x2] = 0
+        self.regions = []
+        return self.masks
+
+
+def segment_coarse_to_fine(segmenter, image: np.ndarray, min_area: float, kernel: np.ndarray = None,
+                           target_min_area: float = 64,
+                           buffers: CoarseToFineBuffers = None) -> Tuple[List[np.ndarray], int]:
+    """
+    Segments a downscaled copy of the image to find the candidate regions of the objects, than segments only
+    these regions at full resolution. The other pixels of the masks are 0.
+    For objects which are fully inside their padded candidate region the masks (so the centers, bboxes and
+    areas) are the same as the full resolution segmentation. The padding covers the downscaling
+    error and the reach of the morphology kernel
+    :param segmenter: segmenter of the color classes
+    :param image: BGR image
+    :param min_area: minimum area of the objects at full resolution
+    :param kernel: structuring element of the segmenter
+    :param target_min_area: minimum area of the objects on the coarse frame
+    :param buffers: the masks are written into these buffers (so they are overwritten by the next call with the
+    same buffers), None means new masks
+    :return: full size mask for every color class and the number of processed full resolution pixels
+    """
+
+    h, w = image.shape[:2]
+    scale = choose_detection_scale(min_area, target_min_area)
+    if scale >= 1.0:
+        return segmenter.segment(image), h * w
+
+    kernel_size = 0 if kernel is None else max(kernel.shape[:2])
+    padding = int(math.ceil(2.0 / scale)) + kernel_size
+    regions = find_candidate_regions(segmenter, image, scale, min_area, padding)
+
+    if buffers is None:
+        masks = [np.zeros((h, w), dtype=np.uint8) for _ in segmenter.color_classes]
+    else:
+        masks = buffers.get(image.shape, len(segmenter.color_classes))
+        buffers.regions = regions
+    nb_of_pixels = segment_regions(segmenter, image, regions, masks)
+    return masks, nb_of_pixels
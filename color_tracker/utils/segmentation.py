@@ -0,0 +1,376 @@
+import copy
+import hashlib
+import os
+import time
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+
+# OpenCV stores the hue of 8 bit images in the [0, 179] range
+MAX_HUE = 179
+
+HSVValue = Union[np.ndarray, List[int], Tuple[int, int, int]]
+
+
+class ColorClass(NamedTuple):
+    """
+    Named color which is defined by one or more HSV ranges
+    """
+
+    name: str
+    hsv_ranges: Tuple[Tuple[Tuple[int, int, int], Tuple[int, int, int]], ...]
+
+
+def split_hue_wrap_around(hsv_lower_value: HSVValue, hsv_upper_value: HSVValue) -> list:
+    """
+    When the lower hue is larger than the upper one (e.g. red: 170 -> 10), the range wraps around
+    and it is split into two ranges: [lower hue, 179] and [0, upper hue]
+    :param hsv_lower_value: lowest acceptable hsv values
+    :param hsv_upper_value: highest acceptable hsv values
+    :return: list of (lower, upper) ranges
+    """
+
+    lower = tuple(int(x) for x in hsv_lower_value)
+    upper = tuple(int(x) for x in hsv_upper_value)
+    if lower[0] <= upper[0]:
+        return [(lower, upper)]
+    return [(lower, (MAX_HUE, upper[1], upper[2])), ((0, lower[1], lower[2]), upper)]
+
+
+def create_color_class(name: str, hsv_ranges: Sequence[Tuple[HSVValue, HSVValue]]) -> ColorClass:
+    """
+    :param name: name of the color class
+    :param hsv_ranges: list of (hsv_lower_value, hsv_upper_value) pairs
+    :return: color class with the wrap around hue ranges split
+    """
+
+    ranges = []
+    for hsv_lower_value, hsv_upper_value in hsv_ranges:
+        ranges.extend(split_hue_wrap_around(hsv_lower_value, hsv_upper_value))
+    return ColorClass(name, tuple(ranges))
+
+
+def create_color_classes(color_classes) -> List[ColorClass]:
+    """
+    :param color_classes: dict of name -> list of (hsv_lower_value, hsv_upper_value) pairs, or list of ColorClass
+    :return: list of color classes
+    """
+
+    if isinstance(color_classes, dict):
+        return [create_color_class(name, ranges) for name, ranges in color_classes.items()]
+    return [create_color_class(c.name, c.hsv_ranges) for c in color_classes]
+
+
+def threshold_hsv(hsv_image: np.ndarray, color_class: ColorClass, mask: np.ndarray = None,
+                  range_mask: np.ndarray = None) -> np.ndarray:
+    """
+    Creates the mask of the pixels which are in any of the HSV ranges of the color class
+    :param hsv_image: HSV image
+    :param color_class: color class
+    :param mask: output mask, it is allocated when it is None
+    :param range_mask: buffer for the mask of a single range when there are several ranges,
+    it is allocated when it is None
+    :return: mask with 255 for the pixels of the color class and 0 elsewhere
+    """
+
+    first_lower, first_upper = color_class.hsv_ranges[0]
+    mask = cv2.inRange(hsv_image, first_lower, first_upper, dst=mask)
+    if len(color_class.hsv_ranges) > 1:
+        if range_mask is None:
+            range_mask = np.empty_like(mask)
+        for hsv_lower_value, hsv_upper_value in color_class.hsv_ranges[1:]:
+            cv2.inRange(hsv_image, hsv_lower_value, hsv_upper_value, dst=range_mask)
+            cv2.bitwise_or(mask, range_mask, dst=mask)
+    return mask
+
+
+def _fits(buffer: Optional[np.ndarray], h: int, w: int) -> bool:
+    return buffer is not None and buffer.shape[0] >= h and buffer.shape[1] >= w
+
+
+def _capacity(buffer: Optional[np.ndarray], h: int, w: int) -> Tuple[int, int]:
+    # The buffers only grow, so the regions of a frame (search windows, tiles) reuse the buffers of the full frame
+    if buffer is None:
+        return h, w
+    return max(buffer.shape[0], h), max(buffer.shape[1], w)
+
+
+class _MaskBuffers(object):
+    """
+    Output masks and temporary buffers of a segmenter. They are allocated for the largest image so far and a
+    smaller image gets views of their top left corner, so they are not reallocated when the image size changes
+    """
+
+    def __init__(self, capacity: Tuple[int, int], nb_of_masks: int):
+        self._masks = [np.empty(capacity, dtype=np.uint8) for _ in range(nb_of_masks)]
+        self._threshold = np.empty(capacity, dtype=np.uint8)
+        self._range_mask = np.empty(capacity, dtype=np.uint8)
+        self.masks = self._masks
+        self.threshold = self._threshold
+        self.range_mask = self._range_mask
+
+    def fits(self, h: int, w: int) -> bool:
+        return _fits(self._threshold, h, w)
+
+    @staticmethod
+    def get(buffers: Optional["_MaskBuffers"], h: int, w: int, nb_of_masks: int) -> "_MaskBuffers":
+        """
+        :return: the buffers (or new larger buffers if they are too small) with views of (h, w) size
+        """
+
+        if buffers is None or not buffers.fits(h, w):
+            buffers = _MaskBuffers(_capacity(None if buffers is None else buffers._threshold, h, w), nb_of_masks)
+        buffers.masks = [mask[:h, :w] for mask in buffers._masks]
+        buffers.threshold = buffers._threshold[:h, :w]
+        buffers.range_mask = buffers._range_mask[:h, :w]
+        return buffers
+
+
+def _close_mask(mask: np.ndarray, kernel: np.ndarray, buffers: _MaskBuffers) -> np.ndarray:
+    if kernel is None:
+        return mask
+    return cv2.morphologyEx(buffers.threshold, cv2.MORPH_CLOSE, kernel, dst=mask, iterations=1)
+
+
+class HSVSegmenter(object):
+    """
+    Segments every color class from a single HSV conversion of the frame.
+    The HSV image and the masks are written into buffers which are reused for every image size (they grow to the
+    largest image), so the returned masks are overwritten by the next call
+    """
+
+    def __init__(self, color_classes: List[ColorClass], kernel: np.ndarray = None):
+        self._color_classes = list(color_classes)
+        self._kernel = kernel
+        self._hsv = None
+        self._buffers = None
+        self._stage_timer = None
+
+    @property
+    def color_classes(self) -> List[ColorClass]:
+        return self._color_classes
+
+    def set_stage_timer(self, stage_timer):
+        """
+        :param stage_timer: Instrumentation which gets the time of the "threshold" and "morphology" stages,
+        None means no measurement
+        """
+
+        self._stage_timer = stage_timer
+
+    def segment(self, image: np.ndarray) -> List[np.ndarray]:
+        """
+        :param image: BGR image
+        :return: binary mask for every color class
+        """
+
+        timer = self._stage_timer
+        start_time = time.perf_counter() if timer is not None else 0.0
+        h, w = image.shape[:2]
+        buffers = self._buffers = _MaskBuffers.get(self._buffers, h, w, len(self._color_classes))
+        if not _fits(self._hsv, h, w):
+            self._hsv = np.empty(_capacity(self._hsv, h, w) + (3,), dtype=np.uint8)
+
+        hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV, dst=self._hsv[:h, :w])
+        for color_class, mask in zip(self._color_classes, buffers.masks):
+            # With a kernel the threshold goes to a temporary buffer and the closing writes the mask
+            threshold_mask = mask if self._kernel is None else buffers.threshold
+            threshold_hsv(hsv_image, color_class, threshold_mask, buffers.range_mask)
+            if timer is not None:
+                start_time = timer.lap("threshold", start_time)
+            _close_mask(mask, self._kernel, buffers)
+            if timer is not None:
+                start_time = timer.lap("morphology", start_time)
+        return list(buffers.masks)
+
+    def copy(self) -> "HSVSegmenter":
+        """
+        :return: segmenter with the same color classes and its own buffers (e.g. for another thread)
+        """
+
+        return HSVSegmenter(self._color_classes, self._kernel)
+
+
+def _channel_mask(bits_per_channel: int) -> int:
+    # Mask of the quantized B, G and R bytes in a packed little endian BGRA pixel
+    channel_max = 0xFF >> (8 - bits_per_channel)
+    return channel_max | (channel_max << 8) | (channel_max << 16)
+
+
+def build_label_lut(color_classes: List[ColorClass], bits_per_channel: int = 8) -> np.ndarray:
+    """
+    Compiles the HSV ranges of the color classes into a lookup table which is indexed with the packed
+    (quantized) BGR value of a pixel: b | g << 8 | r << 16. The value of the table is 0 for the background
+    and i + 1 for the i-th color class (the first matching class wins)
+    :param color_classes: color classes
+    :param bits_per_channel: number of bits of a channel in the index. With less than 8 bits the table is
+    smaller but every quantization bin gets the label of its center color
+    :return: lookup table
+    """
+
+    shift = 8 - bits_per_channel
+    quantized_values = np.arange(1 << bits_per_channel, dtype=np.uint32)
+    channel_values = ((quantized_values << shift) + ((1 << shift) >> 1)).astype(np.uint8)
+
+    # Every possible (quantized) BGR color as a single column image
+    b, g, r = np.meshgrid(channel_values, channel_values, channel_values, indexing="ij")
+    bgr_colors = np.stack([b.ravel(), g.ravel(), r.ravel()], axis=1).reshape(-1, 1, 3)
+    hsv_colors = cv2.cvtColor(bgr_colors, cv2.COLOR_BGR2HSV)
+    qb, qg, qr = np.meshgrid(quantized_values, quantized_values, quantized_values, indexing="ij")
+    indices = (qb | (qg << 8) | (qr << 16)).ravel()
+
+    lut = np.zeros(_channel_mask(bits_per_channel) + 1, dtype=np.uint8)
+    for label, color_class in reversed(list(enumerate(color_classes))):
+        # Iterating backwards, so the first matching class overwrites the others
+        lut[indices[threshold_hsv(hsv_colors, color_class).ravel() > 0]] = label + 1
+    return lut
+
+
+def _lut_cache_path(cache_dir: str, color_classes: List[ColorClass], bits_per_channel: int) -> str:
+    key = repr((bits_per_channel, [c.hsv_ranges for c in color_classes])).encode("utf-8")
+    return os.path.join(cache_dir, "color_lut_{0}.npy".format(hashlib.sha1(key).hexdigest()))
+
+
+class LUTSegmenter(object):
+    """
+    Segments the color classes directly from the BGR frame with a precomputed lookup table, so there is
+    no intermediate HSV image. The label of a pixel is a single gather from the table, so the cost does not
+    depend on the number of color classes and ranges.
+    A pixel can belong only to one class: when the ranges of the classes overlap, the first class wins.
+    Like HSVSegmenter, the returned masks are overwritten by the next call
+    """
+
+    def __init__(self, color_classes: List[ColorClass], kernel: np.ndarray = None, bits_per_channel: int = 8,
+                 cache_dir: str = None):
+        """
+        :param color_classes: color classes
+        :param kernel: structuring element for the morphological closing of the masks
+        :param bits_per_channel: number of bits of a channel in the table index. 8 means exact results
+        (16 MB table), less bits means a smaller but approximate table (e.g. 6 bits: 4 MB, 4 bits: 1 MB)
+        :param cache_dir: directory where the compiled tables are cached (keyed by the ranges), None means no cache
+        """
+
+        if not 1 <= bits_per_channel <= 8:
+            raise ValueError("bits_per_channel should be in [1, 8]")
+        if len(color_classes) > 254:
+            raise ValueError("The lookup table supports at most 254 color classes")
+
+        self._color_classes = list(color_classes)
+        self._kernel = kernel
+        self._bits_per_channel = bits_per_channel
+        self._lut = self._load_lut(cache_dir)
+
+        self._channel_mask = _channel_mask(bits_per_channel)
+        self._bgra = None
+        self._index = None
+        self._labels = None
+        self._buffers = None
+        self._stage_timer = None
+
+    @property
+    def color_classes(self) -> List[ColorClass]:
+        return self._color_classes
+
+    def set_stage_timer(self, stage_timer):
+        """
+        :param stage_timer: Instrumentation which gets the time of the "threshold" and "morphology" stages,
+        None means no measurement
+        """
+
+        self._stage_timer = stage_timer
+
+    @property
+    def lut(self) -> np.ndarray:
+        return self._lut
+
+    def _load_lut(self, cache_dir: str) -> np.ndarray:
+        if cache_dir is None:
+            return build_label_lut(self._color_classes, self._bits_per_channel)
+
+        cache_path = _lut_cache_path(cache_dir, self._color_classes, self._bits_per_channel)
+        if os.path.isfile(cache_path):
+            return np.load(cache_path)
+
+        lut = build_label_lut(self._color_classes, self._bits_per_channel)
+        os.makedirs(cache_dir, exist_ok=True)
+        # Writing to a temporary file first, so a concurrent reader never sees a partial table
+        tmp_path = "{0}.{1}.tmp.npy".format(cache_path[:-4], os.getpid())
+        np.save(tmp_path, lut)
+        os.replace(tmp_path, cache_path)
+        return lut
+
+    def label_image(self, image: np.ndarray) -> np.ndarray:
+        """
+        :param image: BGR image
+        :return: label image, 0 is the background and i + 1 is the i-th color class.
+        The returned buffer is reused by the next call
+        """
+
+        h, w = image.shape[:2]
+        if self._labels is None or len(self._labels) < h * w:
+            # Flat buffers for the largest image so far, every smaller image gets contiguous views of them
+            self._bgra = np.empty((h * w, 4), dtype=np.uint8)
+            # np.take converts any other index type to intp, which would be a new array at every call
+            self._index = np.empty(h * w, dtype=np.intp)
+            self._labels = np.empty(h * w, dtype=np.uint8)
+        bgra = self._bgra[:h * w].reshape(h, w, 4)
+        index, labels = self._index[:h * w].reshape(h, w), self._labels[:h * w].reshape(h, w)
+
+        # With the alpha channel every pixel is a single 32 bit word, so the packed index needs only
+        # a shift and a mask instead of arithmetic on the separate channels
+        cv2.cvtColor(image, cv2.COLOR_BGR2BGRA, dst=bgra)
+        packed = bgra.view(np.dtype("<u4")).reshape(h, w)
+        shift = 8 - self._bits_per_channel
+        if shift > 0:
+            np.right_shift(packed, shift, out=index)
+            np.bitwise_and(index, self._channel_mask, out=index)
+        else:
+            np.bitwise_and(packed, self._channel_mask, out=index)
+        # The indices are always in range, "clip" mode writes directly into the output without a temporary copy
+        np.take(self._lut, index, out=labels, mode="clip")
+        return labels
+
+    def segment(self, image: np.ndarray) -> List[np.ndarray]:
+        """
+        :param image: BGR image
+        :return: binary mask for every color class
+        """
+
+        timer = self._stage_timer
+        start_time = time.perf_counter() if timer is not None else 0.0
+        labels = self.label_image(image)
+        buffers = self._buffers = _MaskBuffers.get(self._buffers, labels.shape[0], labels.shape[1],
+                                                   len(self._color_classes))
+
+        for label, mask in enumerate(buffers.masks):
+            threshold_mask = mask if self._kernel is None else buffers.threshold
+            cv2.compare(labels, label + 1, cv2.CMP_EQ, dst=threshold_mask)
+            if timer is not None:
+                start_time = timer.lap("threshold", start_time)
+            _close_mask(mask, self._kernel, buffers)
+            if timer is not None:
+                start_time = timer.lap("morphology", start_time)
+        return list(buffers.masks)
+
+    def copy(self) -> "LUTSegmenter":
+        """
+        :return: segmenter which shares the lookup table but has its own buffers (e.g. for another thread)
+        """
+
+        segmenter = copy.copy(self)
+        segmenter._bgra = segmenter._index = segmenter._labels = segmenter._buffers = None
+        segmenter._stage_timer = None
+        return segmenter
+
+
+SEGMENTATION_BACKENDS = ("hsv", "lut")
+
+
+def create_segmenter(backend: str, color_classes: List[ColorClass], kernel: np.ndarray = None,
+                     lut_bits_per_channel: int = 8, lut_cache_dir: str = None):
+    if backend == "hsv":
+        return HSVSegmenter(color_classes, kernel)
+    if backend == "lut":
+        return LUTSegmenter(color_classes, kernel, lut_bits_per_channel, lut_cache_dir)
+    raise ValueError("Unknown segmentation backend: {0}, use one of {1}".format(backend, SEGMENTATION_BACKENDS))
@@ -0,0 +1,194 @@
+import concurrent.futures
+from typing import Callable, List, Tuple
+
+import cv2
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from color_tracker.utils import detection
+
+Strip = Tuple[int, int]
+
+
+def split_into_strips(height: int, nb_of_strips: int) -> List[Strip]:
+    """
+    Splits the rows of an image into horizontal strips. The strips start at even rows, so they are aligned
+    with the 2x2 blocks of the OpenCV connected components labeling
+    :param height: height of the image
+    :param nb_of_strips: number of strips
+    :return: list of (start row, end row) pairs
+    """
+
+    nb_of_strips = max(1, min(nb_of_strips, height // 2))
+    starts = [2 * (i * height // (2 * nb_of_strips)) for i in range(nb_of_strips)]
+    return [(start, end) for start, end in zip(starts, starts[1:] + [height]) if end > start]
+
+
+def _segment_strip(get_segmenter: Callable, image: np.ndarray, strip: Strip, padding: int,
+                   roi_mask: np.ndarray) -> List[np.ndarray]:
+    # The strip is segmented with padding, so the morphology gives the same core rows as on the full image
+    start, end = strip
+    padded_start, padded_end = max(start - padding, 0), min(end + padding, image.shape[0])
+    masks = get_segmenter().segment(image[padded_start:padded_end])
+    core_masks = [mask[start - padded_start:end - padded_start] for mask in masks]
+    if roi_mask is not None:
+        for mask in core_masks:
+            cv2.bitwise_and(mask, roi_mask[start:end], dst=mask)
+    return core_masks
+
+
+def _label_strip(get_segmenter: Callable, image: np.ndarray, strip: Strip, padding: int, roi_mask: np.ndarray,
+                 labels: List[np.ndarray]):
+    start, end = strip
+    # Labels of the previous strips are below the index of the first pixel of this strip
+    label_offset = start * image.shape[1]
+    components = []
+    for mask, class_labels in zip(_segment_strip(get_segmenter, image, strip, padding, roi_mask), labels):
+        strip_labels = class_labels[start:end]
+        nb_of_labels, _, stats, centroids = cv2.connectedComponentsWithStats(mask, labels=strip_labels,
+                                                                             connectivity=8, ltype=cv2.CV_32S)
+        np.add(strip_labels, label_offset, out=strip_labels, where=strip_labels > 0)
+        stats = stats[1:].astype(np.int64)
+        stats[:, cv2.CC_STAT_TOP] += start
+        centroids = centroids[1:] + (0, start)
+        components.append((stats, centroids, label_offset))
+    return components
+
+
+def _seam_pairs(labels: np.ndarray, row: int) -> Tuple[np.ndarray, np.ndarray]:
+    # 8-connected foreground pixel pairs between the last row of a strip and the first row of the next one
+    upper, lower = labels[row - 1], labels[row]
+    width = len(upper)
+    upper_labels, lower_labels = [], []
+    for shift in (-1, 0, 1):
+        a = upper[max(0, -shift):width - max(0, shift)]
+        b = lower[max(0, shift):width - max(0, -shift)]
+        connected = (a > 0) & (b > 0)
+        upper_labels.append(a[connected])
+        lower_labels.append(b[connected])
+    return np.concatenate(upper_labels), np.concatenate(lower_labels)
+
+
+def merge_strip_components(strips: List[Strip], components: list, labels: np.ndarray, min_area: float = 0,
+                           max_area: float = np.inf, max_nb_of_objects: int = None) -> detection.Detections:
+    """
+    Merges the connected components of the strips which touch each other at the seams (union find with a
+    graph connected components pass). The areas, bboxes and centers are the same as the ones of
+    detect_connected_components on the full mask
+    :param strips: (start row, end row) of the strips
+    :param components: (stats, centroids, label offset) of every strip
+    :param labels: full label image, the labels of every strip are shifted with the label offset of the strip
+    :param min_area: objects with smaller or equal area are dropped
+    :param max_area: objects with larger or equal area are dropped
+    :param max_nb_of_objects: keep only this many objects with the largest area. None means no limit
+    :return: detections
+    """
+
+    stats = np.concatenate([c[0] for c in components])
+    centroids = np.concatenate([c[1] for c in components])
+    nb_of_nodes = len(stats)
+    if nb_of_nodes == 0:
+        return detection.Detections.empty()
+
+    # Node index of the first component of every strip
+    node_offsets = np.cumsum([0] + [len(c[0]) for c in components])
+    label_offsets = np.array([c[2] for c in components], dtype=np.int64)
+    label_ids = np.concatenate([np.arange(1, len(c[0]) + 1) + c[2] for c in components])
+
+    edges_a, edges_b = [], []
+    for i in range(1, len(strips)):
+        upper_labels, lower_labels = _seam_pairs(labels, strips[i][0])
+        edges_a.append(upper_labels - label_offsets[i - 1] - 1 + node_offsets[i - 1])
+        edges_b.append(lower_labels - label_offsets[i] - 1 + node_offsets[i])
+    edges_a = np.concatenate(edges_a) if edges_a else np.zeros(0, dtype=np.int64)
+    edges_b = np.concatenate(edges_b) if edges_b else np.zeros(0, dtype=np.int64)
+    graph = sparse.coo_matrix((np.ones(len(edges_a), dtype=np.int8), (edges_a, edges_b)),
+                              shape=(nb_of_nodes, nb_of_nodes))
+    nb_of_objects, node_objects = csgraph.connected_components(graph, directed=False)
+
+    areas = stats[:, cv2.CC_STAT_AREA]
+    # The pixel coordinate sums are integers, so the merged centroids are computed exactly like OpenCV does
+    sum_x = np.round(centroids[:, 0] * areas)
+    sum_y = np.round(centroids[:, 1] * areas)
+    object_areas = np.bincount(node_objects, weights=areas, minlength=nb_of_objects)
+    object_sum_x = np.bincount(node_objects, weights=sum_x, minlength=nb_of_objects)
+    object_sum_y = np.bincount(node_objects, weights=sum_y, minlength=nb_of_objects)
+
+    x1 = np.full(nb_of_objects, np.iinfo(np.int64).max)
+    y1 = np.full(nb_of_objects, np.iinfo(np.int64).max)
+    x2 = np.full(nb_of_objects, -1, dtype=np.int64)
+    y2 = np.full(nb_of_objects, -1, dtype=np.int64)
+    np.minimum.at(x1, node_objects, stats[:, cv2.CC_STAT_LEFT])
+    np.minimum.at(y1, node_objects, stats[:, cv2.CC_STAT_TOP])
+    np.maximum.at(x2, node_objects, stats[:, cv2.CC_STAT_LEFT] + stats[:, cv2.CC_STAT_WIDTH])
+    np.maximum.at(y2, node_objects, stats[:, cv2.CC_STAT_TOP] + stats[:, cv2.CC_STAT_HEIGHT])
+
+    # Objects are ordered by their first node, which is the label order of the full image
+    first_nodes = np.full(nb_of_objects, nb_of_nodes)
+    np.minimum.at(first_nodes, node_objects, np.arange(nb_of_nodes))
+    object_order = np.argsort(first_nodes, kind="stable")
+    object_areas = object_areas[object_order]
+
+    order = detection._select_by_area(object_areas, min_area, max_area, max_nb_of_objects)
+    selected = object_order[order]
+    centers = np.stack([object_sum_x[selected] / object_areas[order],
+                        object_sum_y[selected] / object_areas[order]], axis=1).astype(np.int32)
+    bboxes = np.stack([x1[selected], y1[selected], x2[selected], y2[selected]], axis=1).astype(np.int32)
+    # The label ids of every node of an object, the contour is extracted from all of them
+    nodes_by_object = np.argsort(node_objects, kind="stable")
+    node_ranges = np.concatenate(([0], np.cumsum(np.bincount(node_objects, minlength=nb_of_objects))))
+    object_label_ids = []
+    for i in selected:
+        ids = label_ids[nodes_by_object[node_ranges[i]:node_ranges[i + 1]]]
+        object_label_ids.append(ids[0] if len(ids) == 1 else ids)
+    return detection.Detections(centers, bboxes, object_areas[order], labels=labels, label_ids=object_label_ids)
+
+
+def detect_objects_in_strips(get_segmenter: Callable, image: np.ndarray, executor: concurrent.futures.Executor,
+                             nb_of_strips: int, nb_of_classes: int, padding: int = 0, roi_mask: np.ndarray = None,
+                             backend: str = "connected_components", min_area: float = 0, max_area: float = np.inf,
+                             max_nb_of_objects: int = None) -> List[detection.Detections]:
+    """
+    Segments the image in horizontal strips in parallel and detects the objects on them. The results are the same
+    as the segmentation and detection of the full image
+    :param get_segmenter: returns the segmenter of the calling thread (the segmenters reuse their buffers)
+    :param image: BGR image
+    :param executor: the strips are processed on this executor
+    :param nb_of_strips: number of horizontal strips
+    :param nb_of_classes: number of color classes of the segmenter
+    :param padding: the strips are segmented with this much padding, it should be at least the size of the
+    morphology kernel
+    :param roi_mask: mask of the region of interest with the size of the image
+    :param backend: with "connected_components" the strips are also labeled in parallel and the objects which are
+    cut by the seams are merged. With "contours" the strips are segmented in parallel and the contours are
+    extracted from the full mask
+    :param min_area: objects with smaller or equal area are dropped
+    :param max_area: objects with larger or equal area are dropped
+    :param max_nb_of_objects: keep only this many objects with the largest area. None means no limit
+    :return: detections for every color class
+    """
+
+    h, w = image.shape[:2]
+    strips = split_into_strips(h, nb_of_strips)
+
+    if backend == "contours":
+        masks = [np.empty((h, w), dtype=np.uint8) for _ in range(nb_of_classes)]
+
+        def segment_into_masks(strip: Strip):
+            for mask, core_mask in zip(masks, _segment_strip(get_segmenter, image, strip, padding, roi_mask)):
+                mask[strip[0]:strip[1]] = core_mask
+
+        list(executor.map(segment_into_masks, strips))
+        return [detection.detect_contours(mask, min_area, max_area, max_nb_of_objects) for mask in masks]
+
+    if backend != "connected_components":
+        raise ValueError("Unknown detection backend: {0}, use one of {1}".format(backend,
+                                                                                 detection.DETECTION_BACKENDS))
+
+    labels = [np.empty((h, w), dtype=np.int32) for _ in range(nb_of_classes)]
+    strip_components = list(executor.map(lambda strip: _label_strip(get_segmenter, image, strip, padding, roi_mask,
+                                                                     labels), strips))
+    return [merge_strip_components(strips, [components[i] for components in strip_components], labels[i],
+                                   min_area, max_area, max_nb_of_objects)
+            for i in range(nb_of_classes)]
@@ -0,0 +1,235 @@
+import numpy as np
+
+
+class TrackStore(object):
+    """
+    Stores every tracked object in preallocated arrays (struct of arrays layout).
+    The history of the points and timestamps is kept in a ring buffer per track, so per-frame updates,
+    pruning and querying the last positions of all live tracks are single vectorized operations.
+    Slots of the removed tracks are reused by the new ones
+    """
+
+    def __init__(self, max_nb_of_points: int = None, capacity: int = 16):
+        """
+        :param max_nb_of_points: length of the point history of a track. If it is None than the history
+        grows when it is full (so it is unlimited)
+        :param capacity: number of preallocated track slots, it grows when it is full
+        """
+
+        self._bounded_history = max_nb_of_points is not None
+        self._history_length = max(1, max_nb_of_points) if self._bounded_history else 32
+        capacity = max(1, capacity)
+
+        self.ids = np.full(capacity, -1, dtype=np.int64)
+        self.labels = np.zeros(capacity, dtype=np.int32)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.skipped_frames = np.zeros(capacity, dtype=np.int32)
+        self.points = np.zeros((capacity, self._history_length, 2), dtype=np.int32)
+        self.timestamps = np.full((capacity, self._history_length), np.nan, dtype=np.float64)
+        self.heads = np.zeros(capacity, dtype=np.intp)
+        self.lengths = np.zeros(capacity, dtype=np.intp)
+        self.bboxes = np.zeros((capacity, 4), dtype=np.int32)
+        self.has_bbox = np.zeros(capacity, dtype=bool)
+        self.contours = np.empty(capacity, dtype=object)
+
+        self._live_slots = np.zeros(0, dtype=np.intp)
+        self._version = 0
+
+        # Names of the labels (color classes), a label is an index of this
+        self.label_names = ()
+
+    def __len__(self):
+        return len(self._live_slots)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.ids)
+
+    @property
+    def history_length(self) -> int:
+        return self._history_length
+
+    @property
+    def max_nb_of_points(self):
+        """
+        Maximum length of the point history of a track, None means it is unlimited
+        """
+
+        return self._history_length if self._bounded_history else None
+
+    @property
+    def live_slots(self) -> np.ndarray:
+        """
+        Slots of the live tracks in the order of their creation
+        """
+
+        return self._live_slots
+
+    @property
+    def version(self) -> int:
+        """
+        It changes every time when a track is added or removed
+        """
+
+        return self._version
+
+    def _grow_capacity(self):
+        capacity = self.capacity
+        for name in ("ids", "labels", "alive", "skipped_frames", "points", "timestamps", "heads", "lengths",
+                     "bboxes", "has_bbox", "contours"):
+            array = getattr(self, name)
+            grown = np.empty((capacity * 2,) + array.shape[1:], dtype=array.dtype)
+            grown[:capacity] = array
+            setattr(self, name, grown)
+        self.ids[capacity:] = -1
+        self.alive[capacity:] = False
+        self.contours[capacity:] = None
+
+    def _grow_history(self):
+        # Reorder the ring buffers to chronological order, than double their length
+        slots = np.arange(self.capacity)
+        order = (self.heads[:, None] - self.lengths[:, None] + np.arange(self._history_length)[None, :]) \
+            % self._history_length
+        points = np.zeros((self.capacity, self._history_length * 2, 2), dtype=np.int32)
+        timestamps = np.full((self.capacity, self._history_length * 2), np.nan, dtype=np.float64)
+        points[:, :self._history_length] = self.points[slots[:, None], order]
+        timestamps[:, :self._history_length] = self.timestamps[slots[:, None], order]
+        self.points = points
+        self.timestamps = timestamps
+        self.heads = self.lengths.copy()
+        self._history_length *= 2
+
+    def add(self, track_id: int, point=None, timestamp: float = np.nan, bbox=None, contour=None,
+            label: int = 0) -> int:
+        """
+        Adds a new track
+        :param track_id: id of the new track
+        :param point: first point of the track
+        :param timestamp: timestamp of the first point
+        :param bbox: bounding box of the object
+        :param contour: contour of the object
+        :param label: label (color class) of the object
+        :return: slot of the new track
+        """
+
+        free_slots = np.flatnonzero(~self.alive)
+        if len(free_slots) == 0:
+            self._grow_capacity()
+            free_slots = np.flatnonzero(~self.alive)
+        slot = int(free_slots[0])
+
+        self.ids[slot] = track_id
+        self.labels[slot] = label
+        self.alive[slot] = True
+        self.skipped_frames[slot] = 0
+        self.heads[slot] = 0
+        self.lengths[slot] = 0
+        self.has_bbox[slot] = bbox is not None
+        if bbox is not None:
+            self.bboxes[slot] = bbox
+        self.contours[slot] = contour
+
+        self._live_slots = np.append(self._live_slots, slot)
+        self._version += 1
+
+        if point is not None:
+            self.append_points([slot], [point], [timestamp])
+        return slot
+
+    def append_points(self, slots, points, timestamps=None):
+        """
+        Appends one point to the history of every given track
+        :param slots: (K,) slots of the tracks
+        :param points: (K, 2) new points
+        :param timestamps: (K,) timestamps of the new points
+        """
+
+        slots = np.asarray(slots, dtype=np.intp)
+        if len(slots) == 0:
+            return
+        if not self._bounded_history and np.any(self.lengths[slots] >= self._history_length):
+            self._grow_history()
+
+        heads = self.heads[slots]
+        self.points[slots, heads] = points
+        self.timestamps[slots, heads] = np.nan if timestamps is None else timestamps
+        self.heads[slots] = (heads + 1) % self._history_length
+        self.lengths[slots] = np.minimum(self.lengths[slots] + 1, self._history_length)
+
+    def update(self, slots, points, bboxes, timestamp: float = np.nan):
+        """
+        Refreshes the tracks with their new detections: the point is appended to the history,
+        the bounding box is replaced and the skipped frames counter is reset
+        :param slots: (K,) slots of the tracks
+        :param points: (K, 2) new points
+        :param bboxes: (K, 4) new bounding boxes
+        :param timestamp: timestamp of the new points
+        """
+
+        slots = np.asarray(slots, dtype=np.intp)
+        self.append_points(slots, points, np.full(len(slots), timestamp))
+        self.bboxes[slots] = bboxes
+        self.has_bbox[slots] = True
+        self.skipped_frames[slots] = 0
+
+    def mark_skipped(self, slots):
+        self.skipped_frames[np.asarray(slots, dtype=np.intp)] += 1
+
+    def prune(self, max_skipped_frames: int) -> np.ndarray:
+        """
+        Removes the tracks which skipped too many frames
+        :param max_skipped_frames: tracks with more skipped frames are removed
+        :return: ids of the removed tracks
+        """
+
+        removed = self.skipped_frames[self._live_slots] > max_skipped_frames
+        if not np.any(removed):
+            return np.zeros(0, dtype=np.int64)
+        removed_slots = self._live_slots[removed]
+        self.alive[removed_slots] = False
+        self.contours[removed_slots] = None
+        self._live_slots = self._live_slots[~removed]
+        self._version += 1
+        return self.ids[removed_slots]
+
+    def remove(self, slot: int):
+        self.alive[slot] = False
+        self.contours[slot] = None
+        self._live_slots = self._live_slots[self._live_slots != slot]
+        self._version += 1
+
+    def last_points(self, slots=None) -> np.ndarray:
+        """
+        :param slots: slots of the tracks, by default the live tracks
+        :return: (K, 2) array of the last points
+        """
+
+        slots = self._live_slots if slots is None else np.asarray(slots, dtype=np.intp)
+        return self.points[slots, (self.heads[slots] - 1) % self._history_length]
+
+    def velocities(self, slots=None) -> np.ndarray:
+        """
+        Constant velocity estimation from the last two points of the tracks
+        :param slots: slots of the tracks, by default the live tracks
+        :return: (K, 2) array of the displacements per update, 0 for tracks with a single point
+        """
+
+        slots = self._live_slots if slots is None else np.asarray(slots, dtype=np.intp)
+        last = self.points[slots, (self.heads[slots] - 1) % self._history_length]
+        previous = self.points[slots, (self.heads[slots] - 2) % self._history_length]
+        velocities = last - previous
+        velocities[self.lengths[slots] < 2] = 0
+        return velocities
+
+    def history(self, slot: int) -> np.ndarray:
+        """
+        :param slot: slot of the track
+        :return: (L, 2) array of the stored points of the track in chronological order
+        """
+
+        order = (self.heads[slot] - self.lengths[slot] + np.arange(self.lengths[slot])) % self._history_length
+        return self.points[slot, order]
+
+    def timestamp_history(self, slot: int) -> np.ndarray:
+        order = (self.heads[slot] - self.lengths[slot] + np.arange(self.lengths[slot])) % self._history_length
+        return self.timestamps[slot, order]
@@ -1,50 +1,150 @@
-import collections
+import collections.abc
+
+import numpy as np
+
+from color_tracker.utils.detection import ContourPatch
+from color_tracker.utils.track_store import TrackStore
+
+
+class TrackedPoints(collections.abc.Sequence):
+    """
+    Deque compatible view of the point history of a track (it used to be a collections.deque).
+    The points are stored in the TrackStore, so appending to the view adds a point to the track
+    """
+
+    __slots__ = ("_store", "_slot")
+
+    def __init__(self, store: TrackStore, slot: int):
+        self._store = store
+        self._slot = slot
+
+    @property
+    def maxlen(self):
+        return self._store.max_nb_of_points
+
+    def __len__(self):
+        return int(self._store.lengths[self._slot])
+
+    def __getitem__(self, index):
+        return self._store.history(self._slot)[index]
+
+    def __iter__(self):
+        return iter(self._store.history(self._slot))
+
+    def __array__(self, dtype=None, copy=None):
+        history = self._store.history(self._slot)
+        return history if dtype is None else history.astype(dtype)
+
+    def __repr__(self):
+        return "TrackedPoints({0}, maxlen={1})".format(self._store.history(self._slot).tolist(), self.maxlen)
+
+    def append(self, point):
+        self._store.append_points([self._slot], [point])
+
+    def extend(self, points):
+        for point in points:
+            self.append(point)
 
 
 class TrackedObject:
-    def __init__(self, id: int, max_nb_of_points: int = None):
-        self._id = id
-        self._tracked_points = collections.deque(maxlen=max_nb_of_points)
-        self._skipped_frames = 0
+    """
+    Lightweight view of a single track of a TrackStore.
+    When it is created without a store, it gets its own single track store
+    """
 
-        self._last_object_contour = None
-        self._last_bounding_box = None
+    __slots__ = ("_store", "_slot", "_id")
+
+    def __init__(self, id: int, max_nb_of_points: int = None, store: TrackStore = None, slot: int = None):
+        if store is None:
+            store = TrackStore(max_nb_of_points, capacity=1)
+            slot = store.add(id)
+        self._store = store
+        self._slot = slot
+        self._id = id
 
     @property
     def id(self):
         return self._id
 
+    @property
+    def label(self):
+        """
+        Name of the color class of the object (or the label index when the classes have no names)
+        """
+
+        label = int(self._store.labels[self._slot])
+        if label < len(self._store.label_names):
+            return self._store.label_names[label]
+        return label
+
+    @property
+    def slot(self):
+        return self._slot
+
+    @property
+    def is_alive(self):
+        return bool(self._store.alive[self._slot]) and self._store.ids[self._slot] == self._id
+
     @property
     def skipped_frames(self):
-        return self._skipped_frames
+        return int(self._store.skipped_frames[self._slot])
 
     @skipped_frames.setter
     def skipped_frames(self, value):
-        self._skipped_frames = value
+        self._store.skipped_frames[self._slot] = value
+
+    @property
+    def tracked_points(self) -> TrackedPoints:
+        """
+        Deque compatible view of the stored points in chronological order (append() adds a point to the track)
+        """
+
+        return TrackedPoints(self._store, self._slot)
+
+    @property
+    def point_history(self) -> np.ndarray:
+        """
+        (L, 2) array of the stored points in chronological order. It is a copy
+        """
+
+        return self._store.history(self._slot)
 
     @property
-    def tracked_points(self):
-        return self._tracked_points
+    def timestamps(self):
+        return self._store.timestamp_history(self._slot)
 
     @property
     def last_point(self):
-        return self.tracked_points[-1]
+        if self._store.lengths[self._slot] == 0:
+            raise IndexError("The tracked object has no points")
+        return self._store.last_points([self._slot])[0]
 
     @property
     def last_object_contour(self):
-        return self._last_object_contour
+        contour = self._store.contours[self._slot]
+        if isinstance(contour, ContourPatch):
+            # The contours of the label images are extracted only when they are requested
+            contour = contour.contour()
+            self._store.contours[self._slot] = contour
+        return contour
 
     @last_object_contour.setter
     def last_object_contour(self, value):
-        self._last_object_contour = value
+        self._store.contours[self._slot] = value
 
     @property
     def last_bbox(self):
-        return self._last_bounding_box
+        if not self._store.has_bbox[self._slot]:
+            return None
+        return self._store.bboxes[self._slot].copy()
 
     @last_bbox.setter
     def last_bbox(self, value):
-        self._last_bounding_box = value
+        if value is None:
+            self._store.has_bbox[self._slot] = False
+        else:
+            self._store.bboxes[self._slot] = value
+            self._store.has_bbox[self._slot] = True
 
-    def add_point(self, point):
-        self._tracked_points.append(point)
+    def add_point(self, point, timestamp: float = np.nan):
+        self._store.append_points([self._slot], [point], [timestamp])
@@ -3,6 +3,7 @@ import random
 from typing import Tuple
 
 import cv2
+import numpy as np
 
 from color_tracker.utils.tracker_object import TrackedObject
 
@@ -17,34 +18,68 @@ def random_colors(nb_of_colors: int, brightness: float = 1.0):
     return colors
 
 
-def draw_tracker_points(points, debug_image, color: Tuple[int, int, int] = (255, 255, 255)):
-    for i in range(1, len(points)):
-        if points[i - 1] is None or points[i] is None:
+def _point_runs(points) -> list:
+    # Runs of consecutive points without None (a list of points can have gaps)
+    if isinstance(points, np.ndarray):
+        return [points.reshape(-1, 2)]
+    runs, run = [], []
+    for point in points:
+        if point is None:
+            runs.append(run)
+            run = []
+        else:
+            run.append(point)
+    runs.append(run)
+    return [np.asarray(run, dtype=np.float64).reshape(-1, 2) for run in runs if len(run) > 0]
+
+
+def draw_tracker_points(points, debug_image, color: Tuple[int, int, int] = (255, 255, 255), scale: float = 1.0):
+    """
+    Draws the trajectory: a line between the consecutive points and a rectangle on every point after the first one.
+    Every line and rectangle is drawn with a single cv2.polylines call
+    :param points: (N, 2) array or list of points, a None in the list breaks the trajectory
+    :param debug_image: image to draw on
+    :param color: color of the trajectory
+    :param scale: the points are scaled with this (for a resized debug image)
+    """
+
+    rectangle_offset = 4
+    lines, rectangles = [], []
+    for run in _point_runs(points):
+        if len(run) < 2:
             continue
-        rectangle_offset = 4
-        rectangle_pt1 = tuple(x - rectangle_offset for x in points[i])
-        rectangle_pt2 = tuple(x + rectangle_offset for x in points[i])
-        cv2.rectangle(debug_image, rectangle_pt1, rectangle_pt2, color, 1)
-        cv2.line(debug_image, tuple(points[i - 1]), tuple(points[i]), color, 1)
+        run = np.round(run * scale).astype(np.int32) if scale != 1 else run.astype(np.int32)
+        lines.append(run)
+        centers = run[1:]
+        rectangles.append(np.stack([centers - rectangle_offset,
+                                    centers + (rectangle_offset, -rectangle_offset),
+                                    centers + rectangle_offset,
+                                    centers + (-rectangle_offset, rectangle_offset)], axis=1))
+    if lines:
+        cv2.polylines(debug_image, lines, False, color, 1)
+        cv2.polylines(debug_image, np.concatenate(rectangles), True, color, 1)
     return debug_image
 
 
-def draw_debug_frame_for_object(debug_frame, tracked_object: TrackedObject, color: Tuple[int, int, int] = (255, 255, 255)):
+def draw_debug_frame_for_object(debug_frame, tracked_object: TrackedObject, color: Tuple[int, int, int] = (255, 255, 255),
+                                scale: float = 1.0):
     # contour = tracked_object.last_object_contour
     bbox = tracked_object.last_bbox
-    points = tracked_object.tracked_points
+    points = tracked_object.point_history
 
     # if contour is not None:
     #     cv2.drawContours(debug_frame, [contour], -1, (0, 255, 0), cv2.FILLED)
 
     if bbox is not None:
-        x1, y1, x2, y2 = bbox
+        x1, y1, x2, y2 = (int(round(v * scale)) for v in bbox)
         cv2.rectangle(debug_frame, (x1, y1), (x2, y2), (255, 255, 255), 1)
         cv2.putText(debug_frame, "Id {0}".format(tracked_object.id), (x1, y1 - 5), cv2.FONT_HERSHEY_COMPLEX, 0.5,
                     (255, 255, 255))
 
     if points is not None and len(points) > 0:
-        draw_tracker_points(points, debug_frame, color)
-        cv2.circle(debug_frame, tuple(points[-1]), 3, (0, 0, 255), -1)
+        draw_tracker_points(points, debug_frame, color, scale)
+        last_point = points[-1]
+        cv2.circle(debug_frame, (int(round(last_point[0] * scale)), int(round(last_point[1] * scale))), 3,
+                   (0, 0, 255), -1)
 
     return debug_frame
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import cv2
+import pytest
+
+_REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The package is tested from the source tree, the synthetic scenes are imported the same way as by the benchmarks
+sys.path.insert(0, _REPOSITORY_DIR)
+sys.path.insert(0, os.path.join(_REPOSITORY_DIR, "benchmarks"))
+
+import synthetic  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def scene() -> synthetic.SyntheticScene:
+    return synthetic.SyntheticScene(nb_of_objects=8, resolution=(320, 240), speed=5.0, radius=10,
+                                    nb_of_occluders=2, noise=4.0, seed=3)
+
+
+@pytest.fixture(scope="session")
+def scene_video(tmp_path_factory, scene) -> str:
+    """
+    Path of a video of the synthetic scene
+    """
+
+    video_path = str(tmp_path_factory.mktemp("videos") / "scene.avi")
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"MJPG"), 30, scene.resolution)
+    for frame in scene.frames(90):
+        writer.write(frame.image)
+    writer.release()
+    return video_path
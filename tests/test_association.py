@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import color_tracker
+from color_tracker.utils import association, helpers
+
+
+def _dense_assignment(track_points: np.ndarray, detection_points: np.ndarray, max_distance: float) -> np.ndarray:
+    # The "dense" association of the tracker: full cost matrix, then the too far pairs are unmatched
+    cost_mtx = helpers.calculate_distance_mtx_from_points(track_points, detection_points)
+    assignment = np.full(len(track_points), -1, dtype=np.intp)
+    if cost_mtx.size > 0:
+        assignment[:] = helpers.solve_assignment(cost_mtx)
+    matched = assignment != -1
+    too_far = cost_mtx[matched, assignment[matched]] > max_distance
+    assignment[np.flatnonzero(matched)[too_far]] = -1
+    return assignment
+
+
+def _total_cost(track_points, detection_points, assignment) -> float:
+    matched = assignment != -1
+    return float(np.linalg.norm(track_points[matched] - detection_points[assignment[matched]], axis=1).sum())
+
+
+@pytest.mark.parametrize("max_dense_cluster_size", [64, 2])
+@pytest.mark.parametrize("seed", range(20))
+def test_gated_assignment_matches_dense(seed, max_dense_cluster_size):
+    rng = np.random.default_rng(seed)
+    nb_tracks, nb_detections = rng.integers(0, 40, size=2)
+    # Tracks which moved a little, some of them are not detected and some detections are new
+    track_points = rng.uniform(0, 1000, (nb_tracks, 2))
+    nb_moved = min(nb_tracks, nb_detections)
+    moved_points = track_points[:nb_moved] + rng.normal(0, 5, (nb_moved, 2))
+    new_points = rng.uniform(0, 1000, (nb_detections - nb_moved, 2))
+    detection_points = np.concatenate([moved_points, new_points])[rng.permutation(nb_detections)]
+    max_distance = 30.0
+
+    dense = _dense_assignment(track_points, detection_points, max_distance)
+    gated = np.asarray(association.solve_gated_assignment(track_points, detection_points, max_distance,
+                                                          max_dense_cluster_size), dtype=np.intp)
+
+    # The gated solution is optimal among the pairs within the max distance, ties can be broken differently
+    # so the number of matches and their cost are compared
+    assert np.count_nonzero(gated != -1) == np.count_nonzero(dense != -1)
+    assert _total_cost(track_points, detection_points, gated) == \
+        pytest.approx(_total_cost(track_points, detection_points, dense))
+    matched = gated != -1
+    assert np.all(np.linalg.norm(track_points[matched] - detection_points[gated[matched]], axis=1) <= max_distance)
+    assert len(np.unique(gated[matched])) == np.count_nonzero(matched)
+
+
+def test_gated_assignment_without_candidates():
+    assert association.solve_gated_assignment(np.zeros((3, 2)), np.zeros((0, 2)), 10) == [-1, -1, -1]
+    assert association.solve_gated_assignment(np.zeros((0, 2)), np.zeros((2, 2)), 10) == []
+    assert association.solve_gated_assignment([[0, 0]], [[100, 100]], 10) == [-1]
+
+
+def _track_scene(scene, association_method: str):
+    tracker = color_tracker.ColorTracker(max_nb_of_points=10, debug=False, association=association_method)
+    tracker.set_tracking_parameters(scene.hsv_lower_value, scene.hsv_upper_value,
+                                    min_contour_area=scene.min_contour_area, max_track_point_distance=30,
+                                    max_skipped_frames=5)
+    return [[(track.id, track.point, track.bbox) for track in tracker.update(frame.image, frame.timestamp).tracks]
+            for frame in scene.frames(60)]
+
+
+def test_gated_tracking_matches_dense(scene):
+    assert _track_scene(scene, "gated") == _track_scene(scene, "dense")
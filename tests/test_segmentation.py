@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from color_tracker.utils import segmentation
+
+# Red wraps around the hue range, so it is split into two ranges
+COLOR_CLASSES = {"red": [([170, 100, 100], [8, 255, 255])],
+                 "green": [([50, 100, 100], [70, 255, 255])],
+                 "blue": [([100, 80, 50], [130, 255, 255]), ([135, 200, 200], [140, 255, 255])]}
+
+
+@pytest.fixture(scope="module")
+def lut_cache_dir(tmp_path_factory) -> str:
+    # The tables are compiled once for the module
+    return str(tmp_path_factory.mktemp("luts"))
+
+
+def _random_image(seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("kernel", [None, np.ones((3, 3), dtype=np.uint8), np.ones((2, 5), dtype=np.uint8)])
+@pytest.mark.parametrize("seed", range(3))
+def test_lut_segmentation_matches_hsv(seed, kernel, lut_cache_dir):
+    color_classes = segmentation.create_color_classes(COLOR_CLASSES)
+    image = _random_image(seed)
+    hsv_masks = segmentation.HSVSegmenter(color_classes, kernel).segment(image)
+    lut_masks = segmentation.LUTSegmenter(color_classes, kernel, cache_dir=lut_cache_dir).segment(image)
+    assert len(lut_masks) == len(hsv_masks)
+    for lut_mask, hsv_mask in zip(lut_masks, hsv_masks):
+        np.testing.assert_array_equal(lut_mask, hsv_mask)
+
+
+def test_lut_segmentation_matches_hsv_on_scene(scene, lut_cache_dir):
+    color_classes = segmentation.create_color_classes({"blob": [(scene.hsv_lower_value, scene.hsv_upper_value)]})
+    kernel = np.ones((3, 3), dtype=np.uint8)
+    hsv_segmenter = segmentation.HSVSegmenter(color_classes, kernel)
+    lut_segmenter = segmentation.LUTSegmenter(color_classes, kernel, cache_dir=lut_cache_dir)
+    for frame in scene.frames(10):
+        np.testing.assert_array_equal(lut_segmenter.segment(frame.image)[0], hsv_segmenter.segment(frame.image)[0])
+
+
+def test_lut_segmentation_first_overlapping_class_wins(lut_cache_dir):
+    color_classes = segmentation.create_color_classes({"wide": [([40, 50, 50], [80, 255, 255])],
+                                                       "narrow": [([50, 100, 100], [70, 255, 255])]})
+    image = _random_image(7)
+    wide_mask, narrow_mask = segmentation.HSVSegmenter(color_classes).segment(image)
+    wide_mask, narrow_mask = wide_mask.copy(), narrow_mask.copy()
+    lut_masks = segmentation.LUTSegmenter(color_classes, cache_dir=lut_cache_dir).segment(image)
+    np.testing.assert_array_equal(lut_masks[0], wide_mask)
+    np.testing.assert_array_equal(lut_masks[1], narrow_mask & ~wide_mask)
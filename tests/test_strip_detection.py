@@ -0,0 +1,83 @@
+import concurrent.futures
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from color_tracker.utils import detection, segmentation, strip_detection
+
+COLOR_CLASSES = {"red": [([170, 100, 100], [8, 255, 255])], "green": [([50, 100, 100], [70, 255, 255])]}
+
+
+@pytest.fixture(scope="module")
+def executor():
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        yield executor
+
+
+def _draw_scene(seed: int, h: int = 360, w: int = 480) -> np.ndarray:
+    # Blobs and thin diagonal lines, so many objects are cut by the seams of the strips
+    rng = np.random.default_rng(seed)
+    image = np.zeros((h, w, 3), dtype=np.uint8)
+    for _ in range(rng.integers(10, 60)):
+        color = (0, 0, 255) if rng.random() < 0.5 else (0, 255, 0)
+        if rng.random() < 0.5:
+            cv2.circle(image, (int(rng.integers(w)), int(rng.integers(h))), int(rng.integers(1, 40)), color, -1)
+        else:
+            cv2.line(image, (int(rng.integers(w)), int(rng.integers(h))), (int(rng.integers(w)), int(rng.integers(h))),
+                     color, int(rng.integers(1, 4)))
+    image[rng.random((h, w)) < 0.002] = (0, 0, 255)
+    return image
+
+
+def _segmenter_getter(color_classes, kernel):
+    # Every thread of the executor gets its own segmenter
+    local = threading.local()
+
+    def get_segmenter():
+        if not hasattr(local, "segmenter"):
+            local.segmenter = segmentation.HSVSegmenter(color_classes, kernel)
+        return local.segmenter
+
+    return get_segmenter
+
+
+@pytest.mark.parametrize("backend", detection.DETECTION_BACKENDS)
+@pytest.mark.parametrize("seed", range(6))
+def test_strip_detection_matches_full_frame(executor, backend, seed):
+    rng = np.random.default_rng(seed)
+    color_classes = segmentation.create_color_classes(COLOR_CLASSES)
+    kernel = None if seed % 3 == 0 else np.ones((int(rng.integers(2, 6)), int(rng.integers(2, 6))), dtype=np.uint8)
+    image = _draw_scene(seed)
+    h, w = image.shape[:2]
+    roi_mask = None
+    if seed % 2 == 1:
+        roi_mask = np.zeros((h, w), dtype=np.uint8)
+        cv2.fillPoly(roi_mask, [np.array([[20, 10], [460, 40], [400, 350], [10, 330]])], 255)
+    max_nb_of_objects = (None, 5, 50)[seed % 3]
+
+    masks = segmentation.HSVSegmenter(color_classes, kernel).segment(image)
+    if roi_mask is not None:
+        masks = [cv2.bitwise_and(mask, roi_mask) for mask in masks]
+    expected = [detection.detect_objects(mask, backend, min_area=3, max_nb_of_objects=max_nb_of_objects)
+                for mask in masks]
+
+    padding = 0 if kernel is None else max(kernel.shape)
+    for nb_of_strips in (2, 3, 7):
+        detections = strip_detection.detect_objects_in_strips(_segmenter_getter(color_classes, kernel), image,
+                                                               executor, nb_of_strips, len(color_classes), padding,
+                                                               roi_mask, backend, min_area=3,
+                                                               max_nb_of_objects=max_nb_of_objects)
+        assert len(detections) == len(expected)
+        for result, reference in zip(detections, expected):
+            np.testing.assert_array_equal(result.centers, reference.centers)
+            np.testing.assert_array_equal(result.bboxes, reference.bboxes)
+            np.testing.assert_array_equal(result.areas, reference.areas)
+
+
+def test_split_into_strips():
+    assert strip_detection.split_into_strips(10, 3) == [(0, 2), (2, 6), (6, 10)]
+    assert strip_detection.split_into_strips(5, 8) == [(0, 2), (2, 5)]
+    for start, _ in strip_detection.split_into_strips(1081, 7):
+        assert start % 2 == 0
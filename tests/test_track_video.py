@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+import color_tracker
+
+
+def _comparable(result):
+    # The timings differ between the runs
+    return (result.frame_index, result.timestamp, result.tracks, result.bboxes.tolist(), result.centers.tolist(),
+            result.labels, result.processed_pixels)
+
+
+def _track_video(video_path: str, scene, nb_workers: int, chunk_size: int = 64, **tracker_options):
+    tracker = color_tracker.ColorTracker(max_nb_of_objects=6, max_nb_of_points=10, debug=False, **tracker_options)
+    with tracker:
+        return [_comparable(result) for result in
+                tracker.track_video(video_path, scene.hsv_lower_value, scene.hsv_upper_value,
+                                    min_contour_area=scene.min_contour_area, kernel=np.ones((3, 3), dtype=np.uint8),
+                                    horizontal_flip=True, max_track_point_distance=30, max_skipped_frames=5,
+                                    nb_workers=nb_workers, chunk_size=chunk_size)]
+
+
+@pytest.fixture(scope="module")
+def serial_results(scene_video, scene):
+    return _track_video(scene_video, scene, nb_workers=1)
+
+
+def test_serial_track_video_tracks_every_frame(serial_results):
+    assert [result[0] for result in serial_results] == list(range(90))
+    assert all(len(result[2]) > 0 for result in serial_results)
+
+
+@pytest.mark.parametrize("nb_workers, chunk_size", [(2, 16), (3, 37), (2, 1000)])
+def test_parallel_track_video_matches_serial(scene_video, scene, serial_results, nb_workers, chunk_size):
+    assert _track_video(scene_video, scene, nb_workers, chunk_size) == serial_results
+
+
+def test_parallel_track_video_matches_serial_with_other_backends(scene_video, scene):
+    options = dict(detection_backend="connected_components", segmentation_backend="lut", association="gated")
+    assert _track_video(scene_video, scene, 2, 25, **options) == _track_video(scene_video, scene, 1, **options)